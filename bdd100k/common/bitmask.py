@@ -0,0 +1,112 @@
+"""Decode the instances of BDD100K bitmasks.
+
+The bitmasks are RGBA images, where R is the category id, G holds the
+attributes (truncated, occluded, crowd and ignore from the 4th to the 1st
+bit), and B and A form the instance id. 0 is for the background.
+"""
+
+from typing import NamedTuple
+
+import numpy as np
+
+# B and A channels form 16-bit instance ids
+MAX_INSTANCE_ID = (1 << 16) - 1
+
+
+class DecodedBitmask(NamedTuple):
+    """Instances decoded from a bitmask, sorted by their instance ids.
+
+    `masks` is the compressed id map, where the pixels of the i-th instance
+    are i + 1 and the background is 0. `bboxes` are in COCO format, i.e.,
+    [x, y, width, height].
+    """
+
+    masks: np.ndarray
+    instance_ids: np.ndarray
+    category_ids: np.ndarray
+    attributes: np.ndarray
+    areas: np.ndarray
+    bboxes: np.ndarray
+
+
+def per_instance_values(
+    labels: np.ndarray, values: np.ndarray, areas: np.ndarray
+) -> np.ndarray:
+    """Get the value of each instance, checking it is the same for all.
+
+    The sums of the values and of their squares are accumulated by bincount,
+    so the values of an instance are the same iff their variance is zero.
+    """
+    num = len(areas) + 1
+    values = values.astype(np.float64)
+    sums = np.bincount(labels, weights=values, minlength=num)[1:]
+    square_sums = np.bincount(labels, weights=values ** 2, minlength=num)
+    assert (square_sums[1:] * areas == sums ** 2).all()
+    instance_values: np.ndarray = np.rint(sums / areas).astype(np.int32)
+    return instance_values
+
+
+def per_instance_bounds(
+    labels: np.ndarray, coords: np.ndarray, num: int, size: int
+) -> np.ndarray:
+    """Get the min and max coordinates of each instance along an axis."""
+    counts = np.bincount(labels * size + coords, minlength=(num + 1) * size)
+    occupied = counts.reshape(num + 1, size)[1:] > 0
+    lower = np.argmax(occupied, axis=1)
+    upper = size - 1 - np.argmax(occupied[:, ::-1], axis=1)
+    bounds: np.ndarray = np.stack([lower, upper], axis=1)
+    return bounds
+
+
+def decode_bitmask(bitmask: np.ndarray) -> DecodedBitmask:
+    """Decode all the instances of a bitmask in one pass.
+
+    The instance ids are bounded by 16 bits, so their areas are counted with
+    a single bincount and the id map is compressed with a lookup table
+    instead of sorting the pixels. The categories, attributes and boxes are
+    then reduced per instance over the compressed map.
+    """
+    height, width = bitmask.shape[:2]
+    bitmask = bitmask.astype(np.int32)
+    instance_map = ((bitmask[..., 2] << 8) + bitmask[..., 3]).reshape(-1)
+
+    counts = np.bincount(instance_map, minlength=MAX_INSTANCE_ID + 1)
+    # 0 is for the background
+    instance_ids = np.flatnonzero(counts[1:]).astype(np.int32) + 1
+    areas = counts[instance_ids]
+    lut = np.zeros(MAX_INSTANCE_ID + 1, dtype=np.int32)
+    lut[instance_ids] = np.arange(1, len(instance_ids) + 1, dtype=np.int32)
+    masks = lut[instance_map]
+
+    # the reductions only go through the foreground pixels
+    pixels = np.flatnonzero(masks)
+    labels = masks[pixels]
+    category_ids = per_instance_values(
+        labels, bitmask[..., 0].reshape(-1)[pixels], areas
+    )
+    attributes = per_instance_values(
+        labels, bitmask[..., 1].reshape(-1)[pixels], areas
+    )
+    x_bounds = per_instance_bounds(
+        labels, pixels % width, len(instance_ids), width
+    )
+    y_bounds = per_instance_bounds(
+        labels, pixels // width, len(instance_ids), height
+    )
+    bboxes = np.stack(
+        [
+            x_bounds[:, 0],
+            y_bounds[:, 0],
+            x_bounds[:, 1] - x_bounds[:, 0] + 1,
+            y_bounds[:, 1] - y_bounds[:, 0] + 1,
+        ],
+        axis=1,
+    )
+    return DecodedBitmask(
+        masks=masks.reshape(height, width),
+        instance_ids=instance_ids,
+        category_ids=category_ids,
+        attributes=attributes,
+        areas=areas,
+        bboxes=bboxes,
+    )
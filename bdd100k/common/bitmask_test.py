@@ -0,0 +1,46 @@
+"""Test cases for bitmask.py."""
+import unittest
+
+import numpy as np
+
+from .bitmask import decode_bitmask
+
+
+class TestDecodeBitmask(unittest.TestCase):
+    """Test cases for decoding the instances of bitmasks."""
+
+    def test_decode_bitmask(self) -> None:
+        """Check the instances are decoded in the order of their ids."""
+        bitmask = np.zeros((6, 8, 4), dtype=np.uint8)
+        bitmask[1:3, 2:6] = [3, 4, 1, 44]
+        bitmask[4:6, 0:1] = [5, 1, 0, 2]
+        decoded = decode_bitmask(bitmask)
+
+        self.assertEqual(decoded.instance_ids.tolist(), [2, 300])
+        self.assertEqual(decoded.category_ids.tolist(), [5, 3])
+        self.assertEqual(decoded.attributes.tolist(), [1, 4])
+        self.assertEqual(decoded.areas.tolist(), [2, 8])
+        self.assertEqual(decoded.bboxes.tolist(), [[0, 4, 1, 2], [2, 1, 4, 2]])
+        gt_masks = np.zeros((6, 8), dtype=np.int32)
+        gt_masks[1:3, 2:6] = 2
+        gt_masks[4:6, 0:1] = 1
+        self.assertTrue((decoded.masks == gt_masks).all())
+
+    def test_empty_bitmask(self) -> None:
+        """Check the bitmasks without instances."""
+        decoded = decode_bitmask(np.zeros((6, 8, 4), dtype=np.uint8))
+        self.assertEqual(len(decoded.instance_ids), 0)
+        self.assertEqual(decoded.bboxes.shape, (0, 4))
+        self.assertTrue((decoded.masks == 0).all())
+
+    def test_inconsistent_instance(self) -> None:
+        """Check an instance must have a single category."""
+        bitmask = np.zeros((6, 8, 4), dtype=np.uint8)
+        bitmask[1:3, 2:6] = [3, 0, 0, 1]
+        bitmask[1, 2, 0] = 4
+        with self.assertRaises(AssertionError):
+            decode_bitmask(bitmask)
+
+
+if __name__ == "__main__":
+    unittest.main()
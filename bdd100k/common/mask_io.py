@@ -0,0 +1,280 @@
+"""Read and write masks/bitmasks in PNG files or sharded archives.
+
+Besides one PNG file per frame, the masks of a folder can be saved in
+archives of `shard_size` frames, with an index file mapping the mask names
+to their shards:
+
+* `npz`: the masks are compressed NumPy arrays in `.npz` files,
+* `rle`: the masks are run-length encoded, where each run is a pixel value
+  with all its channels packed in an integer and a length.
+
+The mask names in the index are the paths of the corresponding PNG files
+relative to the folder, so the readers can load the masks by their PNG
+paths with `load_mask` and list them with `list_masks` in both cases.
+
+The shards whose masks are all superseded by newer shards are removed when
+the index is saved. Saving a folder in another format removes its index and
+its shards, since the readers prefer the index to the PNG files.
+"""
+
+import json
+import os
+import os.path as osp
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from .utils import list_files
+
+MASK_FORMATS = ["png", "npz", "rle"]
+INDEX_NAME = "masks.json"
+SHARD_PREFIX = "shard-"
+SHARD_SIZE = 100
+# same as the default zlib compression of PIL
+COMPRESS_LEVEL = 6
+
+
+def rle_encode(mask: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Run-length encode a mask in row-major order.
+
+    The channels of each pixel are packed in an uint32 value, so an instance
+    is a single run per row no matter its attributes.
+    """
+    mask = mask.reshape(mask.shape[0] * mask.shape[1], -1).astype(np.uint32)
+    packed = np.zeros(mask.shape[0], dtype=np.uint32)
+    for channel in range(mask.shape[1]):
+        packed = (packed << 8) | mask[:, channel]
+    starts = np.flatnonzero(np.diff(packed)) + 1
+    starts = np.concatenate([[0], starts])
+    lengths = np.diff(np.append(starts, len(packed))).astype(np.uint32)
+    return packed[starts], lengths
+
+
+def rle_decode(
+    values: np.ndarray, lengths: np.ndarray, shape: Tuple[int, ...]
+) -> np.ndarray:
+    """Decode a run-length encoded mask."""
+    packed = np.repeat(values, lengths)
+    channels = 1 if len(shape) == 2 else shape[2]
+    mask = np.empty((len(packed), channels), dtype=np.uint8)
+    for channel in reversed(range(channels)):
+        mask[:, channel] = packed & 255
+        packed = packed >> 8
+    return mask.reshape(shape)
+
+
+def save_shard(
+    shard_path: str, masks: List[np.ndarray], mask_format: str
+) -> None:
+    """Save the masks of a shard, indexed by their order."""
+    assert mask_format in MASK_FORMATS[1:]
+    if mask_format == "npz":
+        np.savez_compressed(
+            shard_path, **{str(i): mask for i, mask in enumerate(masks)}
+        )
+        return
+    runs = [rle_encode(mask) for mask in masks]
+    num_runs = [len(values) for values, _ in runs]
+    np.savez(
+        shard_path,
+        values=np.concatenate([values for values, _ in runs]),
+        lengths=np.concatenate([lengths for _, lengths in runs]),
+        offsets=np.cumsum([0] + num_runs),
+        shapes=np.array(
+            [mask.shape + (1,) * (3 - mask.ndim) for mask in masks]
+        ),
+        ndims=np.array([mask.ndim for mask in masks]),
+    )
+
+
+def list_shards(out_base: str) -> List[str]:
+    """List the file names of the shards in a folder."""
+    if not osp.isdir(out_base):
+        return []
+    return sorted(
+        name
+        for name in os.listdir(out_base)
+        if name.startswith(SHARD_PREFIX) and name.endswith(".npz")
+    )
+
+
+def remove_archive(out_base: str) -> None:
+    """Remove the index and the shards of a folder, if any."""
+    index_path = osp.join(out_base, INDEX_NAME)
+    if osp.exists(index_path):
+        os.remove(index_path)
+    for shard in list_shards(out_base):
+        os.remove(osp.join(out_base, shard))
+
+
+class MaskArchive:
+    """Index of the masks saved in the shards of a folder."""
+
+    def __init__(self, out_base: str, mask_format: str) -> None:
+        """Load the index of the folder if it is in the same format."""
+        assert mask_format in MASK_FORMATS[1:]
+        self.out_base = out_base
+        self.mask_format = mask_format
+        self.path = osp.join(out_base, INDEX_NAME)
+        self.masks: Dict[str, Tuple[str, int]] = {}
+        self.num_shards = 0
+        if osp.exists(self.path):
+            with open(self.path, encoding="utf-8") as fp:
+                index = json.load(fp)
+            if index["format"] == mask_format:
+                self.masks = {
+                    name: (shard, key)
+                    for name, (shard, key) in index["masks"].items()
+                }
+                self.num_shards = index["num_shards"]
+            else:
+                # the masks of another format are converted again
+                remove_archive(out_base)
+
+    def key(self, out_path: str) -> str:
+        """The mask name of an output path, relative to the folder."""
+        return osp.relpath(out_path, self.out_base)
+
+    def __contains__(self, out_path: str) -> bool:
+        """Check whether a mask is saved in the shards."""
+        return self.key(out_path) in self.masks
+
+    def next_shard(self) -> str:
+        """Reserve the file name of a new shard."""
+        shard = "{}{:06d}.npz".format(SHARD_PREFIX, self.num_shards)
+        self.num_shards += 1
+        return shard
+
+    def update(self, shard: str, out_paths: List[str]) -> None:
+        """Record the masks saved in a shard, in their order."""
+        for i, out_path in enumerate(out_paths):
+            self.masks[self.key(out_path)] = (shard, i)
+
+    def remove_unused_shards(self) -> None:
+        """Remove the shards whose masks are all superseded."""
+        used = {shard for shard, _ in self.masks.values()}
+        for shard in list_shards(self.out_base):
+            if shard not in used:
+                os.remove(osp.join(self.out_base, shard))
+
+    def save(self) -> None:
+        """Save the index atomically, then remove the unused shards."""
+        os.makedirs(self.out_base, exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as fp:
+            json.dump(
+                dict(
+                    format=self.mask_format,
+                    num_shards=self.num_shards,
+                    masks=self.masks,
+                ),
+                fp,
+                sort_keys=True,
+            )
+        os.replace(tmp_path, self.path)
+        self.remove_unused_shards()
+
+
+def save_mask(
+    out_path: str, mask: np.ndarray, compress_level: int = COMPRESS_LEVEL
+) -> None:
+    """Save a mask/bitmask in a PNG file."""
+    Image.fromarray(mask.squeeze()).save(
+        out_path, compress_level=compress_level
+    )
+
+
+def find_archive(mask_dir: str) -> Optional[str]:
+    """Find the folder whose index contains the masks of a folder."""
+    while True:
+        if osp.isfile(osp.join(mask_dir, INDEX_NAME)):
+            return mask_dir
+        parent = osp.dirname(mask_dir)
+        if parent == mask_dir:
+            return None
+        mask_dir = parent
+
+
+@lru_cache(maxsize=8)
+def load_index_cached(
+    index_path: str, _mtime: int
+) -> Tuple[str, Dict[str, Tuple[str, int]]]:
+    """Load an index, until it is modified.
+
+    `_mtime` is only part of the cache key, so a modified index is reloaded.
+    """
+    with open(index_path, encoding="utf-8") as fp:
+        index = json.load(fp)
+    masks = {
+        name: (shard, key) for name, (shard, key) in index["masks"].items()
+    }
+    return index["format"], masks
+
+
+def load_index(archive_dir: str) -> Tuple[str, Dict[str, Tuple[str, int]]]:
+    """Load the format and the masks of an index."""
+    index_path = osp.join(archive_dir, INDEX_NAME)
+    return load_index_cached(index_path, os.stat(index_path).st_mtime_ns)
+
+
+@lru_cache(maxsize=2)
+def load_rle_shard_cached(
+    shard_path: str, _mtime: int
+) -> Dict[str, np.ndarray]:
+    """Load the runs of a shard, until it is modified.
+
+    `_mtime` is only part of the cache key. The arrays are read before the
+    file is closed, so the cache holds no open file.
+    """
+    with np.load(shard_path) as shard:
+        return {name: shard[name] for name in shard.files}
+
+
+def load_shard_mask(shard_path: str, mask_format: str, i: int) -> np.ndarray:
+    """Load the i-th mask of a shard."""
+    if mask_format == "npz":
+        # only the requested mask is decompressed
+        with np.load(shard_path) as shard:
+            mask: np.ndarray = shard[str(i)]
+        return mask
+    arrays = load_rle_shard_cached(shard_path, os.stat(shard_path).st_mtime_ns)
+    offsets, shape = arrays["offsets"], arrays["shapes"][i]
+    return rle_decode(
+        arrays["values"][offsets[i] : offsets[i + 1]],
+        arrays["lengths"][offsets[i] : offsets[i + 1]],
+        tuple(shape[: arrays["ndims"][i]]),
+    )
+
+
+def load_mask(mask_path: str) -> np.ndarray:
+    """Load a mask/bitmask by its PNG path, from the file or its shard."""
+    if osp.isfile(mask_path):
+        return np.asarray(Image.open(mask_path))
+    mask_path = osp.abspath(mask_path)
+    archive_dir = find_archive(osp.dirname(mask_path))
+    if archive_dir is None:
+        raise FileNotFoundError(mask_path)
+    mask_format, masks = load_index(archive_dir)
+    name = osp.relpath(mask_path, archive_dir)
+    if name not in masks:
+        raise FileNotFoundError(mask_path)
+    shard, i = masks[name]
+    return load_shard_mask(osp.join(archive_dir, shard), mask_format, i)
+
+
+def list_masks(mask_dir: str, with_prefix: bool = False) -> List[str]:
+    """List the PNG paths of the masks/bitmasks in a folder."""
+    archive_dir = find_archive(osp.abspath(mask_dir))
+    if archive_dir is None:
+        return list_files(mask_dir, ".png", with_prefix=with_prefix)
+    prefix = osp.relpath(osp.abspath(mask_dir), archive_dir)
+    prefix = "" if prefix == "." else prefix + os.sep
+    names: Iterable[str] = load_index(archive_dir)[1].keys()
+    names = sorted(
+        name[len(prefix) :] for name in names if name.startswith(prefix)
+    )
+    if with_prefix:
+        names = [osp.join(mask_dir, name) for name in names]
+    return list(names)
@@ -0,0 +1,137 @@
+"""Test cases for mask_io.py."""
+
+import os
+import shutil
+import unittest
+
+import numpy as np
+
+from .mask_io import (
+    MaskArchive,
+    list_masks,
+    list_shards,
+    load_mask,
+    remove_archive,
+    rle_decode,
+    rle_encode,
+    save_mask,
+    save_shard,
+)
+
+
+class TestRLE(unittest.TestCase):
+    """Test cases for the run-length encoding of masks."""
+
+    def test_round_trip(self) -> None:
+        """Check the masks are decoded to the same values."""
+        mask = np.zeros((6, 8, 4), dtype=np.uint8)
+        mask[1:4, 2:5] = [3, 1, 0, 1]
+        mask[4:, :3] = [5, 0, 1, 2]
+        values, lengths = rle_encode(mask)
+        self.assertEqual(lengths.sum(), 48)
+        self.assertEqual(len(values), 11)
+        self.assertTrue(
+            (rle_decode(values, lengths, mask.shape) == mask).all()
+        )
+
+        mask = mask[..., 0]
+        values, lengths = rle_encode(mask)
+        self.assertTrue(
+            (rle_decode(values, lengths, mask.shape) == mask).all()
+        )
+
+
+class TestMaskArchive(unittest.TestCase):
+    """Test cases for reading the masks in PNG files or archives."""
+
+    test_out = "./test_mask_io"
+
+    def test_png(self) -> None:
+        """Check the masks are loaded from the PNG files."""
+        mask = np.arange(20, dtype=np.uint8).reshape(4, 5)
+        os.makedirs(os.path.join(self.test_out, "png", "a"), exist_ok=True)
+        save_mask(os.path.join(self.test_out, "png", "a", "0.png"), mask)
+        self.assertEqual(
+            list_masks(os.path.join(self.test_out, "png")),
+            [os.path.join("a", "0.png")],
+        )
+        loaded = load_mask(os.path.join(self.test_out, "png", "a", "0.png"))
+        self.assertTrue((loaded == mask).all())
+
+    def test_archives(self) -> None:
+        """Check the masks are loaded from the shards by their PNG paths."""
+        masks = [np.full((4, 5, 4), i, dtype=np.uint8) for i in range(3)] + [
+            np.full((2, 3), 7, dtype=np.uint8)
+        ]
+        names = ["a/0.png", "a/1.png", "b/0.png", "b/1.png"]
+        for mask_format in ["npz", "rle"]:
+            out_base = os.path.join(self.test_out, mask_format)
+            archive = MaskArchive(out_base, mask_format)
+            out_paths = [os.path.join(out_base, name) for name in names]
+            for start in [0, 2]:
+                shard = archive.next_shard()
+                os.makedirs(out_base, exist_ok=True)
+                save_shard(
+                    os.path.join(out_base, shard),
+                    masks[start : start + 2],
+                    mask_format,
+                )
+                archive.update(shard, out_paths[start : start + 2])
+            archive.save()
+
+            self.assertEqual(MaskArchive(out_base, mask_format).num_shards, 2)
+            self.assertTrue(out_paths[0] in MaskArchive(out_base, mask_format))
+            self.assertEqual(list_masks(out_base), names)
+            self.assertEqual(
+                list_masks(os.path.join(out_base, "b"), with_prefix=True),
+                out_paths[2:],
+            )
+            for out_path, mask in zip(out_paths, masks):
+                loaded = load_mask(out_path)
+                self.assertEqual(loaded.shape, mask.shape)
+                self.assertTrue((loaded == mask).all())
+            with self.assertRaises(FileNotFoundError):
+                load_mask(os.path.join(out_base, "c.png"))
+
+    def test_stale_shards(self) -> None:
+        """Check the superseded shards and the other formats are removed."""
+        out_base = os.path.join(self.test_out, "stale")
+        os.makedirs(out_base, exist_ok=True)
+        out_paths = [
+            os.path.join(out_base, name) for name in ["0.png", "1.png"]
+        ]
+        masks = [np.full((2, 3), i, dtype=np.uint8) for i in range(4)]
+
+        archive = MaskArchive(out_base, "npz")
+        for start in [0, 2]:
+            shard = archive.next_shard()
+            save_shard(
+                os.path.join(out_base, shard), masks[start : start + 2], "npz"
+            )
+            archive.update(shard, out_paths)
+            archive.save()
+        self.assertEqual(list_shards(out_base), ["shard-000001.npz"])
+        self.assertEqual(load_mask(out_paths[0])[0, 0], 2)
+
+        archive = MaskArchive(out_base, "rle")
+        self.assertEqual(archive.num_shards, 0)
+        self.assertEqual(list_shards(out_base), [])
+        self.assertEqual(list_masks(out_base), [])
+
+        shard = archive.next_shard()
+        save_shard(os.path.join(out_base, shard), masks[:2], "rle")
+        archive.update(shard, out_paths)
+        archive.save()
+        self.assertEqual(load_mask(out_paths[1])[0, 0], 1)
+        remove_archive(out_base)
+        self.assertEqual(os.listdir(out_base), [])
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        """Remove the output folder."""
+        if os.path.exists(cls.test_out):
+            shutil.rmtree(cls.test_out)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,78 @@
+"""Bootstrap confidence intervals of the metrics over a set of images.
+
+The metrics are computed from sums of per-image statistics, so a bootstrap
+replicate is the sum of the stacked statistics weighted by the number of
+times each image is drawn. The replicates are computed in batches, where
+the draws of a batch form an index matrix, turned into the draw counts by
+a single bincount, and the weighted sums of the batch are a single einsum.
+For a stratified sample, the images are drawn within each stratum.
+"""
+
+import warnings
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+NUM_REPLICATES = 1000
+CONFIDENCE = 0.95
+SEED = 0
+# bound of the draws held in memory for a batch of replicates
+BATCH_DRAWS = 1 << 24
+
+
+def bootstrap_sums(
+    stats: np.ndarray,
+    num_replicates: int = NUM_REPLICATES,
+    seed: int = SEED,
+    strata: Optional[List[str]] = None,
+) -> np.ndarray:
+    """Sum the statistics of the images for each bootstrap replicate.
+
+    The statistics are stacked along the first axis, and the sums of the
+    replicates are stacked the same way. If the `strata` of the images are
+    given, each replicate keeps the number of images of each stratum.
+    """
+    num_images = len(stats)
+    flat_stats = stats.reshape(num_images, -1)
+    if strata is None:
+        members = [np.arange(num_images)]
+    else:
+        names, groups = np.unique(
+            np.array(strata, dtype=str), return_inverse=True
+        )
+        members = [np.flatnonzero(groups == i) for i in range(len(names))]
+    rng = np.random.default_rng(seed)
+    batch_size = max(1, BATCH_DRAWS // max(num_images, 1))
+    sums = []
+    for start in range(0, num_replicates, batch_size):
+        size = min(batch_size, num_replicates - start)
+        inds = np.concatenate(
+            [
+                group_inds[
+                    rng.integers(len(group_inds), size=(size, len(group_inds)))
+                ]
+                for group_inds in members
+            ],
+            axis=1,
+        )
+        inds += np.arange(size)[:, None] * num_images
+        counts = np.bincount(
+            inds.reshape(-1), minlength=size * num_images
+        ).reshape(size, num_images)
+        sums.append(np.einsum("rn,nk->rk", counts, flat_stats))
+    return np.concatenate(sums).reshape((num_replicates,) + stats.shape[1:])
+
+
+def confidence_interval(
+    replicates: np.ndarray, confidence: float = CONFIDENCE
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Get the percentile interval of the replicates of the metrics.
+
+    The replicates are along the first axis, and the NaN ones are skipped.
+    """
+    tail = (1 - confidence) / 2 * 100
+    with warnings.catch_warnings():
+        # the metrics undefined in all the replicates stay NaN
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        lower, upper = np.nanpercentile(replicates, [tail, 100 - tail], axis=0)
+    return lower, upper
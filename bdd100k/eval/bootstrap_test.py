@@ -0,0 +1,50 @@
+"""Test cases for bootstrap.py."""
+import unittest
+
+import numpy as np
+
+from . import bootstrap
+from .bootstrap import bootstrap_sums, confidence_interval
+
+
+class TestBootstrap(unittest.TestCase):
+    """Test cases for the bootstrap confidence intervals."""
+
+    def test_bootstrap_sums(self) -> None:
+        """Check the replicates sum the images drawn with replacement."""
+        stats = np.arange(24).reshape(4, 3, 2)
+        sums = bootstrap_sums(stats, 5, seed=1)
+        self.assertEqual(sums.shape, (5, 3, 2))
+        inds = np.random.default_rng(1).integers(4, size=(5, 4))
+        for rep_sum, rep_inds in zip(sums, inds):
+            self.assertTrue(np.array_equal(rep_sum, stats[rep_inds].sum(0)))
+
+    def test_strata(self) -> None:
+        """Check the replicates keep the images of each stratum."""
+        stats = np.array([[1, 0], [1, 0], [0, 1], [0, 1], [0, 1]])
+        sums = bootstrap_sums(stats, 20, strata=["a", "a", "b", "b", "b"])
+        self.assertTrue(np.all(sums == [2, 3]))
+
+    def test_batches(self) -> None:
+        """Check the replicates do not depend on the batch size."""
+        stats = np.random.default_rng(0).random((7, 3))
+        sums = bootstrap_sums(stats, 10)
+        batch_draws = bootstrap.BATCH_DRAWS
+        bootstrap.BATCH_DRAWS = 3 * len(stats)
+        try:
+            self.assertTrue(np.allclose(bootstrap_sums(stats, 10), sums))
+        finally:
+            bootstrap.BATCH_DRAWS = batch_draws
+
+    def test_confidence_interval(self) -> None:
+        """Check the percentile interval skips the NaN replicates."""
+        replicates = np.stack([np.arange(101.0), np.full(101, np.nan)], axis=1)
+        replicates[0, 0] = np.nan
+        lower, upper = confidence_interval(replicates, 0.9)
+        self.assertAlmostEqual(lower[0], 5.95)
+        self.assertAlmostEqual(upper[0], 95.05)
+        self.assertTrue(np.isnan(lower[1]) and np.isnan(upper[1]))
+
+
+if __name__ == "__main__":
+    unittest.main()
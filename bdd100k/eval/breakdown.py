@@ -0,0 +1,70 @@
+"""Per-image breakdown of the evaluation results.
+
+The per-image results of a task are saved as the columns of a `.npz` file,
+i.e., arrays whose first axis is over the images or the rows belonging to
+them, together with the `worst` images of each class by a per-image score,
+where the lower is the worse and NaN is for the images without the class.
+"""
+
+import os
+from typing import List
+
+import numpy as np
+
+from ..common.logger import logger
+
+WORST_K = 10
+
+
+def worst_images(scores: np.ndarray, k: int = WORST_K) -> np.ndarray:
+    """Get the indices of the images with the lowest scores of each class.
+
+    The scores are of shape (images, classes), and the indices are of shape
+    (classes, k), padded with -1 for the classes in fewer than k images.
+    """
+    scores = np.where(np.isnan(scores), np.inf, scores)
+    order = np.argsort(scores, axis=0, kind="stable")[:k].T
+    worst = np.full((scores.shape[1], k), -1, dtype=np.int64)
+    valid = np.isfinite(np.take_along_axis(scores.T, order, axis=1))
+    worst[:, : order.shape[1]] = np.where(valid, order, -1)
+    return worst
+
+
+def save_breakdown(
+    path: str,
+    names: List[str],
+    classes: List[str],
+    scores: np.ndarray,
+    k: int = WORST_K,
+    **columns: np.ndarray,
+) -> np.ndarray:
+    """Save the per-image columns and the k worst images of each class.
+
+    Returns:
+        np.ndarray: the indices of the worst images of each class.
+    """
+    worst = worst_images(scores, k)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = path + ".tmp.npz"
+    np.savez_compressed(
+        tmp_path,
+        names=np.array(names, dtype=str),
+        classes=np.array(classes, dtype=str),
+        scores=scores,
+        worst=worst,
+        **columns,
+    )
+    os.replace(tmp_path, path)
+
+    for c, class_name in enumerate(classes):
+        inds = worst[c][worst[c] >= 0]
+        if len(inds) == 0:
+            continue
+        logger.info(
+            "Worst images of %s: %s",
+            class_name,
+            ", ".join(
+                "{} ({:.3f})".format(names[i], scores[i, c]) for i in inds
+            ),
+        )
+    return worst
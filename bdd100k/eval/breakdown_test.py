@@ -0,0 +1,47 @@
+"""Test cases for breakdown.py."""
+import os
+import shutil
+import unittest
+
+import numpy as np
+
+from .breakdown import save_breakdown, worst_images
+
+
+class TestBreakdown(unittest.TestCase):
+    """Test cases for the per-image breakdown."""
+
+    test_out = "./test_breakdown"
+
+    def test_worst_images(self) -> None:
+        """Check the worst images skip the absent classes."""
+        scores = np.array(
+            [[0.5, np.nan], [0.2, np.nan], [0.9, 0.1], [np.nan, np.nan]]
+        )
+        worst = worst_images(scores, 3)
+        self.assertEqual(worst.tolist(), [[1, 0, 2], [2, -1, -1]])
+        worst = worst_images(scores[:1], 3)
+        self.assertEqual(worst.tolist(), [[0, -1, -1], [-1, -1, -1]])
+
+    def test_save_breakdown(self) -> None:
+        """Check the columns are saved with the worst images."""
+        path = os.path.join(self.test_out, "images.npz")
+        scores = np.array([[0.5, 0.1], [0.2, 0.3]])
+        save_breakdown(
+            path, ["a.png", "b.png"], ["x", "y"], scores, 1, extra=scores * 2
+        )
+        with np.load(path) as breakdown:
+            self.assertEqual(breakdown["names"].tolist(), ["a.png", "b.png"])
+            self.assertEqual(breakdown["classes"].tolist(), ["x", "y"])
+            self.assertEqual(breakdown["worst"].tolist(), [[1], [0]])
+            self.assertTrue(np.allclose(breakdown["extra"], scores * 2))
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        """Remove the saved breakdown."""
+        if os.path.exists(cls.test_out):
+            shutil.rmtree(cls.test_out)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+"""Base of the evaluators taking the results of each image as arrays.
+
+The evaluators are updated image by image with the arrays of the ground
+truth and the predictions, e.g., the outputs of a model during training,
+so no mask has to be written to and read back from the disk. Each update
+is split into the computation of the statistics of the image, which is
+independent across images and may run on a thread pool, and their
+`accumulate` into the state of the evaluator, which always runs in the
+order of the updates.
+
+Each task evaluator defines its `update` with the arrays of an image, which
+submits the computation of their statistics, and implements `accumulate`
+for the statistics and `compute` for the final metrics.
+"""
+
+from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Deque, Generic, Optional, TypeVar
+
+# statistics of an image and the metrics of all the images
+StatsT = TypeVar("StatsT")
+ResultT = TypeVar("ResultT")
+EvaluatorT = TypeVar("EvaluatorT")
+
+
+class ArrayEvaluator(ABC, Generic[StatsT, ResultT]):
+    """Process the updates inline or on a pool of threads."""
+
+    def __init__(self, num_threads: int = 0) -> None:
+        """Start the thread pool if `num_threads` is positive."""
+        self.num_threads = num_threads
+        self.executor: Optional[ThreadPoolExecutor] = (
+            ThreadPoolExecutor(num_threads) if num_threads > 0 else None
+        )
+        self.pending: Deque["Future[StatsT]"] = deque()
+
+    @abstractmethod
+    def accumulate(self, stats: StatsT) -> None:
+        """Add the statistics of an image to the state."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def compute(self) -> ResultT:
+        """Compute the metrics of all the updated images."""
+        raise NotImplementedError
+
+    def submit(self, func: Callable[[], StatsT]) -> None:
+        """Compute the statistics of an image with `func` and add them.
+
+        `func` is bound to the arrays of the image, e.g., by `partial`.
+
+        On the thread pool, the statistics are accumulated once they are
+        computed, and the updates block while twice as many images as
+        threads are pending, to bound the arrays kept in memory.
+        """
+        if self.executor is None:
+            self.accumulate(func())
+            return
+        self.pending.append(self.executor.submit(func))
+        while self.pending and (
+            self.pending[0].done() or len(self.pending) > 2 * self.num_threads
+        ):
+            self.accumulate(self.pending.popleft().result())
+
+    def sync(self) -> None:
+        """Wait for the pending updates and accumulate them."""
+        while self.pending:
+            self.accumulate(self.pending.popleft().result())
+
+    def close(self) -> None:
+        """Accumulate the pending updates and stop the thread pool."""
+        self.sync()
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    def __enter__(self: EvaluatorT) -> EvaluatorT:
+        """Use the evaluator in a context."""
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        """Stop the thread pool when leaving the context."""
+        self.close()
@@ -0,0 +1,51 @@
+"""Test cases for evaluator.py."""
+import time
+import unittest
+from functools import partial
+from typing import List
+
+from .evaluator import ArrayEvaluator
+
+
+class OrderEvaluator(ArrayEvaluator[int, List[int]]):
+    """Record the order of the accumulated statistics."""
+
+    def __init__(self, num_threads: int) -> None:
+        """Initialize the records."""
+        super().__init__(num_threads)
+        self.order: List[int] = []
+
+    def accumulate(self, stats: int) -> None:
+        """Record the statistics."""
+        self.order.append(stats)
+
+    def compute(self) -> List[int]:
+        """Get the recorded order."""
+        return self.order
+
+
+def delayed(value: int) -> int:
+    """Return the value after a delay decreasing with it."""
+    time.sleep((10 - value) * 0.002)
+    return value
+
+
+class TestArrayEvaluator(unittest.TestCase):
+    """Test cases for the updates of the array evaluators."""
+
+    def test_order(self) -> None:
+        """Check the statistics are accumulated in the update order."""
+        for num_threads in [0, 1, 4]:
+            with OrderEvaluator(num_threads) as evaluator:
+                for value in range(10):
+                    evaluator.submit(partial(delayed, value))
+                    # at most twice the threads are pending
+                    self.assertLessEqual(
+                        len(evaluator.pending), 2 * num_threads
+                    )
+            self.assertEqual(evaluator.order, list(range(10)))
+            self.assertIsNone(evaluator.executor)
+
+
+if __name__ == "__main__":
+    unittest.main()
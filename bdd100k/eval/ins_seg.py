@@ -3,58 +3,58 @@
 predictions format: BitMasks
 """
 import copy
+import datetime
 import json
 import os
 import time
+from functools import partial
 from multiprocessing import Pool
-from typing import Dict, List, Tuple
+from typing import Dict, List, NamedTuple, Optional, Tuple
 
 import numpy as np
-from PIL import Image
-from pycocotools.cocoeval import COCOeval  # type: ignore
+from pycocotools.cocoeval import COCOeval, Params  # type: ignore
 from scalabel.common.typing import DictStrAny
 from scalabel.eval.detect import evaluate_workflow
 from scalabel.label.transforms import get_coco_categories
 from scalabel.label.typing import Config
 from tqdm import tqdm
 
-from ..common.utils import list_files
-from .mots import mask_intersection_rate, parse_bitmasks
+from ..common.bitmask import DecodedBitmask, decode_bitmask
+from ..common.mask_io import list_masks, load_mask
+from .breakdown import WORST_K, save_breakdown
+from .evaluator import ArrayEvaluator
+from .mots import mask_intersection_rate
+
+try:
+    from numba import njit  # type: ignore
+except ImportError:
+    njit = None
 
 
 def parse_res_bitmasks(
     ann_score: List[Tuple[int, float]], bitmask: np.ndarray
 ) -> List[np.ndarray]:
-    """Parse information from result bitmasks and compress its value range."""
-    bitmask = bitmask.astype(np.int32)
-    category_map = bitmask[:, :, 0]
-    ann_map = (bitmask[:, :, 2] << 8) + bitmask[:, :, 3]
-
-    ann_ids = []
-    scores = []
-    category_ids = []
+    """Parse information from result bitmasks and compress its value range.
 
-    masks = np.zeros(bitmask.shape[:2], dtype=np.int32)
-    i = 0
+    The annotations are sorted by their scores in descending order, and
+    those missing in the bitmask are skipped.
+    """
+    decoded = decode_bitmask(bitmask)
     ann_score = sorted(ann_score, key=lambda pair: pair[1], reverse=True)
-    for ann_id, score in ann_score:
-        mask_inds_i = ann_map == ann_id
-        if np.count_nonzero(mask_inds_i) == 0:
-            continue
-
-        # 0 is for the background
-        i += 1
-        masks[mask_inds_i] = i
-        ann_ids.append(i)
-        scores.append(score)
+    ann_ids = np.array([ann_id for ann_id, _ in ann_score], dtype=np.int64)
+    scores = np.array([score for _, score in ann_score], dtype=np.float64)
 
-        category_ids_i = np.unique(category_map[mask_inds_i])
-        assert category_ids_i.shape[0] == 1
-        category_ids.append(category_ids_i[0])
+    # position of each annotation among the decoded instances
+    found = np.isin(ann_ids, decoded.instance_ids)
+    inds = np.searchsorted(decoded.instance_ids, ann_ids[found])
+    scores = scores[found]
 
-    ann_ids = np.array(ann_ids)
-    scores = np.array(scores)
-    category_ids = np.array(category_ids)
+    # 0 is for the background and the instances without scores
+    lut = np.zeros(len(decoded.instance_ids) + 1, dtype=np.int32)
+    lut[inds + 1] = np.arange(1, len(inds) + 1, dtype=np.int32)
+    masks = lut[decoded.masks]
+    ann_ids = np.arange(1, len(inds) + 1)
+    category_ids = decoded.category_ids[inds]
 
     return [masks, ann_ids, scores, category_ids]
 
@@ -62,20 +62,500 @@ def parse_res_bitmasks(
 def get_mask_areas(masks: np.ndarray) -> np.ndarray:
     """Get mask areas from the compressed mask map."""
     # 0 for background
-    ann_ids = np.sort(np.unique(masks))[1:]
-    areas = np.zeros((len(ann_ids)))
-    for i, ann_id in enumerate(ann_ids):
-        areas[i] = np.count_nonzero(ann_id == masks)
-    return areas
+    areas = np.bincount(masks.reshape(-1))[1:]
+    return areas[areas > 0].astype(np.float64)
+
+
+def load_pred_scores(dt_json: str) -> Dict[str, List[Tuple[int, float]]]:
+    """Load the instance ids and scores of the predictions of each image."""
+    img2score: Dict[str, List[Tuple[int, float]]] = dict()
+    with open(dt_json) as fp:
+        dt_pred = json.load(fp)
+    for image in dt_pred:
+        img_name = image["name"].replace(".jpg", ".png")
+        img2score[img_name] = []
+        if "labels" not in image or image["labels"] is None:
+            continue
+        for label in image["labels"]:
+            img2score[img_name].append((label["index"], label["score"]))
+    return img2score
+
+
+def bitmask_ious(
+    gt_bitmask: np.ndarray,
+    dt_bitmask: np.ndarray,
+    ann_score: List[Tuple[int, float]],
+) -> DictStrAny:
+    """Compute the IoUs and the properties of the instances of an image."""
+    return decoded_ious(decode_bitmask(gt_bitmask), dt_bitmask, ann_score)
+
+
+def decoded_ious(
+    gt_decoded: DecodedBitmask,
+    dt_bitmask: np.ndarray,
+    ann_score: List[Tuple[int, float]],
+) -> DictStrAny:
+    """Compute the IoUs with the decoded ground truth of an image."""
+    gt_masks, gt_attrs, gt_cat_ids = (
+        gt_decoded.masks,
+        gt_decoded.attributes,
+        gt_decoded.category_ids,
+    )
+    gt_areas = gt_decoded.areas.astype(np.float64)
+    gt_crowds = np.logical_not((gt_attrs & 2).astype(np.bool8))
+    gt_ignores = np.logical_not((gt_attrs & 1).astype(np.bool8))
+
+    dt_masks, _, dt_scores, dt_cat_ids = parse_res_bitmasks(
+        ann_score, dt_bitmask
+    )
+    dt_areas = get_mask_areas(dt_masks)
+
+    ious, _ = mask_intersection_rate(dt_masks, gt_masks)
+    return dict(
+        ious=ious,
+        gt_areas=gt_areas,
+        gt_cat_ids=gt_cat_ids,
+        gt_crowds=gt_crowds,
+        gt_ignores=gt_ignores,
+        dt_areas=dt_areas,
+        dt_scores=dt_scores,
+        dt_cat_ids=dt_cat_ids,
+    )
+
+
+def image_ious(
+    gt_base: str,
+    dt_bases: List[str],
+    img_name: str,
+    ann_scores: List[List[Tuple[int, float]]],
+) -> List[DictStrAny]:
+    """Compute the IoUs of an image for each result folder.
+
+    The ground truth is only decoded once for all the results.
+    """
+    gt = decode_bitmask(load_mask(os.path.join(gt_base, img_name)))
+    return [
+        decoded_ious(gt, load_mask(os.path.join(dt_base, img_name)), ann_score)
+        for dt_base, ann_score in zip(dt_bases, ann_scores)
+    ]
+
+
+# read-only state shared by the tasks of a pool worker, set by `init_worker`
+WORKER_STATE: DictStrAny = dict()
+
+
+def init_worker(state: DictStrAny) -> None:
+    """Set the read-only state of a pool worker once for all its tasks.
+
+    The state is inherited by the forked workers, or pickled once for each
+    spawned one, so that the tasks only carry the indices of the images.
+    """
+    WORKER_STATE.clear()
+    WORKER_STATE.update(state)
+
+
+def worker_image_ious(img_ind: int) -> List[DictStrAny]:
+    """Compute the IoUs of an image with the state of the pool worker.
+
+    The state holds `gt_base`, `dt_bases`, `img_names` and `img2scores`,
+    the scores of the images of each result folder.
+    """
+    img_name = WORKER_STATE["img_names"][img_ind]
+    return image_ious(
+        WORKER_STATE["gt_base"],
+        WORKER_STATE["dt_bases"],
+        img_name,
+        [img2score[img_name] for img2score in WORKER_STATE["img2scores"]],
+    )
+
+
+def greedy_match_loops(
+    ious: np.ndarray,
+    iou_thrs: np.ndarray,
+    gt_crowds: np.ndarray,
+    dt_gt_inds: np.ndarray,
+) -> None:
+    """Match the detections at each IoU threshold with plain loops.
+
+    This is the kernel compiled by numba, if installed.
+    """
+    dt_num, gt_num = ious.shape
+    available = np.ones(gt_num, dtype=np.bool_)
+    for t_ind, thr in enumerate(iou_thrs):
+        available[:] = True
+        for d_ind in range(dt_num):
+            max_iou = -np.inf
+            g_ind = 0
+            for g in range(gt_num):
+                iou = ious[d_ind, g] if available[g] else 0.0
+                if iou > max_iou:
+                    max_iou = iou
+                    g_ind = g
+            if max_iou < thr:
+                continue
+            dt_gt_inds[t_ind, d_ind] = g_ind
+            if not gt_crowds[g_ind]:
+                available[g_ind] = False
+
+
+greedy_match_jit = (
+    njit(cache=True, nogil=True)(greedy_match_loops)
+    if njit is not None
+    else None
+)
+
+
+def greedy_match(
+    ious: np.ndarray, iou_thrs: np.ndarray, gt_crowds: np.ndarray
+) -> np.ndarray:
+    """Match the detections to the ground truth at all the IoU thresholds.
+
+    The detections, sorted by their scores, each take the ground truth of
+    the highest IoU not taken yet at each threshold, if the IoU reaches the
+    threshold, where the crowd ground truth can be taken many times. The
+    thresholds are matched together, only over the detections reaching the
+    lowest one, or by the kernel compiled by numba, if installed.
+
+    Returns:
+        np.ndarray: the index of the ground truth matched by each detection
+            at each threshold, or -1, of shape (thresholds, detections).
+    """
+    dt_num, gt_num = ious.shape
+    thr_num = len(iou_thrs)
+    dt_gt_inds = np.full((thr_num, dt_num), -1, dtype=np.int64)
+    if dt_num == 0 or gt_num == 0:
+        return dt_gt_inds
+    if greedy_match_jit is not None:
+        greedy_match_jit(
+            np.ascontiguousarray(ious, dtype=np.float64),
+            np.asarray(iou_thrs, dtype=np.float64),
+            np.asarray(gt_crowds, dtype=np.bool_),
+            dt_gt_inds,
+        )
+        return dt_gt_inds
+
+    thr_inds = np.arange(thr_num)
+    available = np.ones((thr_num, gt_num), dtype=bool)
+    # the detections below all the thresholds are never matched
+    for d_ind in np.flatnonzero(ious.max(axis=1) >= np.min(iou_thrs)):
+        ious_d = np.where(available, ious[d_ind], 0.0)
+        g_inds = ious_d.argmax(axis=1)
+        matched = ious_d[thr_inds, g_inds] >= iou_thrs
+        dt_gt_inds[matched, d_ind] = g_inds[matched]
+        taken = matched & ~gt_crowds[g_inds]
+        available[thr_inds[taken], g_inds[taken]] = False
+    return dt_gt_inds
+
+
+class ImageMatches(NamedTuple):
+    """Matches of the detections and the ground truth of an image.
+
+    The rows are grouped by the index of their category, and the detections
+    of a category are sorted by their scores in descending order. The
+    ignore flags are for each area range, and the matches, which do not
+    depend on the area range, for each IoU threshold.
+    """
+
+    dt_cats: np.ndarray
+    dt_scores: np.ndarray
+    dt_matches: np.ndarray
+    dt_ignores: np.ndarray
+    gt_cats: np.ndarray
+    gt_ignores: np.ndarray
+
+
+def match_image(
+    res: DictStrAny,
+    cat_ids: List[int],
+    area_rngs: np.ndarray,
+    iou_thrs: np.ndarray,
+) -> ImageMatches:
+    """Match the detections of an image from its IoUs.
+
+    The detections are matched once for all the area ranges, which only
+    change the ignore flags.
+    """
+    thr_num = len(iou_thrs)
+
+    dt_cats, dt_scores, dt_matches, dt_ignores = [], [], [], []
+    gt_cats, gt_ignores = [], []
+    for cat_ind, cat_id in enumerate(cat_ids):
+        gt_inds_c = res["gt_cat_ids"] == cat_id
+        gt_areas_c = res["gt_areas"][gt_inds_c]
+        gt_crowds_c = res["gt_crowds"][gt_inds_c]
+        gt_ignores_c = res["gt_ignores"][gt_inds_c]
+
+        dt_inds_c = res["dt_cat_ids"] == cat_id
+        dt_areas_c = res["dt_areas"][dt_inds_c]
+        dt_scores_c = res["dt_scores"][dt_inds_c]
+
+        ious_c = res["ious"][dt_inds_c, :][:, gt_inds_c]
+        gt_num_c = np.count_nonzero(gt_inds_c)
+        dt_num_c = np.count_nonzero(dt_inds_c)
+
+        # index of the ground truth matched by each detection, or -1
+        dt_gt_inds = greedy_match(ious_c, iou_thrs, gt_crowds_c)
+        dt_matches_c = dt_gt_inds >= 0
+
+        # (areas, gts) and (areas, dts)
+        gt_ignores_a = gt_ignores_c & np.logical_or(
+            area_rngs[:, :1] > gt_areas_c, gt_areas_c > area_rngs[:, 1:]
+        )
+        dt_out_of_range_a = np.logical_or(
+            area_rngs[:, :1] > dt_areas_c, dt_areas_c > area_rngs[:, 1:]
+        )
+        # (dts, areas, thresholds)
+        dt_ignores_c = np.where(
+            dt_matches_c[None],
+            gt_ignores_a[:, np.maximum(dt_gt_inds, 0)]
+            if gt_num_c > 0
+            else False,
+            dt_out_of_range_a[:, None, :],
+        ).transpose(2, 0, 1)
+
+        dt_cats.append(np.full(dt_num_c, cat_ind, dtype=np.int64))
+        dt_scores.append(dt_scores_c)
+        dt_matches.append(dt_matches_c.T)
+        dt_ignores.append(dt_ignores_c)
+        gt_cats.append(np.full(gt_num_c, cat_ind, dtype=np.int64))
+        gt_ignores.append(gt_ignores_a.T)
+
+    area_num = len(area_rngs)
+    return ImageMatches(
+        dt_cats=np.concatenate(dt_cats + [np.zeros(0, dtype=np.int64)]),
+        dt_scores=np.concatenate(dt_scores + [np.zeros(0)]),
+        dt_matches=np.concatenate(
+            dt_matches + [np.zeros((0, thr_num), dtype=bool)]
+        ),
+        dt_ignores=np.concatenate(
+            dt_ignores + [np.zeros((0, area_num, thr_num), dtype=bool)]
+        ),
+        gt_cats=np.concatenate(gt_cats + [np.zeros(0, dtype=np.int64)]),
+        gt_ignores=np.concatenate(
+            gt_ignores + [np.zeros((0, area_num), dtype=bool)]
+        ),
+    )
+
+
+def worker_match(img_ind: int) -> ImageMatches:
+    """Match the detections of an image with the state of the pool worker.
+
+    The state holds the `iou_res` of the images and the `cat_ids`,
+    `area_rngs` and `iou_thrs` of the evaluation parameters.
+    """
+    return match_image(
+        WORKER_STATE["iou_res"][img_ind],
+        WORKER_STATE["cat_ids"],
+        WORKER_STATE["area_rngs"],
+        WORKER_STATE["iou_thrs"],
+    )
+
+
+class MatchStore(NamedTuple):
+    """Matches of all the images, stored as flat columns.
+
+    It replaces the `evalImgs` dicts of COCOeval. The rows are ordered by
+    category, then image, and those of the category k and the image i are
+    `[offsets[k * I + i], offsets[k * I + i + 1])` of their columns, where I
+    is the number of images. `dt_matches` is of shape (D, T) and
+    `dt_ignores` of shape (D, A, T) for the T IoU thresholds and the A area
+    ranges, and `gt_ignores` of shape (G, A).
+    """
+
+    dt_offsets: np.ndarray
+    dt_scores: np.ndarray
+    dt_matches: np.ndarray
+    dt_ignores: np.ndarray
+    gt_offsets: np.ndarray
+    gt_ignores: np.ndarray
+
+
+def block_offsets(blocks: np.ndarray, num_blocks: int) -> np.ndarray:
+    """Get the offsets of the blocks of rows sorted by their blocks."""
+    return np.concatenate(
+        [[0], np.cumsum(np.bincount(blocks, minlength=num_blocks))]
+    ).astype(np.int64)
+
+
+def merge_image_matches(
+    image_matches: List[ImageMatches], num_cats: int
+) -> MatchStore:
+    """Concatenate the matches of the images into a store."""
+    img_num = len(image_matches)
+    columns = {
+        name: np.concatenate([matches[i] for matches in image_matches])
+        for i, name in enumerate(ImageMatches._fields)
+    }
+    dt_blocks = columns["dt_cats"] * img_num + np.repeat(
+        np.arange(img_num), [len(m.dt_cats) for m in image_matches]
+    )
+    gt_blocks = columns["gt_cats"] * img_num + np.repeat(
+        np.arange(img_num), [len(m.gt_cats) for m in image_matches]
+    )
+    dt_order = np.argsort(dt_blocks, kind="stable")
+    gt_order = np.argsort(gt_blocks, kind="stable")
+    return MatchStore(
+        dt_offsets=block_offsets(dt_blocks, num_cats * img_num),
+        dt_scores=columns["dt_scores"][dt_order],
+        dt_matches=columns["dt_matches"][dt_order],
+        dt_ignores=columns["dt_ignores"][dt_order],
+        gt_offsets=block_offsets(gt_blocks, num_cats * img_num),
+        gt_ignores=columns["gt_ignores"][gt_order],
+    )
+
+
+def block_rows(
+    offsets: np.ndarray, blocks: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Get the rows of the blocks in order, with their ranks in the blocks."""
+    starts = offsets[blocks]
+    counts = offsets[blocks + 1] - starts
+    ends = np.cumsum(counts)
+    ranks = np.arange(ends[-1] if len(ends) > 0 else 0) - np.repeat(
+        ends - counts, counts
+    )
+    return ranks + np.repeat(starts, counts), ranks
+
+
+def recall_counts(rec_thrs: np.ndarray, npigs: np.ndarray) -> np.ndarray:
+    """Get the least true positives reaching each recall threshold.
+
+    The counts are of shape (areas, thresholds), for the numbers of the
+    ground truth not ignored in each area range, and are exact for the
+    recalls computed as floats, like COCOeval.
+    """
+    counts = np.ceil(rec_thrs * npigs[:, None]).astype(np.int64)
+    counts += counts / npigs[:, None] < rec_thrs
+    counts -= (counts > 0) & ((counts - 1) / npigs[:, None] >= rec_thrs)
+    return counts
+
+
+def accumulate_matches(
+    store: MatchStore, params: Params, params_eval: Params
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Compute the precision, recall and scores from the store.
+
+    The results are the same as those of COCOeval.accumulate with the
+    `params` and the evaluated params `params_eval`. The detections of each
+    category are sorted once, the max detections per image only mask their
+    ranks, and the precisions of all the area ranges and IoU thresholds are
+    accumulated at once.
+    """
+    counts = [
+        len(params.iouThrs),
+        len(params.recThrs),
+        len(params.catIds) if params.useCats else 1,
+        len(params.areaRng),
+        len(params.maxDets),
+    ]
+    # -1 for the precision of absent categories
+    precision = -np.ones(counts)
+    recall = -np.ones(counts[:1] + counts[2:])
+    scores = -np.ones(counts)
+
+    # indices of the evaluated categories, areas and images
+    set_k = set(params_eval.catIds if params_eval.useCats else [-1])
+    set_a = set(map(tuple, params_eval.areaRng))
+    set_m = set(params_eval.maxDets)
+    set_i = set(params_eval.imgIds)
+    k_list = [n for n, k in enumerate(params.catIds) if k in set_k]
+    m_list = [m for m in params.maxDets if m in set_m]
+    a_list = np.array(
+        [n for n, a in enumerate(map(tuple, params.areaRng)) if a in set_a],
+        dtype=np.int64,
+    )
+    i_list = np.array(
+        [n for n, i in enumerate(params.imgIds) if i in set_i],
+        dtype=np.int64,
+    )
+    img_num = len(params_eval.imgIds)
+    if len(i_list) == 0 or len(a_list) == 0:
+        return precision, recall, scores
+    rec_thrs = np.array(params.recThrs)
+    thr_num, rec_num = counts[:2]
+
+    for k, k0 in enumerate(k_list):
+        blocks = k0 * img_num + i_list
+        gt_rows, _ = block_rows(store.gt_offsets, blocks)
+        npigs = np.count_nonzero(~store.gt_ignores[gt_rows][:, a_list], 0)
+        # the areas without ground truth are left -1
+        areas = np.flatnonzero(npigs > 0)
+        if len(areas) == 0:
+            continue
+        npigs = npigs[areas]
+        area_inds = a_list[areas]
+
+        dt_rows, ranks = block_rows(store.dt_offsets, blocks)
+        # mergesort is used to be consistent as COCOeval
+        order = np.argsort(-store.dt_scores[dt_rows], kind="mergesort")
+        dt_rows, ranks = dt_rows[order], ranks[order]
+        dt_num = len(dt_rows)
+        if dt_num == 0:
+            recall[:, k, areas] = 0
+            precision[:, :, k, areas] = 0
+            scores[:, :, k, areas] = 0
+            continue
+        dt_scores = store.dt_scores[dt_rows]
+        # (areas, thresholds, dts)
+        dtm = store.dt_matches[dt_rows].T[None]
+        dt_valid = ~store.dt_ignores[dt_rows][:, area_inds].transpose(1, 2, 0)
+        tps_a = dtm & dt_valid
+        fps_a = ~dtm & dt_valid
+        # offsets to search the true positives of all the rows at once
+        row_offsets = np.arange(len(areas) * thr_num).reshape(
+            len(areas), thr_num, 1
+        ) * (dt_num + 1)
+        targets = np.minimum(
+            recall_counts(rec_thrs, npigs.astype(np.float64)), dt_num + 1
+        )[:, None, :]
+
+        for m, max_det in enumerate(m_list):
+            kept = ranks < max_det
+            tp_sum = np.cumsum(tps_a & kept, axis=2, dtype=np.int32)
+            fp_sum = np.cumsum(fps_a & kept, axis=2, dtype=np.int32)
+            recall[:, k, areas, m] = (tp_sum[..., -1] / npigs[:, None]).T
+            pr = tp_sum / (fp_sum + tp_sum + np.spacing(1))
+            # interpolate the precisions to be non-increasing
+            pr = np.maximum.accumulate(pr[..., ::-1], axis=2)[..., ::-1]
+
+            # first index reaching each recall threshold of each row
+            inds = (
+                np.searchsorted(
+                    (tp_sum + row_offsets).reshape(-1),
+                    (targets + row_offsets).reshape(-1),
+                ).reshape(len(areas), thr_num, rec_num)
+                - row_offsets // (dt_num + 1) * dt_num
+            )
+            # skip the detections beyond the max detections per image
+            kept_inds = np.append(np.flatnonzero(kept), dt_num)
+            inds = kept_inds[np.searchsorted(kept_inds, inds)]
+            valid = inds < dt_num
+            inds = np.minimum(inds, dt_num - 1)
+            precision[:, :, k, areas, m] = np.where(
+                valid, np.take_along_axis(pr, inds, axis=2), 0
+            ).transpose(1, 2, 0)
+            scores[:, :, k, areas, m] = np.where(
+                valid, dt_scores[inds], 0
+            ).transpose(1, 2, 0)
+    return precision, recall, scores
 
 
 class BDDInsSegEval(COCOeval):  # type: ignore
     """Modify the COCO API to support bitmasks as input."""
 
     def __init__(
-        self, gt_base: str, dt_base: str, dt_json: str, nproc: int = 4
+        self,
+        gt_base: str,
+        dt_base: str,
+        dt_json: str,
+        nproc: int = 4,
+        iou_res: Optional[List[DictStrAny]] = None,
     ) -> None:
-        """Initialize InsSeg eval."""
+        """Initialize InsSeg eval.
+
+        The IoUs of the images are computed from the folders, unless they
+        are given as `iou_res`, where the images are named by their order.
+        """
         super().__init__(iouType="segm")
         self.gt_base = gt_base
         self.dt_base = dt_base
@@ -83,9 +563,14 @@ class BDDInsSegEval(COCOeval):  # type: ignore
         self.nproc = nproc
         self.img_names: List[str] = list()
         self.img2score: Dict[str, List[Tuple[int, float]]] = dict()
-        self.evalImgs: List[DictStrAny] = []
+        self.store: Optional[MatchStore] = None
         self.iou_res: List[DictStrAny] = []
 
+        if iou_res is not None:
+            self.iou_res = iou_res
+            self.img_names = [str(i) for i in range(len(iou_res))]
+            self.params.imgIds = self.img_names  # type: ignore
+            return
         print("Precompute per image IoUs...")
         self._prepare()
 
@@ -95,31 +580,29 @@ class BDDInsSegEval(COCOeval):  # type: ignore
 
     def _prepare(self) -> None:
         """Prepare file list for evaluation."""
-        gt_imgs = list_files(self.gt_base, ".png")
-        dt_imgs = list_files(self.dt_base, ".png")
+        gt_imgs = list_masks(self.gt_base)
+        dt_imgs = list_masks(self.dt_base)
         for gt_img, dt_img in zip(gt_imgs, dt_imgs):
             assert gt_img == dt_img
         self.img_names = gt_imgs
         self.params.imgIds = self.img_names  # type: ignore
 
-        with open(self.dt_json) as fp:
-            dt_pred = json.load(fp)
-        for image in dt_pred:
-            img_name = image["name"].replace(".jpg", ".png")
-            self.img2score[img_name] = []
-            if "labels" not in image or image["labels"] is None:
-                continue
-            for label in image["labels"]:
-                self.img2score[img_name].append(
-                    (label["index"], label["score"])
-                )
-        self.iou_res = [dict() for i in range(len(self))]
-        with Pool(self.nproc) as pool:
-            to_updates: List[DictStrAny] = pool.map(
-                self.compute_iou, tqdm(range(len(self)))
+        self.img2score = load_pred_scores(self.dt_json)
+        state = dict(
+            gt_base=self.gt_base,
+            dt_bases=[self.dt_base],
+            img_names=self.img_names,
+            img2scores=[self.img2score],
+        )
+        with Pool(
+            self.nproc, initializer=init_worker, initargs=(state,)
+        ) as pool:
+            img_ious: List[List[DictStrAny]] = pool.map(
+                worker_image_ious, tqdm(range(len(self)))
             )
-        for res in to_updates:
-            self.iou_res[res["ind"]].update(res)
+        self.iou_res = [
+            dict(ind=ind, **ious[0]) for ind, ious in enumerate(img_ious)
+        ]
 
     def evaluate(self) -> None:
         """Run per image evaluation."""
@@ -127,137 +610,65 @@ class BDDInsSegEval(COCOeval):  # type: ignore
 
         print("Running per image evaluation...")
         p = self.params  # type: ignore
-        eval_num = len(p.catIds) * len(p.areaRng) * len(self)
-        self.evalImgs = [dict() for i in range(eval_num)]
-
         print("Evaluate annotation type *{}*".format(p.iouType))
         p.maxDets = sorted(p.maxDets)
 
         self.params = p
 
         # loop through images, area range, max detection number
-        with Pool(self.nproc) as pool:
-            to_updates: List[Dict[int, DictStrAny]] = pool.map(
-                self.compute_match, range(len(self))
+        state = dict(
+            iou_res=self.iou_res,
+            cat_ids=p.catIds,
+            area_rngs=np.array(p.areaRng, dtype=np.float64),
+            iou_thrs=np.array(p.iouThrs, dtype=np.float64),
+        )
+        with Pool(
+            self.nproc, initializer=init_worker, initargs=(state,)
+        ) as pool:
+            image_matches: List[ImageMatches] = pool.map(
+                worker_match, range(len(self))
             )
-        for to_update in to_updates:
-            for ind, item in to_update.items():
-                self.evalImgs[ind].update(item)
+        self.store = merge_image_matches(image_matches, len(p.catIds))
 
         self._paramsEval = copy.deepcopy(self.params)
         toc = time.time()
         print("DONE (t={:0.2f}s).".format(toc - tic))
 
-    def compute_iou(self, img_ind: int) -> DictStrAny:
-        """Compute IoU per image."""
-        img_name = self.img_names[img_ind]
-        ann_score = self.img2score[img_name]
-
-        gt_path = os.path.join(self.gt_base, img_name)
-        gt_bitmask = np.asarray(Image.open(gt_path))
-        gt_masks, _, gt_attrs, gt_cat_ids = parse_bitmasks(gt_bitmask)
-        gt_areas = get_mask_areas(gt_masks)
-        gt_crowds = np.logical_not((gt_attrs & 2).astype(np.bool8))
-        gt_ignores = np.logical_not((gt_attrs & 1).astype(np.bool8))
-
-        dt_path = os.path.join(self.dt_base, img_name)
-        dt_bitmask = np.asarray(Image.open(dt_path))
-        dt_masks, _, dt_scores, dt_cat_ids = parse_res_bitmasks(
-            ann_score, dt_bitmask
-        )
-        dt_areas = get_mask_areas(dt_masks)
-
-        ious, _ = mask_intersection_rate(dt_masks, gt_masks)
-        return dict(
-            ind=img_ind,
-            ious=ious,
-            gt_areas=gt_areas,
-            gt_cat_ids=gt_cat_ids,
-            gt_crowds=gt_crowds,
-            gt_ignores=gt_ignores,
-            dt_areas=dt_areas,
-            dt_scores=dt_scores,
-            dt_cat_ids=dt_cat_ids,
-        )
-
-    def compute_match(self, img_ind: int) -> Dict[int, DictStrAny]:
-        """Compute matching results for each image."""
-        res = self.iou_res[img_ind]
+    def compute_match(self, img_ind: int) -> ImageMatches:
+        """Compute the matches of a single image with the current params.
 
+        It is the per-image API of `evaluate`, which matches all the images
+        in a pool.
+        """
         p = self.params
-        area_num = len(p.areaRng)
-        thr_num = len(p.iouThrs)
-        img_num = len(self)
-
-        to_updates = dict()
-        for cat_ind, cat_id in enumerate(p.catIds):
-            gt_inds_c = res["gt_cat_ids"] == cat_id
-            gt_areas_c = res["gt_areas"][gt_inds_c]
-            gt_crowds_c = res["gt_crowds"][gt_inds_c]
-            gt_ignores_c = res["gt_ignores"][gt_inds_c]
-
-            dt_inds_c = res["dt_cat_ids"] == cat_id
-            dt_areas_c = res["dt_areas"][dt_inds_c]
-            dt_scores_c = res["dt_scores"][dt_inds_c]
-
-            ious_c = res["ious"][dt_inds_c, :][:, gt_inds_c]
-            gt_num_c = np.count_nonzero(gt_inds_c)
-            dt_num_c = np.count_nonzero(dt_inds_c)
-
-            for area_ind, area_rng in enumerate(p.areaRng):
-                gt_matches_a = np.zeros((thr_num, gt_num_c))
-                dt_matches_a = np.zeros((thr_num, dt_num_c))
-                dt_ignores_a = np.zeros((thr_num, dt_num_c))
-
-                gt_out_of_range_a = np.logical_or(
-                    area_rng[0] > gt_areas_c, gt_areas_c > area_rng[1]
-                )
-                gt_ignores_a = gt_ignores_c & gt_out_of_range_a
-
-                for t_ind, thr in enumerate(p.iouThrs):
-                    if ious_c.shape[1] == 0:
-                        break
-                    ious_t = ious_c.copy()
-                    for d_ind in range(ious_t.shape[0]):
-                        max_iou = np.max(ious_t[d_ind])
-                        g_ind = np.argmax(ious_t[d_ind])
-                        if max_iou < thr:
-                            continue
-                        gt_matches_a[t_ind, g_ind] = 1
-                        dt_matches_a[t_ind, d_ind] = 1
-                        dt_ignores_a[t_ind, d_ind] = gt_ignores_a[g_ind]
-                        if not gt_crowds_c[g_ind]:
-                            ious_t[:, g_ind] = 0.0
-
-                dt_out_of_range_a = (
-                    np.logical_or(
-                        area_rng[0] > dt_areas_c, dt_areas_c > area_rng[1]
-                    )
-                    .reshape(1, -1)
-                    .repeat(thr_num, axis=0)
-                )
-                dt_ignores_a = np.logical_or(
-                    dt_ignores_a,
-                    np.logical_and(
-                        np.logical_not(dt_matches_a), dt_out_of_range_a
-                    ),
-                )
-
-                eval_ind: int = (
-                    cat_ind * area_num * img_num + area_ind * img_num + img_ind
-                )
-                to_updates[eval_ind] = dict(
-                    category_id=cat_id,
-                    aRng=p.areaRng[area_ind],
-                    maxDet=p.maxDets[-1],
-                    dtMatches=dt_matches_a,
-                    gtMatches=gt_matches_a,
-                    dtScores=dt_scores_c,
-                    gtIgnore=gt_ignores_a,
-                    dtIgnore=dt_ignores_a,
-                )
-
-        return to_updates
+        return match_image(
+            self.iou_res[img_ind],
+            p.catIds,
+            np.array(p.areaRng, dtype=np.float64),
+            np.array(p.iouThrs, dtype=np.float64),
+        )
+
+    def accumulate(self, p: Optional[Params] = None) -> None:
+        """Accumulate the matches of the store like COCOeval."""
+        print("Accumulating evaluation results...")
+        tic = time.time()
+        assert self.store is not None, "Please run evaluate() first"
+        if p is None:
+            p = self.params
+        p.catIds = p.catIds if p.useCats == 1 else [-1]
+        precision, recall, scores = accumulate_matches(
+            self.store, p, self._paramsEval
+        )
+        self.eval = {
+            "params": p,
+            "counts": list(precision.shape),
+            "date": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "precision": precision,
+            "recall": recall,
+            "scores": scores,
+        }
+        toc = time.time()
+        print("DONE (t={:0.2f}s).".format(toc - tic))
 
 
 def evaluate_ins_seg(
@@ -267,6 +678,8 @@ def evaluate_ins_seg(
     config: Config,
     out_dir: str = "none",
     nproc: int = 4,
+    image_file: Optional[str] = None,
+    worst_k: int = WORST_K,
 ) -> Dict[str, float]:
     """Load the ground truth and prediction results.
 
@@ -277,12 +690,185 @@ def evaluate_ins_seg(
         config: BDDConfig instance.
         out_dir: output_directory.
         nproc: number of processes.
+        image_file: path to save the per-image results, if any.
+        worst_k: number of the worst images of each class to report.
 
     Returns:
         dict: detection metric scores
     """
-    categories = get_coco_categories(config)
     bdd_eval = BDDInsSegEval(ann_base, pred_base, pred_score_file, nproc)
+    results = evaluate_bdd_eval(bdd_eval, config, out_dir)
+    if image_file is not None:
+        save_ins_seg_breakdown(bdd_eval, config, image_file, worst_k)
+    return results
+
+
+def evaluate_ins_seg_dirs(
+    ann_base: str,
+    pred_bases: List[str],
+    pred_score_files: List[str],
+    config: Config,
+    out_dir: str = "none",
+    nproc: int = 4,
+) -> List[Dict[str, float]]:
+    """Evaluate several prediction folders with their scores at once.
+
+    Each ground truth bitmask is only decoded once for all the predictions,
+    which all have to cover the ground truth. The outputs of the i-th
+    prediction are saved in the `i` subfolder of `out_dir`.
+    """
+    assert len(pred_bases) == len(pred_score_files)
+    img_names = list_masks(ann_base)
+    for pred_base in pred_bases:
+        assert list_masks(pred_base) == img_names
+    img2scores = [load_pred_scores(score) for score in pred_score_files]
+
+    print("Precompute per image IoUs...")
+    state = dict(
+        gt_base=ann_base,
+        dt_bases=pred_bases,
+        img_names=img_names,
+        img2scores=img2scores,
+    )
+    with Pool(nproc, initializer=init_worker, initargs=(state,)) as pool:
+        img_ious: List[List[DictStrAny]] = pool.map(
+            worker_image_ious, tqdm(range(len(img_names)))
+        )
+
+    results = []
+    for i, (pred_base, pred_score_file) in enumerate(
+        zip(pred_bases, pred_score_files)
+    ):
+        print("Results of {}".format(pred_base))
+        bdd_eval = BDDInsSegEval(
+            ann_base,
+            pred_base,
+            pred_score_file,
+            nproc,
+            iou_res=[
+                dict(ind=ind, **ious[i]) for ind, ious in enumerate(img_ious)
+            ],
+        )
+        pred_out_dir = out_dir
+        if out_dir != "none":
+            pred_out_dir = os.path.join(out_dir, str(i))
+            os.makedirs(pred_out_dir, exist_ok=True)
+        results.append(evaluate_bdd_eval(bdd_eval, config, pred_out_dir))
+    return results
+
+
+def evaluate_bdd_eval(
+    bdd_eval: BDDInsSegEval, config: Config, out_dir: str = "none"
+) -> Dict[str, float]:
+    """Run the COCO evaluation for the categories of the config."""
+    categories = get_coco_categories(config)
     cat_ids = [category["id"] for category in categories]
     cat_names = [category["name"] for category in categories]
     return evaluate_workflow(bdd_eval, cat_ids, cat_names, out_dir)
+
+
+def save_ins_seg_breakdown(
+    bdd_eval: BDDInsSegEval,
+    config: Config,
+    image_file: str,
+    worst_k: int = WORST_K,
+) -> None:
+    """Save the matches of each image over all the areas.
+
+    The detections of all the images are saved as rows with their image,
+    class, score, and their matches and ignore flags at each IoU threshold,
+    so the AP of any subset of the images can be computed again. The images
+    are ranked by the F1 score of each class at the first IoU threshold.
+    """
+    p = bdd_eval.params
+    store = bdd_eval.store
+    assert store is not None
+    cat_names = [category["name"] for category in get_coco_categories(config)]
+    img_num = len(bdd_eval)
+    shape = (len(p.catIds), img_num)
+    num_blocks = shape[0] * shape[1]
+    dt_blocks = np.repeat(np.arange(num_blocks), np.diff(store.dt_offsets))
+    gt_blocks = np.repeat(np.arange(num_blocks), np.diff(store.gt_offsets))
+    # the first area range is for all the areas
+    matches = store.dt_matches
+    ignores = store.dt_ignores[:, 0]
+    num_gts = np.bincount(
+        gt_blocks, ~store.gt_ignores[:, 0], minlength=num_blocks
+    )
+    num_dts = np.bincount(dt_blocks, ~ignores[:, 0], minlength=num_blocks)
+    true_pos = np.bincount(
+        dt_blocks, matches[:, 0] & ~ignores[:, 0], minlength=num_blocks
+    )
+    num_gts, num_dts, true_pos = (
+        counts.reshape(shape).T.astype(np.int64)
+        for counts in [num_gts, num_dts, true_pos]
+    )
+
+    total = num_gts + num_dts
+    with np.errstate(divide="ignore", invalid="ignore"):
+        f1_scores = np.where(total > 0, 2 * true_pos / total, np.nan)
+    save_breakdown(
+        image_file,
+        bdd_eval.img_names,
+        cat_names,
+        f1_scores,
+        worst_k,
+        num_gts=num_gts,
+        num_dts=num_dts,
+        true_positives=true_pos,
+        iou_thrs=np.array(p.iouThrs),
+        det_images=dt_blocks % img_num,
+        det_classes=dt_blocks // img_num,
+        det_scores=store.dt_scores.astype(np.float32),
+        det_matches=matches,
+        det_ignores=ignores,
+    )
+
+
+class InsSegEvaluator(ArrayEvaluator[DictStrAny, Dict[str, float]]):
+    """Accumulate the IoUs of instance segmentation results."""
+
+    def __init__(
+        self,
+        config: Config,
+        out_dir: str = "none",
+        nproc: int = 4,
+        num_threads: int = 0,
+    ) -> None:
+        """Initialize the IoUs of the images."""
+        super().__init__(num_threads)
+        self.config = config
+        self.out_dir = out_dir
+        self.nproc = nproc
+        self.iou_res: List[DictStrAny] = []
+
+    def update(
+        self,
+        gt_bitmask: np.ndarray,
+        pred_bitmask: np.ndarray,
+        pred_scores: List[Tuple[int, float]],
+    ) -> None:
+        """Evaluate the bitmasks of an image.
+
+        `pred_scores` are the instance ids in the predicted bitmask with
+        their scores.
+        """
+        self.submit(
+            partial(bitmask_ious, gt_bitmask, pred_bitmask, pred_scores)
+        )
+
+    def accumulate(self, stats: DictStrAny) -> None:
+        """Add the IoUs of an image."""
+        self.iou_res.append(dict(ind=len(self.iou_res), **stats))
+
+    def compute(self) -> Dict[str, float]:
+        """Compute the COCO metrics of the images."""
+        self.sync()
+        bdd_eval = BDDInsSegEval(
+            gt_base="",
+            dt_base="",
+            dt_json="",
+            nproc=self.nproc,
+            iou_res=self.iou_res,
+        )
+        return evaluate_bdd_eval(bdd_eval, self.config, self.out_dir)
@@ -1,13 +1,35 @@
 """Test cases for evaluation scripts."""
+
+import copy
 import json
 import os
 import unittest
+from typing import List, Tuple
 
 import numpy as np
 from PIL import Image
+from pycocotools.cocoeval import COCOeval, Params  # type: ignore
+from scalabel.common.typing import DictStrAny
 
+from ..common.mask_io import list_masks, load_mask
 from ..common.utils import load_bdd100k_config
-from .ins_seg import evaluate_ins_seg
+from .ins_seg import (
+    WORKER_STATE,
+    BDDInsSegEval,
+    ImageMatches,
+    InsSegEvaluator,
+    accumulate_matches,
+    block_rows,
+    evaluate_ins_seg,
+    greedy_match,
+    greedy_match_loops,
+    init_worker,
+    load_pred_scores,
+    match_image,
+    merge_image_matches,
+    worker_image_ious,
+    worker_match,
+)
 
 
 class TestBDD100KInsSegEval(unittest.TestCase):
@@ -36,6 +58,236 @@ class TestBDD100KInsSegEval(unittest.TestCase):
         for key in overall_reference:
             self.assertAlmostEqual(result[key], overall_reference[key])
 
+    def test_evaluator(self) -> None:
+        """Check the array evaluator matches the folder evaluation."""
+        cur_dir = os.path.dirname(os.path.abspath(__file__))
+        gt_base = "{}/testcases/ins_seg/gt".format(cur_dir)
+        pred_base = "{}/testcases/ins_seg/pred".format(cur_dir)
+        pred_json = "{}/testcases/ins_seg/pred.json".format(cur_dir)
+        config = load_bdd100k_config("ins_seg").config
+        result = evaluate_ins_seg(gt_base, pred_base, pred_json, config)
+        img2score = load_pred_scores(pred_json)
+
+        for num_threads in [0, 2]:
+            with InsSegEvaluator(
+                config, nproc=1, num_threads=num_threads
+            ) as evaluator:
+                for name in list_masks(gt_base):
+                    evaluator.update(
+                        load_mask(os.path.join(gt_base, name)),
+                        load_mask(os.path.join(pred_base, name)),
+                        img2score[name],
+                    )
+                array_result = evaluator.compute()
+            for key, val in result.items():
+                self.assertTrue(
+                    np.isclose(array_result[key], val, equal_nan=True)
+                )
+
+
+class TestMatchStore(unittest.TestCase):
+    """Test cases for the columnar store of the matches."""
+
+    def test_merge_image_matches(self) -> None:
+        """Check the rows are ordered by category, then image."""
+        image_matches = [
+            ImageMatches(
+                dt_cats=np.array(dt_cats),
+                dt_scores=np.array(dt_scores),
+                dt_matches=np.ones((len(dt_cats), 2), dtype=bool),
+                dt_ignores=np.zeros((len(dt_cats), 1, 2), dtype=bool),
+                gt_cats=np.array(gt_cats, dtype=np.int64),
+                gt_ignores=np.zeros((len(gt_cats), 1), dtype=bool),
+            )
+            for dt_cats, dt_scores, gt_cats in [
+                ([0, 0, 1], [0.9, 0.5, 0.7], [1]),
+                ([1], [0.8], []),
+            ]
+        ]
+        store = merge_image_matches(image_matches, 2)
+        self.assertEqual(store.dt_offsets.tolist(), [0, 2, 2, 3, 4])
+        self.assertEqual(store.gt_offsets.tolist(), [0, 0, 0, 1, 1])
+        self.assertEqual(store.dt_scores.tolist(), [0.9, 0.5, 0.7, 0.8])
+        rows, ranks = block_rows(store.dt_offsets, np.array([2, 0, 3]))
+        self.assertEqual(rows.tolist(), [2, 0, 1, 3])
+        self.assertEqual(ranks.tolist(), [0, 0, 1, 0])
+
+
+def random_iou_res(rng: np.random.Generator, cat_num: int) -> DictStrAny:
+    """Generate the IoUs of an image with random instances."""
+    gt_num, dt_num = rng.integers(0, 8), rng.integers(0, 15)
+    return dict(
+        gt_cat_ids=rng.integers(1, cat_num + 1, gt_num),
+        gt_areas=rng.integers(1, 20000, gt_num).astype(np.float64),
+        gt_crowds=rng.random(gt_num) < 0.2,
+        gt_ignores=rng.random(gt_num) < 0.8,
+        dt_cat_ids=rng.integers(1, cat_num + 1, dt_num),
+        dt_areas=rng.integers(1, 20000, dt_num).astype(np.float64),
+        # rounded to have ties in the scores
+        dt_scores=np.round(rng.random(dt_num), 1),
+        ious=rng.random((dt_num, gt_num)),
+    )
+
+
+def threshold_matches(
+    ious: np.ndarray,
+    iou_thrs: List[float],
+    gt_crowds: np.ndarray,
+    gt_ignores: np.ndarray,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Match the detections for each IoU threshold one by one."""
+    dt_matches = np.zeros((len(iou_thrs), ious.shape[0]))
+    dt_ignores = np.zeros_like(dt_matches, dtype=bool)
+    for t_ind, thr in enumerate(iou_thrs):
+        if ious.shape[1] == 0:
+            break
+        ious_t = ious.copy()
+        for d_ind in range(ious_t.shape[0]):
+            g_ind = np.argmax(ious_t[d_ind])
+            if ious_t[d_ind, g_ind] < thr:
+                continue
+            dt_matches[t_ind, d_ind] = 1
+            dt_ignores[t_ind, d_ind] = gt_ignores[g_ind]
+            if not gt_crowds[g_ind]:
+                ious_t[:, g_ind] = 0.0
+    return dt_matches, dt_ignores
+
+
+def per_area_eval_imgs(
+    iou_res: List[DictStrAny], params: Params
+) -> List[DictStrAny]:
+    """Match the images for each area range, as the evalImgs of COCOeval."""
+    area_num, img_num = len(params.areaRng), len(iou_res)
+    eval_imgs: List[DictStrAny] = [{}] * (
+        len(params.catIds) * area_num * img_num
+    )
+    for img_ind, res in enumerate(iou_res):
+        for cat_ind, cat_id in enumerate(params.catIds):
+            gt_inds_c = res["gt_cat_ids"] == cat_id
+            dt_inds_c = res["dt_cat_ids"] == cat_id
+            gt_areas = res["gt_areas"][gt_inds_c]
+            dt_areas = res["dt_areas"][dt_inds_c]
+            for area_ind, area_rng in enumerate(params.areaRng):
+                gt_ignores = res["gt_ignores"][gt_inds_c] & np.logical_or(
+                    area_rng[0] > gt_areas, gt_areas > area_rng[1]
+                )
+                dt_matches, dt_ignores = threshold_matches(
+                    res["ious"][dt_inds_c, :][:, gt_inds_c],
+                    params.iouThrs,
+                    res["gt_crowds"][gt_inds_c],
+                    gt_ignores,
+                )
+                dt_ignores |= (dt_matches == 0) & np.logical_or(
+                    area_rng[0] > dt_areas, dt_areas > area_rng[1]
+                )
+                eval_imgs[
+                    (cat_ind * area_num + area_ind) * img_num + img_ind
+                ] = dict(
+                    dtMatches=dt_matches,
+                    dtScores=res["dt_scores"][dt_inds_c],
+                    gtIgnore=gt_ignores,
+                    dtIgnore=dt_ignores,
+                )
+    return eval_imgs
+
+
+class TestAccumulateMatches(unittest.TestCase):
+    """Test cases for the accumulation of the matches of the store."""
+
+    def test_accumulate_matches(self) -> None:
+        """Check the accumulation is the same as COCOeval."""
+        rng = np.random.default_rng(0)
+        iou_res = [random_iou_res(rng, 3) for _ in range(6)]
+        coco_eval = COCOeval(iouType="segm")
+        params = coco_eval.params
+        params.imgIds = list(range(len(iou_res)))
+        params.catIds = [1, 2, 3]
+        params.maxDets = [1, 5, 100]
+        image_matches = [
+            match_image(
+                res,
+                params.catIds,
+                np.array(params.areaRng, dtype=np.float64),
+                np.array(params.iouThrs, dtype=np.float64),
+            )
+            for res in iou_res
+        ]
+        store = merge_image_matches(image_matches, len(params.catIds))
+        params_eval = copy.deepcopy(params)
+        coco_eval.evalImgs = per_area_eval_imgs(iou_res, params)
+        coco_eval._paramsEval = params_eval  # pylint: disable=protected-access
+
+        for cat_ids in [[1, 2, 3], [1, 3]]:
+            params_ = copy.deepcopy(params)
+            params_.catIds = cat_ids
+            coco_eval.accumulate(params_)
+            for result, ref_key in zip(
+                accumulate_matches(store, params_, params_eval),
+                ["precision", "recall", "scores"],
+            ):
+                np.testing.assert_array_equal(result, coco_eval.eval[ref_key])
+
+
+class TestGreedyMatch(unittest.TestCase):
+    """Test cases for the greedy matching of the detections."""
+
+    def test_greedy_match(self) -> None:
+        """Check the crowds are matched many times at all thresholds."""
+        ious = np.array([[0.9, 0.0], [0.8, 0.6], [0.0, 0.7], [0.0, 0.4]])
+        iou_thrs = np.array([0.5, 0.75])
+        for gt_crowds, matches in [
+            ([False, False], [[0, 1, -1, -1], [0, -1, -1, -1]]),
+            ([True, False], [[0, 0, 1, -1], [0, 0, -1, -1]]),
+        ]:
+            dt_gt_inds = greedy_match(ious, iou_thrs, np.array(gt_crowds))
+            self.assertEqual(dt_gt_inds.tolist(), matches)
+            loop_gt_inds = np.full((2, 4), -1, dtype=np.int64)
+            greedy_match_loops(
+                ious, iou_thrs, np.array(gt_crowds), loop_gt_inds
+            )
+            self.assertEqual(loop_gt_inds.tolist(), matches)
+
+
+class TestPoolWorker(unittest.TestCase):
+    """Test cases for the stateless functions of the pool workers."""
+
+    def tearDown(self) -> None:
+        """Clear the state of the worker."""
+        WORKER_STATE.clear()
+
+    def test_worker(self) -> None:
+        """Check the workers match the evaluation of the images."""
+        cur_dir = os.path.dirname(os.path.abspath(__file__))
+        bdd_eval = BDDInsSegEval(
+            "{}/testcases/ins_seg/gt".format(cur_dir),
+            "{}/testcases/ins_seg/pred".format(cur_dir),
+            "{}/testcases/ins_seg/pred.json".format(cur_dir),
+            nproc=1,
+        )
+        p = bdd_eval.params
+        init_worker(
+            dict(
+                gt_base=bdd_eval.gt_base,
+                dt_bases=[bdd_eval.dt_base],
+                img_names=bdd_eval.img_names,
+                img2scores=[bdd_eval.img2score],
+                iou_res=bdd_eval.iou_res,
+                cat_ids=p.catIds,
+                area_rngs=np.array(p.areaRng),
+                iou_thrs=np.array(p.iouThrs),
+            )
+        )
+        for img_ind in range(len(bdd_eval)):
+            ious = worker_image_ious(img_ind)[0]
+            for key, value in ious.items():
+                np.testing.assert_array_equal(
+                    value, bdd_eval.iou_res[img_ind][key]
+                )
+            for column, ref_column in zip(
+                worker_match(img_ind), bdd_eval.compute_match(img_ind)
+            ):
+                np.testing.assert_array_equal(column, ref_column)
+
 
 def create_test_file() -> None:
     """Creat mocking files for the InsSeg test case."""
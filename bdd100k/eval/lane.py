@@ -59,72 +59,126 @@ Licensed under the BSD License [see LICENSE for details]
 Written by Federico Perazzi
 ----------------------------------------------------------------------------
 """
+
+import hashlib
+import json
+import os
+import os.path as osp
+from contextlib import ExitStack
 from functools import partial
 from multiprocessing import Pool
-from typing import Callable, Dict, List
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
 
 import numpy as np
-from PIL import Image
-from skimage.morphology import (  # type: ignore
-    binary_dilation,
-    disk,
-    skeletonize,
-)
+from scipy.spatial import cKDTree
+from skimage.morphology import skeletonize  # type: ignore
 from tabulate import tabulate
 from tqdm import tqdm
 
-from ..common.utils import list_files
+from ..common.mask_io import list_masks, load_mask
 from ..label.label import lane_categories, lane_directions, lane_styles
+from ..label.manifest import hash_content, hash_file
+from .bootstrap import bootstrap_sums, confidence_interval
+from .breakdown import WORST_K, save_breakdown
+from .evaluator import ArrayEvaluator
 
 AVG = "avg"
 TOTAL = "total"
+GT_CACHE_NAME = "lane-gt-{}.npz"
+# value of the background pixels in the decoded fields
+NO_CLASS = (1 << 8) - 1
+# frames summed by a worker before sending back the results
+CHUNK_SIZE = 16
 
 
-def eval_lane_per_threshold(
-    gt_mask: np.ndarray, pd_mask: np.ndarray, bound_th: float = 0.008
-) -> float:
-    """Compute mean,recall and decay from per-threshold evaluation."""
-    bound_pix = (
-        bound_th
-        if bound_th >= 1
-        else np.ceil(bound_th * np.linalg.norm(gt_mask.shape))
+def get_bound_pixels(
+    bound_ths: List[float], shape: Tuple[int, ...]
+) -> np.ndarray:
+    """Get the bound in pixels of each threshold for an image shape.
+
+    The thresholds below 1 are relative to the image diagonal.
+    """
+    return np.array(
+        [
+            (
+                bound_th
+                if bound_th >= 1
+                else np.ceil(bound_th * np.linalg.norm(shape))
+            )
+            for bound_th in bound_ths
+        ]
     )
 
-    gt_skeleton = skeletonize(gt_mask)
-    pd_skeleton = skeletonize(pd_mask)
-
-    gt_dil = binary_dilation(gt_skeleton, disk(bound_pix))
-    pd_dil = binary_dilation(pd_skeleton, disk(bound_pix))
-
-    # Get the intersection
-    gt_match = gt_skeleton * pd_dil
-    pd_match = pd_skeleton * gt_dil
-
-    # Area of the intersection
-    n_gt = np.sum(gt_skeleton)
-    n_pd = np.sum(pd_skeleton)
-
-    # Compute precision and recall
-    if n_pd == 0 and n_gt > 0:
-        precision = 1
-        recall = 0
-    elif n_pd > 0 and n_gt == 0:
-        precision = 0
-        recall = 1
-    elif n_pd == 0 and n_gt == 0:
-        precision = 1
-        recall = 1
-    else:
-        precision = np.sum(pd_match) / float(n_pd)
-        recall = np.sum(gt_match) / float(n_gt)
+
+def skeleton_coords(mask: np.ndarray) -> np.ndarray:
+    """Skeletonize a mask and get the pixel coordinates of the skeleton.
+
+    The thinning only depends on the 3x3 neighborhoods, so the mask is
+    skeletonized within its bounding box padded by one pixel.
+    """
+    rows = np.flatnonzero(mask.any(axis=1))
+    if len(rows) == 0:
+        return np.zeros((0, 2), dtype=np.uint16)
+    cols = np.flatnonzero(mask.any(axis=0))
+    top, left = max(rows[0] - 1, 0), max(cols[0] - 1, 0)
+    skeleton = skeletonize(mask[top : rows[-1] + 2, left : cols[-1] + 2])
+    coords: np.ndarray = (np.argwhere(skeleton) + [top, left]).astype(
+        np.uint16
+    )
+    return coords
+
+
+def nearest_distances(
+    coords: np.ndarray, other_coords: np.ndarray, max_distance: float
+) -> np.ndarray:
+    """Distances from skeleton pixels to the nearest pixel of another one.
+
+    A pixel is within the dilation of the other skeleton by a disk of radius
+    r iff its distance is at most r, so one query serves all the thresholds.
+    The distances above `max_distance` are infinite.
+    """
+    # the upper bound of the query is exclusive
+    distances: np.ndarray = cKDTree(other_coords).query(
+        coords, distance_upper_bound=np.nextafter(max_distance, np.inf)
+    )[0]
+    return distances
+
+
+def eval_lane_per_class(
+    gt_coords: np.ndarray, pd_coords: np.ndarray, bound_pixes: np.ndarray
+) -> np.ndarray:
+    """Compute the F-scores of two skeletons for all the bounds."""
+    n_gt, n_pd = len(gt_coords), len(pd_coords)
+    # precision and recall are 1 for an empty prediction or ground truth
+    if n_gt == 0 or n_pd == 0:
+        return np.full(len(bound_pixes), float(n_gt == n_pd))
+
+    max_bound = float(np.max(bound_pixes))
+    gt_dists = np.sort(nearest_distances(gt_coords, pd_coords, max_bound))
+    pd_dists = np.sort(nearest_distances(pd_coords, gt_coords, max_bound))
+    precision = np.searchsorted(pd_dists, bound_pixes, side="right") / n_pd
+    recall = np.searchsorted(gt_dists, bound_pixes, side="right") / n_gt
 
     # Compute F measure
-    if precision + recall == 0:
-        f_score = 0.0
-    else:
-        f_score = 2.0 * precision * recall / (precision + recall)
+    with np.errstate(invalid="ignore"):
+        f_scores: np.ndarray = np.where(
+            precision + recall == 0,
+            0.0,
+            2.0 * precision * recall / (precision + recall),
+        )
+    return f_scores
 
-    return f_score
+
+def eval_lane_per_threshold(
+    gt_mask: np.ndarray, pd_mask: np.ndarray, bound_th: float = 0.008
+) -> float:
+    """Compute mean,recall and decay from per-threshold evaluation."""
+    bound_pixes = get_bound_pixels([bound_th], gt_mask.shape)
+    return float(
+        eval_lane_per_class(
+            skeleton_coords(gt_mask), skeleton_coords(pd_mask), bound_pixes
+        )[0]
+    )
 
 
 def get_lane_class(
@@ -146,11 +200,16 @@ def lane_class_func(
 
 
 get_foreground = partial(get_lane_class, value=0, offset=3, width=1)
-sub_task_funcs = dict(
-    direction=lane_class_func(5, 1),
-    style=lane_class_func(4, 1),
-    category=lane_class_func(0, 3),
+# offset and width of the field of each sub task
+sub_task_fields: Dict[str, Tuple[int, int]] = dict(
+    direction=(5, 1),
+    style=(4, 1),
+    category=(0, 3),
 )
+sub_task_funcs = {
+    task_name: lane_class_func(offset, width)
+    for task_name, (offset, width) in sub_task_fields.items()
+}
 sub_task_cats: Dict[str, List[str]] = dict(
     direction=[label.name for label in lane_directions],
     style=[label.name for label in lane_styles],
@@ -158,59 +217,342 @@ sub_task_cats: Dict[str, List[str]] = dict(
 )
 
 
+def field_lut(offset: int, width: int) -> np.ndarray:
+    """Map each byte value to the value of a field, or the background."""
+    byte_values = np.arange(1 << 8)
+    lut = (byte_values >> offset) & ((1 << width) - 1)
+    lut[(byte_values >> 3) & 1 == 1] = NO_CLASS
+    return lut.astype(np.uint8)
+
+
+sub_task_luts: Dict[str, np.ndarray] = {
+    task_name: field_lut(offset, width)
+    for task_name, (offset, width) in sub_task_fields.items()
+}
+
+
+def lane_skeleton_coords(byte: np.ndarray) -> List[np.ndarray]:
+    """Get the skeleton coordinates of each class of each sub task in order.
+
+    The pixels of each class are counted from a single histogram of the
+    byte values, so the empty classes are skipped up front. The field of a
+    sub task is only decoded into a plane if it has a nonempty class, and
+    the masks of its classes are then compared with the plane.
+    """
+    assert byte.dtype == "uint8"
+    byte_counts = np.bincount(byte.reshape(-1), minlength=1 << 8)
+    coords = []
+    for task_name, lut in sub_task_luts.items():
+        num_cats = len(sub_task_cats[task_name])
+        class_counts = np.bincount(
+            lut, weights=byte_counts, minlength=NO_CLASS + 1
+        )[:num_cats]
+        plane = lut[byte] if class_counts.any() else None
+        for value in range(num_cats):
+            if plane is None or class_counts[value] == 0:
+                coords.append(np.zeros((0, 2), dtype=np.uint16))
+                continue
+            coords.append(skeleton_coords(plane == value))
+    return coords
+
+
 def eval_lane_per_frame(
-    gt_file: str, pred_file: str, bound_ths: List[float]
+    gt_file: str,
+    pred_file: str,
+    bound_ths: List[float],
+    gt_coords: Optional[List[np.ndarray]] = None,
 ) -> Dict[str, np.ndarray]:
-    """Compute mean,recall and decay from per-frame evaluation."""
+    """Compute mean,recall and decay from per-frame evaluation.
+
+    `gt_coords` are the compiled ground truth skeletons of the frame, if
+    any, in which case the ground truth file is not read.
+    """
+    pred_byte = load_mask(pred_file)
+    if gt_coords is None:
+        gt_coords = lane_skeleton_coords(load_mask(gt_file))
+    return eval_lane_coords(
+        gt_coords,
+        lane_skeleton_coords(pred_byte),
+        get_bound_pixels(bound_ths, pred_byte.shape),
+    )
+
+
+def eval_lane_coords(
+    gt_coords: List[np.ndarray],
+    pd_coords: List[np.ndarray],
+    bound_pixes: np.ndarray,
+) -> Dict[str, np.ndarray]:
+    """Compute the F-scores of the skeletons of each class of a frame."""
     task2arr: Dict[str, np.ndarray] = dict()  # str -> 2d array
-    gt_byte = np.asarray(Image.open(gt_file))
-    pred_byte = np.asarray(Image.open(pred_file))
-    gt_foreground = get_foreground(gt_byte)
-    pd_foreground = get_foreground(pred_byte)
-
-    for task_name, class_func in sub_task_funcs.items():
-        task_scores: List[List[float]] = []
-        for value in range(len(sub_task_cats[task_name])):
-            gt_mask = class_func(gt_byte, value) & gt_foreground
-            pd_mask = class_func(pred_byte, value) & pd_foreground
-            cat_scores = [
-                eval_lane_per_threshold(gt_mask, pd_mask, bound_th)
-                for bound_th in bound_ths
-            ]
-            task_scores.append(cat_scores)
+    class_ind = 0
+    for task_name, cats in sub_task_cats.items():
+        task_scores: List[np.ndarray] = []
+        for _ in cats:
+            task_scores.append(
+                eval_lane_per_class(
+                    gt_coords[class_ind], pd_coords[class_ind], bound_pixes
+                )
+            )
+            class_ind += 1
         task2arr[task_name] = np.array(task_scores)
 
     return task2arr
 
 
+def hash_masks(mask_files: List[str]) -> str:
+    """Hash the contents of mask files, decoding those in archives."""
+    digests = []
+    for mask_file in mask_files:
+        if osp.isfile(mask_file):
+            digests.append(hash_file(mask_file))
+        else:
+            mask = load_mask(mask_file)
+            digests.append(
+                hash_content(
+                    hashlib.sha1(mask.tobytes()).hexdigest(),
+                    mask.shape,
+                    mask.dtype.str,
+                )
+            )
+    return hash_content(digests)
+
+
+def gt_cache_path(gt_dir: str, cache_dir: str) -> str:
+    """Path of the compiled skeletons of a ground truth folder.
+
+    The cache is keyed by the folder and the content of its masks, so it is
+    compiled again when any of them is changed.
+    """
+    gt_files = list_masks(gt_dir)
+    digest = hash_content(
+        osp.abspath(gt_dir),
+        gt_files,
+        hash_masks([osp.join(gt_dir, gt_file) for gt_file in gt_files]),
+    )
+    return osp.join(cache_dir, GT_CACHE_NAME.format(digest))
+
+
+def compile_gt_file(gt_file: str) -> Tuple[Tuple[int, ...], List[np.ndarray]]:
+    """Compile the skeleton coordinates of a ground truth file."""
+    gt_byte = load_mask(gt_file)
+    return gt_byte.shape, lane_skeleton_coords(gt_byte)
+
+
+def compile_gt_skeletons(gt_dir: str, cache_path: str, nproc: int = 4) -> None:
+    """Compile the ground truth skeletons of a folder into an indexed file.
+
+    The coordinates of all the skeletons are concatenated, and the ones of
+    the j-th class of the i-th mask are between `offsets[i * num_classes +
+    j]` and `offsets[i * num_classes + j + 1]`.
+    """
+    gt_files = list_masks(gt_dir)
+    with Pool(nproc) as pool:
+        compiled = pool.map(
+            compile_gt_file,
+            tqdm([osp.join(gt_dir, gt_file) for gt_file in gt_files]),
+        )
+    coords = [
+        class_coords for _, coords in compiled for class_coords in coords
+    ]
+    os.makedirs(osp.dirname(osp.abspath(cache_path)), exist_ok=True)
+    tmp_path = cache_path + ".tmp.npz"
+    np.savez_compressed(
+        tmp_path,
+        names=np.array(gt_files),
+        shapes=np.array([shape for shape, _ in compiled]).reshape(-1, 2),
+        offsets=np.cumsum([0] + [len(c) for c in coords]),
+        coords=np.concatenate(coords).reshape(-1, 2),
+    )
+    os.replace(tmp_path, cache_path)
+
+
+def load_gt_skeletons(cache_path: str) -> Dict[str, List[np.ndarray]]:
+    """Load the compiled skeleton coordinates of each ground truth mask."""
+    num_classes = sum(len(cats) for cats in sub_task_cats.values())
+    with np.load(cache_path) as compiled:
+        names, offsets = compiled["names"], compiled["offsets"]
+        coords = np.split(compiled["coords"], offsets[1:-1])
+    return {
+        str(name): coords[i * num_classes : (i + 1) * num_classes]
+        for i, name in enumerate(names)
+    }
+
+
+class FrameResult(NamedTuple):
+    """F-scores of each sub task of a frame.
+
+    `present` tells whether each class is in the ground truth or the
+    prediction of the frame.
+    """
+
+    name: str
+    task2arr: Dict[str, np.ndarray]
+    present: np.ndarray
+
+
+def eval_lane_chunk(
+    frames: List[Tuple[str, str, List[str], Optional[List[np.ndarray]]]],
+    bound_ths: List[float],
+    with_frames: bool = False,
+) -> Tuple[List[Dict[str, np.ndarray]], int, List[List[FrameResult]]]:
+    """Sum the F-scores of a chunk of frames for each result folder.
+
+    The frames are tuples of the frame name, the ground truth file, the
+    prediction file of each result, and the compiled ground truth skeletons.
+    The ground truth of a frame is only skeletonized once for all the
+    results. The F-scores of each frame are only returned if `with_frames`
+    is set.
+    """
+    num_results = len(frames[0][2])
+    task2sums: List[Dict[str, np.ndarray]] = [
+        {
+            task_name: np.zeros((len(cats), len(bound_ths)))
+            for task_name, cats in sub_task_cats.items()
+        }
+        for _ in range(num_results)
+    ]
+    frame_results: List[List[FrameResult]] = [[] for _ in range(num_results)]
+    for name, gt_file, pred_files, gt_coords in frames:
+        if gt_coords is None:
+            gt_coords = lane_skeleton_coords(load_mask(gt_file))
+        for i, pred_file in enumerate(pred_files):
+            pred_byte = load_mask(pred_file)
+            pd_coords = lane_skeleton_coords(pred_byte)
+            task2arr = eval_lane_coords(
+                gt_coords,
+                pd_coords,
+                get_bound_pixels(bound_ths, pred_byte.shape),
+            )
+            for task_name, arr2d in task2arr.items():
+                task2sums[i][task_name] += arr2d
+            if with_frames:
+                present = np.array(
+                    [
+                        len(gt) > 0 or len(pd) > 0
+                        for gt, pd in zip(gt_coords, pd_coords)
+                    ]
+                )
+                frame_results[i].append(FrameResult(name, task2arr, present))
+    return task2sums, len(frames), frame_results
+
+
+def frame_json(result: FrameResult) -> str:
+    """Dump the F-scores of a frame as a JSON line."""
+    return json.dumps(
+        dict(
+            name=result.name,
+            **{
+                task_name: arr2d.tolist()
+                for task_name, arr2d in result.task2arr.items()
+            },
+        )
+    )
+
+
+def save_lane_breakdown(
+    image_file: str,
+    frame_results: List[FrameResult],
+    bound_ths: List[float],
+    worst_k: int = WORST_K,
+) -> None:
+    """Save the F-scores of each class of each frame.
+
+    The frames are ranked by the F-scores averaged over the thresholds.
+    """
+    frame_results = sorted(frame_results, key=lambda result: result.name)
+    num_classes = sum(len(cats) for cats in sub_task_cats.values())
+    f_scores = np.array(
+        [
+            np.concatenate(list(result.task2arr.values()))
+            for result in frame_results
+        ],
+        dtype=np.float32,
+    ).reshape(len(frame_results), num_classes, len(bound_ths))
+    present = np.array(
+        [result.present for result in frame_results], dtype=bool
+    ).reshape(len(frame_results), num_classes)
+    save_breakdown(
+        image_file,
+        [result.name for result in frame_results],
+        [
+            "{}_{}".format(task_name, cat_name.replace(" ", "_"))
+            for task_name, cats in sub_task_cats.items()
+            for cat_name in cats
+        ],
+        np.where(present, f_scores.mean(axis=2), np.nan),
+        worst_k,
+        f_scores=f_scores,
+        present=present,
+        bound_ths=np.array(bound_ths),
+    )
+
+
 def merge_results(
-    task2arr_list: List[Dict[str, np.ndarray]]
+    task2sum: Dict[str, np.ndarray], num_frames: int
 ) -> Dict[str, np.ndarray]:
-    """Merge F-score results from all images."""
+    """Merge the summed F-scores of all images.
+
+    The sums may have leading axes, e.g., over bootstrap replicates, before
+    the axes of the classes and the thresholds.
+    """
     task2arr: Dict[str, np.ndarray] = {
-        task_name: np.stack(
-            [task2arr_img[task_name] for task2arr_img in task2arr_list]
-        ).mean(axis=0)
+        task_name: task2sum[task_name] / max(num_frames, 1)
         for task_name in sub_task_cats
     }
 
     for task_name, arr2d in task2arr.items():
         arr2d *= 100
-        arr_mean = arr2d.mean(axis=0, keepdims=True)
-        task2arr[task_name] = np.concatenate([arr_mean, arr2d], axis=0)
+        arr_mean = arr2d.mean(axis=-2, keepdims=True)
+        task2arr[task_name] = np.concatenate([arr_mean, arr2d], axis=-2)
 
-    avg_arr = np.stack([arr2d[-1] for arr2d in task2arr.values()])
-    task2arr[TOTAL] = avg_arr.mean(axis=0, keepdims=True)
+    avg_arr = np.stack(
+        [arr2d[..., -1, :] for arr2d in task2arr.values()], axis=-2
+    )
+    task2arr[TOTAL] = avg_arr.mean(axis=-2, keepdims=True)
 
     return task2arr
 
 
+def bootstrap_results(
+    frame_scores: np.ndarray,
+    num_replicates: int,
+    strata: Optional[List[str]] = None,
+) -> Tuple[Dict[str, np.ndarray], Dict[str, np.ndarray], np.ndarray]:
+    """Compute the confidence intervals of the merged F-scores.
+
+    The F-scores of each class of each frame are stacked as an array of
+    shape (frames, classes, thresholds), and the frames are resampled
+    within their `strata`, if any. Returns the lower and the upper bounds
+    of the merged F-scores, and of their average.
+    """
+    sums = bootstrap_sums(frame_scores, num_replicates, strata=strata)
+    task2sum: Dict[str, np.ndarray] = {}
+    class_ind = 0
+    for task_name, cats in sub_task_cats.items():
+        task2sum[task_name] = sums[:, class_ind : class_ind + len(cats)]
+        class_ind += len(cats)
+    task2reps = merge_results(task2sum, len(frame_scores))
+    task2lower, task2upper = {}, {}
+    for task_name, reps in task2reps.items():
+        task2lower[task_name], task2upper[task_name] = confidence_interval(
+            reps
+        )
+    average = np.stack(confidence_interval(task2reps[TOTAL].mean(axis=(1, 2))))
+    return task2lower, task2upper, average
+
+
 def create_table(
     task2arr: Dict[str, np.ndarray],
     all_task_cats: Dict[str, List[str]],
     bound_ths: List[float],
+    task2ci: Optional[
+        Tuple[Dict[str, np.ndarray], Dict[str, np.ndarray]]
+    ] = None,
 ) -> None:
-    """Render the evaluation results."""
+    """Render the evaluation results.
+
+    The confidence intervals in `task2ci`, if any, follow the F-scores.
+    """
     table = []
     headers = ["task", "class"] + [str(th) for th in bound_ths]
     for task_name in sorted(sub_task_cats.keys()) + [TOTAL]:
@@ -226,7 +568,16 @@ def create_table(
         for j in range(len(bound_ths)):
             num_list = []
             for i in range(len(all_task_cats[task_name])):
-                num_list.append("{:.1f}".format(arr2d[i, j]))
+                if task2ci is None:
+                    num_list.append("{:.1f}".format(arr2d[i, j]))
+                else:
+                    num_list.append(
+                        "{:.1f} [{:.1f}, {:.1f}]".format(
+                            arr2d[i, j],
+                            task2ci[0][task_name][i, j],
+                            task2ci[1][task_name][i, j],
+                        )
+                    )
             num_str = "\n".join(num_list)
             num_strs.append(num_str)
 
@@ -254,25 +605,263 @@ def render_results(
     return f_score_dict
 
 
-def evaluate_lane_marking(
-    gt_dir: str, pred_dir: str, bound_ths: List[float], nproc: int = 4
-) -> Dict[str, float]:
-    """Evaluate F-score for lane marking from input folders."""
-    gt_files = list_files(gt_dir, ".png", with_prefix=True)
-    pred_files = list_files(pred_dir, ".png", with_prefix=True)
+class LaneEvaluator(ArrayEvaluator[Dict[str, np.ndarray], Dict[str, float]]):
+    """Accumulate the F-scores of lane marking results.
+
+    With `num_replicates` bootstrap replicates, the F-scores of each frame
+    are also kept, to compute their confidence intervals. The frames are
+    resampled within their `strata`, if any, e.g., for a stratified sample.
+    """
+
+    def __init__(
+        self,
+        bound_ths: List[float],
+        num_threads: int = 0,
+        num_replicates: int = 0,
+        strata: Optional[Dict[str, str]] = None,
+    ) -> None:
+        """Initialize the sums of the F-scores for the thresholds."""
+        super().__init__(num_threads)
+        self.bound_ths = bound_ths
+        self.task2sum: Dict[str, np.ndarray] = {
+            task_name: np.zeros((len(cats), len(bound_ths)))
+            for task_name, cats in sub_task_cats.items()
+        }
+        self.num_frames = 0
+        self.num_replicates = num_replicates
+        self.frame_names: List[str] = []
+        self.frame_scores: List[np.ndarray] = []
+        self.strata = strata
+
+    def add(self, task2sum: Dict[str, np.ndarray], num_frames: int) -> None:
+        """Add the summed F-scores of some frames."""
+        for task_name, arr2d in task2sum.items():
+            self.task2sum[task_name] += arr2d
+        self.num_frames += num_frames
+
+    def keep(
+        self, name: Optional[str], task2arr: Dict[str, np.ndarray]
+    ) -> None:
+        """Keep the F-scores of a frame added to the sums, if needed."""
+        if self.num_replicates > 0:
+            self.frame_names.append("" if name is None else name)
+            self.frame_scores.append(
+                np.concatenate([task2arr[task] for task in sub_task_cats])
+            )
+
+    def process(
+        self, gt_byte: np.ndarray, pred_byte: np.ndarray
+    ) -> Dict[str, np.ndarray]:
+        """Compute the F-scores of the lane bytes of a frame."""
+        return eval_lane_coords(
+            lane_skeleton_coords(gt_byte),
+            lane_skeleton_coords(pred_byte),
+            get_bound_pixels(self.bound_ths, pred_byte.shape),
+        )
 
-    with Pool(nproc) as pool:
-        task2arr_list = pool.starmap(
-            partial(eval_lane_per_frame, bound_ths=bound_ths),
-            tqdm(zip(gt_files, pred_files), total=len(gt_files)),
+    def update(self, gt_byte: np.ndarray, pred_byte: np.ndarray) -> None:
+        """Evaluate the lane bytes of a frame."""
+        self.submit(partial(self.process, gt_byte, pred_byte))
+
+    def accumulate(self, stats: Dict[str, np.ndarray]) -> None:
+        """Add the F-scores of a frame."""
+        self.add(stats, 1)
+        self.keep(None, stats)
+
+    def compute(self) -> Dict[str, float]:
+        """Compute the mean F-scores of the frames."""
+        self.sync()
+        task2arr = merge_results(self.task2sum, self.num_frames)
+        all_task_cats = {
+            task_name: cats + [AVG]
+            for task_name, cats in sub_task_cats.items()
+        }
+        all_task_cats.update({TOTAL: [AVG]})
+
+        if self.num_replicates == 0 or not self.frame_scores:
+            create_table(task2arr, all_task_cats, self.bound_ths)
+            return render_results(task2arr, all_task_cats, self.bound_ths)
+
+        assert len(self.frame_scores) == self.num_frames
+        order = np.argsort(np.array(self.frame_names), kind="stable")
+        task2lower, task2upper, average = bootstrap_results(
+            np.stack([self.frame_scores[i] for i in order]),
+            self.num_replicates,
+            (
+                [self.strata.get(self.frame_names[i], "") for i in order]
+                if self.strata is not None
+                else None
+            ),
+        )
+        create_table(
+            task2arr,
+            all_task_cats,
+            self.bound_ths,
+            (task2lower, task2upper),
         )
-    task2arr = merge_results(task2arr_list)
+        f_score_dict = render_results(task2arr, all_task_cats, self.bound_ths)
+        for suffix, task2bound in [
+            ("_lower", task2lower),
+            ("_upper", task2upper),
+        ]:
+            for key, value in render_results(
+                task2bound, all_task_cats, self.bound_ths
+            ).items():
+                f_score_dict[key + suffix] = value
+        f_score_dict["average_lower"], f_score_dict["average_upper"] = average
+        print(
+            "average: {:.1f} [{:.1f}, {:.1f}]".format(
+                f_score_dict["average"], *average
+            )
+        )
+        return f_score_dict
 
-    all_task_cats = sub_task_cats.copy()
-    for cats in all_task_cats.values():
-        cats.append(AVG)
-    all_task_cats.update({TOTAL: [AVG]})
 
-    create_table(task2arr, all_task_cats, bound_ths)
-    f_score_dict = render_results(task2arr, all_task_cats, bound_ths)
-    return f_score_dict
+def evaluate_lane_marking(
+    gt_dir: str,
+    pred_dir: str,
+    bound_ths: List[float],
+    nproc: int = 4,
+    cache_dir: Optional[str] = None,
+    frame_file: Optional[str] = None,
+    image_file: Optional[str] = None,
+    worst_k: int = WORST_K,
+    num_replicates: int = 0,
+    sample: Optional[Dict[str, str]] = None,
+) -> Dict[str, float]:
+    """Evaluate F-score for lane marking from input folders.
+
+    If `cache_dir` is given, the ground truth skeletons are compiled there
+    once and loaded by the later evaluations of the same ground truth.
+
+    The workers sum the F-scores of chunks of `CHUNK_SIZE` frames, which are
+    merged as they arrive. If `frame_file` is given, the F-scores of each
+    frame are also written there as JSON lines, in the order of completion.
+    If `image_file` is given, they are saved there as columns instead, with
+    the `worst_k` frames of each class. With `num_replicates` bootstrap
+    replicates over the frames, the 95% confidence intervals of the
+    F-scores are also reported. If a `sample` of the frames is given with
+    their strata, only those frames are evaluated, and resampled within
+    their strata.
+    """
+    return evaluate_lane_marking_dirs(
+        gt_dir,
+        [pred_dir],
+        bound_ths,
+        nproc,
+        cache_dir,
+        [frame_file] if frame_file is not None else None,
+        [image_file] if image_file is not None else None,
+        worst_k,
+        num_replicates,
+        sample,
+    )[0]
+
+
+def evaluate_lane_marking_dirs(
+    gt_dir: str,
+    pred_dirs: List[str],
+    bound_ths: List[float],
+    nproc: int = 4,
+    cache_dir: Optional[str] = None,
+    frame_files: Optional[List[str]] = None,
+    image_files: Optional[List[str]] = None,
+    worst_k: int = WORST_K,
+    num_replicates: int = 0,
+    sample: Optional[Dict[str, str]] = None,
+) -> List[Dict[str, float]]:
+    """Evaluate F-score for lane marking of several result folders at once.
+
+    Each ground truth frame is only read and skeletonized once for all the
+    results. `frame_files` and `image_files` are the per-frame JSON lines
+    and columnar files of the results, if any. With a `sample`, only its
+    frames have to be in the result folders.
+    """
+    gt_names = list_masks(gt_dir)
+    if sample is None:
+        gt_files = list_masks(gt_dir, with_prefix=True)
+        pred_files = []
+        for pred_dir in pred_dirs:
+            assert list_masks(pred_dir) == gt_names
+            pred_files.append(list_masks(pred_dir, with_prefix=True))
+    else:
+        assert set(sample) <= set(gt_names)
+        gt_names = list(sample)
+        gt_files = [osp.join(gt_dir, name) for name in gt_names]
+        pred_files = []
+        for pred_dir in pred_dirs:
+            assert set(sample) <= set(list_masks(pred_dir))
+            pred_files.append([osp.join(pred_dir, name) for name in gt_names])
+    assert frame_files is None or len(frame_files) == len(pred_dirs)
+    assert image_files is None or len(image_files) == len(pred_dirs)
+
+    gt_coords: List[Optional[List[np.ndarray]]] = [None] * len(gt_files)
+    if cache_dir is not None:
+        cache_path = gt_cache_path(gt_dir, cache_dir)
+        if not osp.exists(cache_path):
+            compile_gt_skeletons(gt_dir, cache_path, nproc)
+        compiled = load_gt_skeletons(cache_path)
+        gt_coords = [compiled[gt_name] for gt_name in gt_names]
+
+    frames = list(
+        zip(
+            gt_names,
+            gt_files,
+            [list(files) for files in zip(*pred_files)],
+            gt_coords,
+        )
+    )
+    chunks = [
+        frames[i : i + CHUNK_SIZE] for i in range(0, len(frames), CHUNK_SIZE)
+    ]
+    evaluators = [
+        LaneEvaluator(bound_ths, num_replicates=num_replicates, strata=sample)
+        for _ in pred_dirs
+    ]
+    all_frame_results: List[List[FrameResult]] = [[] for _ in pred_dirs]
+    with ExitStack() as stack:
+        fps = (
+            [
+                stack.enter_context(open(frame_file, "w", encoding="utf-8"))
+                for frame_file in frame_files
+            ]
+            if frame_files is not None
+            else None
+        )
+        pool = stack.enter_context(Pool(nproc))
+        with tqdm(total=len(frames)) as pbar:
+            for chunk_sums, chunk_frames, frame_results in pool.imap_unordered(
+                partial(
+                    eval_lane_chunk,
+                    bound_ths=bound_ths,
+                    with_frames=fps is not None
+                    or image_files is not None
+                    or num_replicates > 0,
+                ),
+                chunks,
+            ):
+                for evaluator, chunk_sum in zip(evaluators, chunk_sums):
+                    evaluator.add(chunk_sum, chunk_frames)
+                for evaluator, pred_results in zip(evaluators, frame_results):
+                    for result in pred_results:
+                        evaluator.keep(result.name, result.task2arr)
+                if fps is not None:
+                    for fp, pred_results in zip(fps, frame_results):
+                        for result in pred_results:
+                            fp.write(frame_json(result) + "\n")
+                if image_files is not None:
+                    for frame_results_, chunk_results in zip(
+                        all_frame_results, frame_results
+                    ):
+                        frame_results_.extend(chunk_results)
+                pbar.update(chunk_frames)
+    if image_files is not None:
+        for image_file, frame_results_ in zip(image_files, all_frame_results):
+            save_lane_breakdown(image_file, frame_results_, bound_ths, worst_k)
+
+    results = []
+    for pred_dir, evaluator in zip(pred_dirs, evaluators):
+        if len(pred_dirs) > 1:
+            print("Results of {}".format(pred_dir))
+        results.append(evaluator.compute())
+    return results
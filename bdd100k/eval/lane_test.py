@@ -1,17 +1,29 @@
 """Test cases for lane.py."""
+
+import json
 import os
+import shutil
 import unittest
 from typing import Dict
 
 import numpy as np
 
+from ..common.mask_io import MaskArchive, list_masks, load_mask, save_shard
 from .lane import (
+    LaneEvaluator,
+    eval_lane_per_class,
     eval_lane_per_threshold,
     evaluate_lane_marking,
+    evaluate_lane_marking_dirs,
     get_foreground,
     get_lane_class,
+    gt_cache_path,
+    hash_masks,
+    load_gt_skeletons,
+    skeleton_coords,
     sub_task_funcs,
 )
+from .sample import sample_images
 
 
 class TestGetLaneClass(unittest.TestCase):
@@ -77,10 +89,32 @@ class TestEvalLanePerThreshold(unittest.TestCase):
         self.assertAlmostEqual(eval_lane_per_threshold(a, b, 4), 0.70588235)
         self.assertAlmostEqual(eval_lane_per_threshold(a, b, 5), 1.0)
 
+    def test_all_thresholds(self) -> None:
+        """Check the F-scores of all thresholds are computed at once."""
+        a = np.zeros((10, 10), dtype=bool)
+        b = np.zeros((10, 10), dtype=bool)
+        a[3, 3:6] = True
+        b[5:8, 7] = True
+
+        a_coords, b_coords = skeleton_coords(a), skeleton_coords(b)
+        self.assertEqual(a_coords.tolist(), [[3, 3], [3, 4], [3, 5]])
+        f_scores = eval_lane_per_class(
+            a_coords, b_coords, np.array([2, 3, 4, 5])
+        )
+        for f_score, gt_f_score in zip(f_scores, [0.0, 1 / 3, 2 / 3, 1.0]):
+            self.assertAlmostEqual(f_score, gt_f_score)
+        empty = skeleton_coords(np.zeros_like(b))
+        f_scores = eval_lane_per_class(a_coords, empty, np.array([2, 3]))
+        self.assertEqual(f_scores.tolist(), [0.0, 0.0])
+        f_scores = eval_lane_per_class(empty, empty, np.array([2, 3]))
+        self.assertEqual(f_scores.tolist(), [1.0, 1.0])
+
 
 class TestEvaluateLaneMarking(unittest.TestCase):
     """Test cases for the evaluate_lane_marking function."""
 
+    test_out = "./test_lane_cache"
+
     def test_mock_cases(self) -> None:
         """Check the peformance of the mock case."""
         cur_dir = os.path.dirname(os.path.abspath(__file__))
@@ -125,6 +159,180 @@ class TestEvaluateLaneMarking(unittest.TestCase):
         for key, val in gt_f_scores.items():
             self.assertAlmostEqual(val, f_scores[key])
 
+    def test_gt_cache(self) -> None:
+        """Check the compiled ground truth gives the same scores."""
+        cur_dir = os.path.dirname(os.path.abspath(__file__))
+        gt_dir = "{}/testcases/lane/gts".format(cur_dir)
+        res_dir = "{}/testcases/lane/res".format(cur_dir)
+        f_scores = evaluate_lane_marking(gt_dir, res_dir, bound_ths=[1, 2])
+
+        cache_path = gt_cache_path(gt_dir, self.test_out)
+        for _ in range(2):
+            cached_f_scores = evaluate_lane_marking(
+                gt_dir, res_dir, bound_ths=[1, 2], cache_dir=self.test_out
+            )
+            self.assertTrue(os.path.exists(cache_path))
+            for key, val in f_scores.items():
+                self.assertAlmostEqual(val, cached_f_scores[key])
+        self.assertEqual(len(load_gt_skeletons(cache_path)), 4)
+
+    def test_hash_masks(self) -> None:
+        """Check the masks in archives are hashed with their shapes."""
+        masks = [
+            np.zeros((2, 6), dtype=np.uint8),
+            np.zeros((3, 4), dtype=np.uint8),
+        ]
+        mask_files = []
+        for i, mask in enumerate(masks):
+            out_base = os.path.join(self.test_out, str(i))
+            os.makedirs(out_base, exist_ok=True)
+            archive = MaskArchive(out_base, "npz")
+            shard = archive.next_shard()
+            save_shard(os.path.join(out_base, shard), [mask], "npz")
+            mask_files.append(os.path.join(out_base, "a.png"))
+            archive.update(shard, mask_files[-1:])
+            archive.save()
+        self.assertEqual(
+            hash_masks(mask_files[:1]), hash_masks(mask_files[:1])
+        )
+        self.assertNotEqual(
+            hash_masks(mask_files[:1]), hash_masks(mask_files[1:])
+        )
+
+    def test_frame_file(self) -> None:
+        """Check the per-frame F-scores average to the overall ones."""
+        cur_dir = os.path.dirname(os.path.abspath(__file__))
+        gt_dir = "{}/testcases/lane/gts".format(cur_dir)
+        res_dir = "{}/testcases/lane/res".format(cur_dir)
+        os.makedirs(self.test_out, exist_ok=True)
+        frame_file = os.path.join(self.test_out, "frames.jsonl")
+        f_scores = evaluate_lane_marking(
+            gt_dir, res_dir, bound_ths=[1, 2], frame_file=frame_file
+        )
+        with open(frame_file, encoding="utf-8") as fp:
+            frames = [json.loads(line) for line in fp]
+        self.assertEqual(
+            sorted(frame["name"] for frame in frames), list_masks(gt_dir)
+        )
+        # the first row of a task is the mean of its classes
+        direction = np.mean([frame["direction"] for frame in frames], axis=0)
+        self.assertAlmostEqual(
+            f_scores["1.0_direction_parallel"], direction[:, 0].mean() * 100
+        )
+        self.assertAlmostEqual(
+            f_scores["2.0_direction_parallel"], direction[:, 1].mean() * 100
+        )
+
+    def test_evaluator(self) -> None:
+        """Check the array evaluator matches the folder evaluation."""
+        cur_dir = os.path.dirname(os.path.abspath(__file__))
+        gt_dir = "{}/testcases/lane/gts".format(cur_dir)
+        res_dir = "{}/testcases/lane/res".format(cur_dir)
+        f_scores = evaluate_lane_marking(gt_dir, res_dir, bound_ths=[1, 2])
+
+        for num_threads in [0, 2]:
+            with LaneEvaluator([1, 2], num_threads) as evaluator:
+                for name in list_masks(gt_dir):
+                    evaluator.update(
+                        load_mask(os.path.join(gt_dir, name)),
+                        load_mask(os.path.join(res_dir, name)),
+                    )
+                array_f_scores = evaluator.compute()
+            for key, val in f_scores.items():
+                self.assertAlmostEqual(val, array_f_scores[key])
+
+    def test_several_results(self) -> None:
+        """Check several results are evaluated like one by one."""
+        cur_dir = os.path.dirname(os.path.abspath(__file__))
+        gt_dir = "{}/testcases/lane/gts".format(cur_dir)
+        res_dir = "{}/testcases/lane/res".format(cur_dir)
+        results = evaluate_lane_marking_dirs(
+            gt_dir, [res_dir, gt_dir], bound_ths=[1, 2]
+        )
+        self.assertEqual(len(results), 2)
+        for pred_dir, result in zip([res_dir, gt_dir], results):
+            f_scores = evaluate_lane_marking(gt_dir, pred_dir, [1, 2])
+            for key, val in f_scores.items():
+                self.assertAlmostEqual(val, result[key])
+
+    def test_image_file(self) -> None:
+        """Check the per-frame F-scores are saved as columns."""
+        cur_dir = os.path.dirname(os.path.abspath(__file__))
+        gt_dir = "{}/testcases/lane/gts".format(cur_dir)
+        res_dir = "{}/testcases/lane/res".format(cur_dir)
+        os.makedirs(self.test_out, exist_ok=True)
+        frame_file = os.path.join(self.test_out, "frames.jsonl")
+        image_file = os.path.join(self.test_out, "images.npz")
+        evaluate_lane_marking(
+            gt_dir,
+            res_dir,
+            bound_ths=[1, 2],
+            frame_file=frame_file,
+            image_file=image_file,
+            worst_k=2,
+        )
+        with open(frame_file, encoding="utf-8") as fp:
+            frames = {frame["name"]: frame for frame in map(json.loads, fp)}
+        with np.load(image_file) as breakdown:
+            names = breakdown["names"].tolist()
+            self.assertEqual(names, list_masks(gt_dir))
+            self.assertEqual(breakdown["f_scores"].shape, (len(names), 12, 2))
+            self.assertEqual(breakdown["worst"].shape, (12, 2))
+            for name, f_scores in zip(names, breakdown["f_scores"]):
+                self.assertTrue(
+                    np.allclose(f_scores[:2], frames[name]["direction"])
+                )
+
+    def test_bootstrap(self) -> None:
+        """Check the confidence intervals cover the point estimates."""
+        cur_dir = os.path.dirname(os.path.abspath(__file__))
+        gt_dir = "{}/testcases/lane/gts".format(cur_dir)
+        res_dir = "{}/testcases/lane/res".format(cur_dir)
+        f_scores = evaluate_lane_marking(gt_dir, res_dir, bound_ths=[1, 2])
+        f_scores_ci = evaluate_lane_marking(
+            gt_dir, res_dir, bound_ths=[1, 2], num_replicates=100
+        )
+        with LaneEvaluator([1, 2], num_replicates=100) as evaluator:
+            for name in list_masks(gt_dir):
+                evaluator.update(
+                    load_mask(os.path.join(gt_dir, name)),
+                    load_mask(os.path.join(res_dir, name)),
+                )
+            array_f_scores_ci = evaluator.compute()
+        for key, val in f_scores.items():
+            self.assertAlmostEqual(val, f_scores_ci[key])
+            self.assertLessEqual(f_scores_ci[key + "_lower"], val + 1e-6)
+            self.assertGreaterEqual(f_scores_ci[key + "_upper"], val - 1e-6)
+            for suffix in ["_lower", "_upper"]:
+                self.assertAlmostEqual(
+                    f_scores_ci[key + suffix], array_f_scores_ci[key + suffix]
+                )
+
+    def test_sample(self) -> None:
+        """Check only the frames of a sample are evaluated."""
+        cur_dir = os.path.dirname(os.path.abspath(__file__))
+        gt_dir = "{}/testcases/lane/gts".format(cur_dir)
+        res_dir = "{}/testcases/lane/res".format(cur_dir)
+        sample = sample_images(list_masks(gt_dir), 2)
+        f_scores = evaluate_lane_marking(
+            gt_dir, res_dir, bound_ths=[1, 2], sample=sample
+        )
+        with LaneEvaluator([1, 2]) as evaluator:
+            for name in sample:
+                evaluator.update(
+                    load_mask(os.path.join(gt_dir, name)),
+                    load_mask(os.path.join(res_dir, name)),
+                )
+            array_f_scores = evaluator.compute()
+        for key, val in array_f_scores.items():
+            self.assertAlmostEqual(val, f_scores[key])
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        """Remove the compiled ground truth."""
+        if os.path.exists(cls.test_out):
+            shutil.rmtree(cls.test_out)
+
 
 if __name__ == "__main__":
     unittest.main()
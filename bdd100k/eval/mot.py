@@ -0,0 +1,659 @@
+"""BDD100K tracking evaluation with CLEAR MOT and HOTA metrics.
+
+The events follow the accumulators of motmetrics: the correspondences of
+the previous frames are kept if they are still valid, the other objects and
+hypotheses are matched by a minimum cost assignment, and a match is a switch
+if its object was matched to another hypothesis before. Instead of logging
+the events in DataFrames, the matching state of each class is kept in NumPy
+arrays and the metrics are reduced from per-frame arrays once a video is
+done.
+
+HOTA [1] is computed in the same pass from the IoUs of each frame, as in
+TrackEval: the global alignment scores of the objects and hypotheses weight
+a per-frame assignment, which is then evaluated for each IoU threshold in
+`ALPHAS`.
+
+[1] Luiten, Jonathon, et al. "HOTA: A higher order metric for evaluating
+multi-object tracking." International Journal of Computer Vision 129.2
+(2021): 548-578.
+"""
+from functools import partial
+from multiprocessing import Pool
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple, TypeVar
+
+import numpy as np
+from scalabel.label.typing import Config, Frame, Label
+from scalabel.label.utils import (
+    check_crowd,
+    check_ignored,
+    get_leaf_categories,
+    get_parent_categories,
+)
+from scipy.optimize import linear_sum_assignment
+from tabulate import tabulate
+
+from ..common.logger import logger
+
+AVERAGE = "AVERAGE"
+OVERALL = "OVERALL"
+# the counts accumulated for each class of each video
+STATS = [
+    "num_objects",
+    "num_predictions",
+    "num_matches",
+    "num_switches",
+    "num_misses",
+    "num_false_positives",
+    "sum_distances",
+    "idtp",
+    "mostly_tracked",
+    "partially_tracked",
+    "mostly_lost",
+    "num_fragmentations",
+]
+# the IoU thresholds of HOTA and the counts accumulated for each of them
+ALPHAS = np.arange(0.05, 0.99, 0.05)
+HOTA_STATS = ["hota_tp", "hota_fn", "hota_fp", "sum_ass_ious", "sum_loc_ious"]
+EPS = np.finfo(np.float64).eps
+METRIC_MAPS = {
+    "MOTA": "mota",
+    "MOTP": "motp",
+    "IDF1": "idf1",
+    "HOTA": "hota",
+    "DetA": "deta",
+    "AssA": "assa",
+    "LocA": "loca",
+    "FP": "num_false_positives",
+    "FN": "num_misses",
+    "IDSw": "num_switches",
+    "MT": "mostly_tracked",
+    "PT": "partially_tracked",
+    "ML": "mostly_lost",
+    "FM": "num_fragmentations",
+}
+FLOAT_METRICS = ["MOTA", "MOTP", "IDF1", "HOTA", "DetA", "AssA", "LocA"]
+
+TrackResult = Dict[str, Dict[str, float]]
+# the frames of a video, e.g., their labels or the paths of their bitmasks
+FrameT = TypeVar("FrameT")
+VideoFunc = Callable[
+    [List[FrameT], List[FrameT], List[str], float, float],
+    List["MOTAccumulator"],
+]
+
+
+def linear_assignment(costs: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Minimum cost assignment, where the NaN costs can not be assigned.
+
+    The NaN costs are replaced by a constant larger than any assignment of
+    the finite costs, as motmetrics does, so the same pairs are chosen.
+    """
+    if costs.size == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    valid = np.isfinite(costs)
+    if not valid.any():
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    if not valid.all():
+        large_cost = 2 * min(costs.shape) * (np.abs(costs[valid]).max() + 1)
+        costs = np.where(valid, costs, large_cost + 1)
+    rows, cols = linear_sum_assignment(costs)
+    assigned = valid[rows, cols]
+    return rows[assigned], cols[assigned]
+
+
+class FrameEvents(NamedTuple):
+    """Matching events of the objects and hypotheses of a frame.
+
+    The objects are whether they are tracked, the pairs are the objects and
+    hypotheses with a finite distance, and the nonzero IoUs are given with
+    the appearance indices of their pairs, counted over all the frames.
+    """
+
+    objs: np.ndarray
+    tracked: np.ndarray
+    hyps: np.ndarray
+    pair_objs: np.ndarray
+    pair_hyps: np.ndarray
+    iou_obj_apps: np.ndarray
+    iou_hyp_apps: np.ndarray
+    ious: np.ndarray
+
+
+class MOTAccumulator:
+    """Accumulate the matching events of one class in one video."""
+
+    def __init__(self) -> None:
+        """Initialize the matching state."""
+        self.obj_inds: Dict[int, int] = {}
+        self.hyp_inds: Dict[int, int] = {}
+        # the last hypothesis matched to each object, -1 if never matched
+        self.last_hyps = np.zeros(0, dtype=np.int64)
+        self.num_switches = 0
+        self.sum_distances = 0.0
+        self.num_obj_apps = 0
+        self.num_hyp_apps = 0
+        self.frames: List[FrameEvents] = []
+
+    def __len__(self) -> int:
+        """Number of updated frames."""
+        return len(self.frames)
+
+    def events(self) -> FrameEvents:
+        """Concatenate the events of all the frames."""
+        return FrameEvents(
+            *(np.concatenate(column) for column in zip(*self.frames))
+        )
+
+    @staticmethod
+    def _indices(ids: np.ndarray, inds: Dict[int, int]) -> np.ndarray:
+        """Map the ids to the indices in the order they are first seen."""
+        return np.array(
+            [inds.setdefault(int(i), len(inds)) for i in ids], dtype=np.int64
+        )
+
+    def update(
+        self,
+        obj_ids: np.ndarray,
+        hyp_ids: np.ndarray,
+        distances: np.ndarray,
+        ious: Optional[np.ndarray] = None,
+    ) -> None:
+        """Match the objects and hypotheses of a frame.
+
+        NaN distances mark the pairs that can not be matched. The hypothesis
+        ids are expected to be unique in each frame. The IoUs for HOTA are
+        1 - distances of the pairs that can be matched if not given.
+        """
+        objs = self._indices(obj_ids, self.obj_inds)
+        hyps = self._indices(hyp_ids, self.hyp_inds)
+        distances = distances.reshape(len(objs), len(hyps))
+        if ious is None:
+            ious = np.nan_to_num(1 - distances)
+        ious = ious.reshape(distances.shape)
+        iou_rows, iou_cols = np.nonzero(ious)
+        iou_obj_apps = iou_rows + self.num_obj_apps
+        iou_hyp_apps = iou_cols + self.num_hyp_apps
+        self.num_obj_apps += len(objs)
+        self.num_hyp_apps += len(hyps)
+        if len(self.obj_inds) > len(self.last_hyps):
+            self.last_hyps = np.concatenate(
+                [
+                    self.last_hyps,
+                    np.full(len(self.obj_inds) - len(self.last_hyps), -1),
+                ]
+            )
+
+        valid = np.isfinite(distances)
+        pair_rows, pair_cols = np.nonzero(valid)
+
+        tracked = np.zeros(len(objs), dtype=bool)
+        if len(objs) > 0 and len(hyps) > 0:
+            # 1. keep the previous correspondences that are still valid
+            rows = np.flatnonzero(self.last_hyps[objs] >= 0)
+            sorted_inds = np.argsort(hyps, kind="stable")
+            pos = np.searchsorted(
+                hyps[sorted_inds], self.last_hyps[objs[rows]]
+            ).clip(max=len(hyps) - 1)
+            cols = sorted_inds[pos]
+            kept = (hyps[cols] == self.last_hyps[objs[rows]]) & valid[
+                rows, cols
+            ]
+            rows, cols = rows[kept], cols[kept]
+            # the first object takes a hypothesis shared by several
+            _, firsts = np.unique(cols, return_index=True)
+            rows, cols = rows[firsts], cols[firsts]
+
+            # 2. match the others with the minimum total distance
+            costs = distances.copy()
+            costs[rows] = np.nan
+            costs[:, cols] = np.nan
+            new_rows, new_cols = linear_assignment(costs)
+            last_hyps = self.last_hyps[objs[new_rows]]
+            self.num_switches += int(
+                np.count_nonzero(
+                    (last_hyps >= 0) & (last_hyps != hyps[new_cols])
+                )
+            )
+
+            rows = np.concatenate([rows, new_rows])
+            cols = np.concatenate([cols, new_cols])
+            self.last_hyps[objs[rows]] = hyps[cols]
+            self.sum_distances += float(distances[rows, cols].sum())
+            tracked[rows] = True
+
+        self.frames.append(
+            FrameEvents(
+                objs=objs,
+                tracked=tracked,
+                hyps=hyps,
+                pair_objs=objs[pair_rows],
+                pair_hyps=hyps[pair_cols],
+                iou_obj_apps=iou_obj_apps,
+                iou_hyp_apps=iou_hyp_apps,
+                ious=ious[iou_rows, iou_cols],
+            )
+        )
+
+    def id_true_positives(self) -> int:
+        """Number of true positives after the global ID assignment.
+
+        The assignment of motmetrics minimizes the ID false negatives plus
+        false positives, which is the same as maximizing the number of
+        frames where the assigned object and hypothesis can be matched.
+        """
+        if len(self) == 0:
+            return 0
+        events = self.events()
+        pair_objs, pair_hyps = events.pair_objs, events.pair_hyps
+        if len(pair_objs) == 0:
+            return 0
+        objs, pair_objs = np.unique(pair_objs, return_inverse=True)
+        hyps, pair_hyps = np.unique(pair_hyps, return_inverse=True)
+        counts = np.bincount(
+            pair_objs * len(hyps) + pair_hyps,
+            minlength=len(objs) * len(hyps),
+        ).reshape(len(objs), len(hyps))
+        rows, cols = linear_sum_assignment(counts, maximize=True)
+        return int(counts[rows, cols].sum())
+
+    def hota_stats(self) -> np.ndarray:
+        """Compute the counts in `HOTA_STATS` for each of `ALPHAS`."""
+        stats = np.zeros((len(HOTA_STATS), len(ALPHAS)))
+        if len(self) == 0:
+            return stats
+        events = self.events()
+        objs, hyps, ious = events.objs, events.hyps, events.ious
+        obj_apps, hyp_apps = events.iou_obj_apps, events.iou_hyp_apps
+        obj_counts = np.bincount(objs, minlength=len(self.obj_inds))
+        hyp_counts = np.bincount(hyps, minlength=len(self.hyp_inds))
+        stats[1], stats[2] = len(objs), len(hyps)
+        if len(ious) == 0:
+            return stats
+
+        # 1. global alignment scores from the normalized IoUs of all frames
+        denoms = (
+            np.bincount(obj_apps, ious, minlength=len(objs))[obj_apps]
+            + np.bincount(hyp_apps, ious, minlength=len(hyps))[hyp_apps]
+            - ious
+        )
+        norm_ious = np.where(denoms > EPS, ious / np.maximum(denoms, EPS), 0)
+        pairs, pair_inds = np.unique(
+            objs[obj_apps] * len(self.hyp_inds) + hyps[hyp_apps],
+            return_inverse=True,
+        )
+        pair_objs, pair_hyps = np.divmod(pairs, len(self.hyp_inds))
+        pair_counts = obj_counts[pair_objs] + hyp_counts[pair_hyps]
+        potentials = np.bincount(pair_inds, norm_ious)
+        alignments = potentials / (pair_counts - potentials)
+        scores = alignments[pair_inds] * ious
+
+        # 2. match the objects and hypotheses of each frame by the scores
+        frame_sizes = np.array(
+            [[len(frame.objs), len(frame.hyps)] for frame in self.frames]
+        )
+        offsets = np.cumsum(frame_sizes, axis=0) - frame_sizes
+        frames = np.repeat(np.arange(len(self)), frame_sizes[:, 0])[obj_apps]
+        bounds = np.flatnonzero(np.diff(frames)) + 1
+        matches = []
+        for entries in np.split(np.arange(len(ious)), bounds):
+            frame = frames[entries[0]]
+            rows = obj_apps[entries] - offsets[frame, 0]
+            cols = hyp_apps[entries] - offsets[frame, 1]
+            score_mat = np.zeros(frame_sizes[frame])
+            score_mat[rows, cols] = scores[entries]
+            entry_mat = np.full(frame_sizes[frame], -1)
+            entry_mat[rows, cols] = entries
+            match_rows, match_cols = linear_sum_assignment(-score_mat)
+            matches.append(entry_mat[match_rows, match_cols])
+        matched = np.concatenate(matches)
+        matched = matched[matched >= 0]
+
+        # 3. evaluate the matches for all the thresholds at once
+        matched_ious = ious[matched]
+        masks = matched_ious[None] >= ALPHAS[:, None] - EPS
+        alpha_inds, match_inds = np.nonzero(masks)
+        match_counts = np.bincount(
+            alpha_inds * len(pairs) + pair_inds[matched][match_inds],
+            minlength=len(ALPHAS) * len(pairs),
+        ).reshape(len(ALPHAS), len(pairs))
+        stats[0] = masks.sum(axis=1)
+        stats[1] -= stats[0]
+        stats[2] -= stats[0]
+        stats[3] = (
+            match_counts ** 2 / np.maximum(1, pair_counts - match_counts)
+        ).sum(axis=1)
+        stats[4] = (masks * matched_ious).sum(axis=1)
+        return stats
+
+    def compute(self) -> np.ndarray:
+        """Compute the counts in `STATS` and `HOTA_STATS` for the video."""
+        stats = np.zeros(len(STATS))
+        if len(self) == 0:
+            return np.concatenate([stats, self.hota_stats().reshape(-1)])
+        events = self.events()
+        objs, tracked = events.objs, events.tracked
+        num_hyps = len(events.hyps)
+        num_tracked = np.count_nonzero(tracked)
+
+        num_objs = len(self.obj_inds)
+        frequencies = np.bincount(objs, minlength=num_objs)
+        appeared = frequencies > 0
+        ratios = (
+            np.bincount(objs, weights=tracked, minlength=num_objs)[appeared]
+            / frequencies[appeared]
+        )
+
+        # switches from tracked to missed before the object is tracked again
+        sorted_inds = np.argsort(objs, kind="stable")
+        objs, tracked = objs[sorted_inds], tracked[sorted_inds]
+        positions = np.arange(len(objs))
+        last_tracked = np.full(num_objs, -1)
+        np.maximum.at(last_tracked, objs[tracked], positions[tracked])
+        fragments = (
+            (objs[1:] == objs[:-1])
+            & tracked[:-1]
+            & ~tracked[1:]
+            & (positions[1:] < last_tracked[objs[1:]])
+        )
+
+        stats[:] = [
+            len(objs),
+            num_hyps,
+            num_tracked - self.num_switches,
+            self.num_switches,
+            len(objs) - num_tracked,
+            num_hyps - num_tracked,
+            self.sum_distances,
+            self.id_true_positives(),
+            np.count_nonzero(ratios >= 0.8),
+            np.count_nonzero((ratios >= 0.2) & (ratios < 0.8)),
+            np.count_nonzero(ratios < 0.2),
+            np.count_nonzero(fragments),
+        ]
+        return np.concatenate([stats, self.hota_stats().reshape(-1)])
+
+
+def stats_to_metrics(stats: np.ndarray) -> Dict[str, float]:
+    """Compute the metrics from the accumulated counts."""
+    counts = dict(zip(STATS, stats))
+    hota_tp, hota_fn, hota_fp, sum_ass_ious, sum_loc_ious = stats[
+        len(STATS) :
+    ].reshape(len(HOTA_STATS), len(ALPHAS))
+    deta = hota_tp / np.maximum(1, hota_tp + hota_fn + hota_fp)
+    assa = sum_ass_ious / np.maximum(EPS, hota_tp)
+    counts["hota"] = np.sqrt(deta * assa).mean()
+    counts["deta"] = deta.mean()
+    counts["assa"] = assa.mean()
+    counts["loca"] = (sum_loc_ious / np.maximum(EPS, hota_tp)).mean()
+    num_detections = counts["num_matches"] + counts["num_switches"]
+    errors = (
+        counts["num_misses"]
+        + counts["num_switches"]
+        + counts["num_false_positives"]
+    )
+    with np.errstate(divide="ignore", invalid="ignore"):
+        counts["mota"] = 1 - np.float64(errors) / counts["num_objects"]
+        counts["motp"] = 1 - (
+            np.float64(counts["sum_distances"]) / num_detections
+        )
+        counts["idf1"] = (
+            2
+            * np.float64(counts["idtp"])
+            / (counts["num_objects"] + counts["num_predictions"])
+        )
+    return {
+        metric: float(counts[name])
+        if metric in FLOAT_METRICS
+        else int(counts[name])
+        for metric, name in METRIC_MAPS.items()
+    }
+
+
+def intersection_over_area(preds: np.ndarray, gts: np.ndarray) -> np.ndarray:
+    """Returns the intersection over the area of the predicted boxes."""
+    preds, gts = preds[:, None], gts[None]
+    widths = np.minimum(
+        preds[..., 0] + preds[..., 2], gts[..., 0] + gts[..., 2]
+    ) - np.maximum(preds[..., 0], gts[..., 0])
+    heights = np.minimum(
+        preds[..., 1] + preds[..., 3], gts[..., 1] + gts[..., 3]
+    ) - np.maximum(preds[..., 1], gts[..., 1])
+    inters = widths.clip(min=0) * heights.clip(min=0)
+    areas = preds[..., 2] * preds[..., 3]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        iofs: np.ndarray = np.where(areas != 0, inters / areas, 0.0)
+    return iofs
+
+
+def box_ious(gts: np.ndarray, preds: np.ndarray) -> np.ndarray:
+    """Returns the IoUs between two sets of boxes."""
+    gts, preds = gts[:, None], preds[None]
+    mins = np.maximum(gts[..., :2], preds[..., :2])
+    maxs = np.minimum(
+        gts[..., :2] + gts[..., 2:], preds[..., :2] + preds[..., 2:]
+    )
+    inters = np.prod((maxs - mins).clip(min=0), axis=-1)
+    unions = (
+        np.prod(gts[..., 2:].clip(min=0), axis=-1)
+        + np.prod(preds[..., 2:].clip(min=0), axis=-1)
+        - inters
+    )
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ious: np.ndarray = np.where(inters == 0, 0.0, inters / unions)
+    return ious
+
+
+def match_frame(
+    acc: MOTAccumulator,
+    gt_ids: np.ndarray,
+    pred_ids: np.ndarray,
+    ious: np.ndarray,
+    ignore_iofs: Optional[np.ndarray],
+    iou_thr: float,
+    ignore_iof_thr: float,
+) -> None:
+    """Update the accumulator of a class with the matches of a frame.
+
+    The pairs with an IoU below `iou_thr` can not be matched. The unmatched
+    predictions covering the ignored regions by more than `ignore_iof_thr`
+    are removed before the update, if there are ignored regions in the
+    frame.
+    """
+    distances = 1 - ious
+    distances[distances > 1 - iou_thr] = np.nan
+    if ignore_iofs is not None:
+        # 1. assign gt and preds
+        fps = np.ones(len(pred_ids), dtype=bool)
+        fps[linear_assignment(distances)[1]] = False
+        # 2. ignore by iof
+        ignores = (ignore_iofs > ignore_iof_thr).any(axis=0)
+        # 3. filter preds
+        valid_inds = ~(fps & ignores)
+        pred_ids = pred_ids[valid_inds]
+        distances = distances[:, valid_inds]
+        ious = ious[:, valid_inds]
+    if distances.shape != (0, 0):
+        acc.update(gt_ids, pred_ids, distances, ious)
+
+
+def parse_objects(
+    labels: Optional[List[Label]],
+    classes: List[str],
+    instance_ids: Dict[str, int],
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Parse the boxes, categories and ids of the labels of a frame."""
+    bboxes, cats, ids, ignore_bboxes = [], [], [], []
+    for label in labels if labels is not None else []:
+        box_2d = label.box2d
+        if box_2d is None or label.category not in classes:
+            continue
+        bbox = [
+            box_2d.x1,
+            box_2d.y1,
+            box_2d.x2 - box_2d.x1 + 1,
+            box_2d.y2 - box_2d.y1 + 1,
+        ]
+        if check_crowd(label) or check_ignored(label):
+            ignore_bboxes.append(bbox)
+        else:
+            bboxes.append(bbox)
+            cats.append(classes.index(label.category))
+            ids.append(instance_ids.setdefault(label.id, len(instance_ids)))
+    return (
+        np.array(bboxes, dtype=np.float64).reshape(-1, 4),
+        np.array(cats, dtype=np.int64),
+        np.array(ids, dtype=np.int64),
+        np.array(ignore_bboxes, dtype=np.float64).reshape(-1, 4),
+    )
+
+
+def acc_single_video_mot(
+    gts: List[Frame],
+    results: List[Frame],
+    classes: List[str],
+    iou_thr: float = 0.5,
+    ignore_iof_thr: float = 0.5,
+) -> List[MOTAccumulator]:
+    """Accumulate the box tracking results for one video."""
+    assert len(gts) == len(results)
+    gts = sorted(gts, key=lambda frame: frame.frame_index)
+    results = sorted(results, key=lambda frame: frame.frame_index)
+
+    accs = [MOTAccumulator() for _ in classes]
+    gt_inds: Dict[str, int] = {}
+    pred_inds: Dict[str, int] = {}
+    for gt, result in zip(gts, results):
+        assert gt.frame_index == result.frame_index
+        gt_bboxes, gt_cats, gt_ids, gt_ignores = parse_objects(
+            gt.labels, classes, gt_inds
+        )
+        pred_bboxes, pred_cats, pred_ids, _ = parse_objects(
+            result.labels, classes, pred_inds
+        )
+        for i, acc in enumerate(accs):
+            gt_inds_c, pred_inds_c = gt_cats == i, pred_cats == i
+            ignore_iofs = (
+                intersection_over_area(pred_bboxes[pred_inds_c], gt_ignores).T
+                if len(gt_ignores) > 0
+                else None
+            )
+            match_frame(
+                acc,
+                gt_ids[gt_inds_c],
+                pred_ids[pred_inds_c],
+                box_ious(gt_bboxes[gt_inds_c], pred_bboxes[pred_inds_c]),
+                ignore_iofs,
+                iou_thr,
+                ignore_iof_thr,
+            )
+    return accs
+
+
+def evaluate_video(
+    acc_single_video: VideoFunc[FrameT],
+    gts: List[FrameT],
+    results: List[FrameT],
+    classes: List[str],
+    iou_thr: float,
+    ignore_iof_thr: float,
+) -> np.ndarray:
+    """Compute the counts of each class for one video."""
+    accs = acc_single_video(gts, results, classes, iou_thr, ignore_iof_thr)
+    return np.stack([acc.compute() for acc in accs])
+
+
+def render_results(results: TrackResult) -> None:
+    """Render the evaluation results."""
+    headers = ["class"] + list(METRIC_MAPS)
+    table = [
+        [class_name]
+        + [
+            "{:.1f}".format(100 * score)
+            if metric in FLOAT_METRICS
+            else str(score)
+            for metric, score in scores.items()
+        ]
+        for class_name, scores in results.items()
+    ]
+    print(tabulate(table, headers, tablefmt="grid", stralign="center"))
+
+
+def evaluate_track(
+    acc_single_video: VideoFunc[FrameT],
+    gts: List[List[FrameT]],
+    results: List[List[FrameT]],
+    config: Config,
+    iou_thr: float = 0.5,
+    ignore_iof_thr: float = 0.5,
+    nproc: int = 4,
+) -> TrackResult:
+    """Evaluate CLEAR MOT metrics for a dataset.
+
+    Args:
+        acc_single_video: function accumulating the matches of one video.
+        gts: the ground truth of each video.
+        results: the prediction results of each video.
+        config: config with the categories to evaluate.
+        iou_thr: minimum IoU for an object to be considered a positive.
+        ignore_iof_thr: min. intersection over foreground with ignore regions.
+        nproc: number of processes.
+
+    Returns:
+        dict: the metrics of each class, super class, their average and
+            overall.
+    """
+    assert len(gts) == len(results)
+    class_names = [
+        category.name for category in get_leaf_categories(config.categories)
+    ]
+
+    logger.info("evaluating...")
+    func = partial(
+        evaluate_video,
+        acc_single_video,
+        classes=class_names,
+        iou_thr=iou_thr,
+        ignore_iof_thr=ignore_iof_thr,
+    )
+    if nproc > 1:
+        with Pool(nproc) as pool:
+            video_stats = pool.starmap(func, zip(gts, results))
+    else:
+        video_stats = [func(gt, result) for gt, result in zip(gts, results)]
+    return summarize_stats(np.sum(video_stats, axis=0), config)
+
+
+def summarize_stats(stats: np.ndarray, config: Config) -> TrackResult:
+    """Compute the metrics from the counts of each class of all videos.
+
+    Returns:
+        dict: the metrics of each class, super class, their average and
+            overall.
+    """
+    classes = get_leaf_categories(config.categories)
+    super_classes = get_parent_categories(config.categories)
+    class_names = [category.name for category in classes]
+    eval_results: TrackResult = {
+        name: stats_to_metrics(class_stats)
+        for name, class_stats in zip(class_names, stats)
+    }
+    for super_name, sub_classes in super_classes.items():
+        inds = [class_names.index(category.name) for category in sub_classes]
+        eval_results[super_name] = stats_to_metrics(stats[inds].sum(axis=0))
+    eval_results[AVERAGE] = {
+        metric: float(
+            np.nan_to_num(
+                [eval_results[name][metric] for name in class_names],
+                nan=0,
+                posinf=0,
+                neginf=0,
+            ).mean()
+        )
+        if metric in FLOAT_METRICS
+        else int(sum(eval_results[name][metric] for name in class_names))
+        for metric in METRIC_MAPS
+    }
+    eval_results[OVERALL] = stats_to_metrics(stats.sum(axis=0))
+
+    render_results(eval_results)
+    return eval_results
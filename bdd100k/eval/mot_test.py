@@ -0,0 +1,187 @@
+"""Test cases for mot.py."""
+import os
+import unittest
+
+import numpy as np
+from scalabel.label.io import group_and_sort, load
+
+from ..common.utils import load_bdd100k_config
+from ..label.to_scalabel import bdd100k_to_scalabel
+from .mot import (
+    MOTAccumulator,
+    acc_single_video_mot,
+    box_ious,
+    evaluate_track,
+    linear_assignment,
+    stats_to_metrics,
+)
+
+
+class TestLinearAssignment(unittest.TestCase):
+    """Test cases for the assignment with NaN costs."""
+
+    def test_linear_assignment(self) -> None:
+        """Check the NaN costs are never assigned."""
+        costs = np.array([[0.1, np.nan], [0.2, np.nan]])
+        rows, cols = linear_assignment(costs)
+        self.assertEqual(rows.tolist(), [0])
+        self.assertEqual(cols.tolist(), [0])
+
+        rows, cols = linear_assignment(np.full((2, 3), np.nan))
+        self.assertEqual(len(rows), 0)
+        self.assertEqual(len(cols), 0)
+
+
+class TestMOTAccumulator(unittest.TestCase):
+    """Test cases for the CLEAR MOT accumulator."""
+
+    def test_clear_mot(self) -> None:
+        """Check the metrics of a sequence with switches and misses."""
+        frames = [
+            ([1, 2], [10, 20], [[0.1, np.nan], [np.nan, 0.2]]),
+            ([1, 2], [10, 20], [[np.nan, 0.3], [0.4, np.nan]]),
+            ([1, 2], [20], [[0.1], [np.nan]]),
+            ([1, 2], [20, 10], [[0.2, np.nan], [np.nan, 0.1]]),
+            ([1], [30], [[np.nan]]),
+        ]
+        acc = MOTAccumulator()
+        for obj_ids, hyp_ids, distances in frames:
+            acc.update(
+                np.array(obj_ids), np.array(hyp_ids), np.array(distances)
+            )
+        self.assertEqual(len(acc), 5)
+
+        metrics = stats_to_metrics(acc.compute())
+        self.assertAlmostEqual(metrics["MOTA"], 4 / 9)
+        self.assertAlmostEqual(metrics["MOTP"], 0.8)
+        self.assertAlmostEqual(metrics["IDF1"], 10 / 17)
+        self.assertEqual(metrics["FP"], 1)
+        self.assertEqual(metrics["FN"], 2)
+        self.assertEqual(metrics["IDSw"], 2)
+        self.assertEqual(metrics["MT"], 1)
+        self.assertEqual(metrics["PT"], 1)
+        self.assertEqual(metrics["ML"], 0)
+        self.assertEqual(metrics["FM"], 1)
+
+    def test_hota(self) -> None:
+        """Check HOTA of an object tracked by two hypotheses in turn."""
+        acc = MOTAccumulator()
+        for hyp_id in [10, 10, 20, 20]:
+            acc.update(np.array([1]), np.array([hyp_id]), np.zeros((1, 1)))
+
+        metrics = stats_to_metrics(acc.compute())
+        self.assertAlmostEqual(metrics["DetA"], 1.0)
+        self.assertAlmostEqual(metrics["AssA"], 0.5)
+        self.assertAlmostEqual(metrics["LocA"], 1.0)
+        self.assertAlmostEqual(metrics["HOTA"], np.sqrt(0.5))
+        self.assertEqual(metrics["IDSw"], 1)
+
+    def test_empty(self) -> None:
+        """Check the metrics without any frame."""
+        metrics = stats_to_metrics(MOTAccumulator().compute())
+        self.assertTrue(np.isnan(metrics["MOTA"]))
+        self.assertEqual(metrics["FP"], 0)
+
+
+class TestBoxIoUs(unittest.TestCase):
+    """Test cases for the box IoUs."""
+
+    def test_box_ious(self) -> None:
+        """Check the IoUs of the boxes."""
+        gts = np.array([[0, 0, 10, 10], [20, 20, 10, 10]], dtype=np.float64)
+        preds = np.array([[0, 0, 10, 5], [0, 0, 10, 2]], dtype=np.float64)
+        ious = box_ious(gts, preds)
+        self.assertEqual(ious.tolist(), [[0.5, 0.2], [0.0, 0.0]])
+        self.assertEqual(box_ious(gts, preds[:0]).shape, (2, 0))
+
+
+class TestEvaluateTrack(unittest.TestCase):
+    """Test cases for the box tracking evaluation."""
+
+    def test_box_track(self) -> None:
+        """Check the metrics are the ones of the motmetrics accumulators."""
+        cur_dir = os.path.dirname(os.path.abspath(__file__))
+        bdd100k_config = load_bdd100k_config("box_track")
+        gts, results = [
+            group_and_sort(
+                bdd100k_to_scalabel(
+                    load(
+                        "{}/testcases/box_track/{}.json".format(cur_dir, name)
+                    ).frames,
+                    bdd100k_config,
+                )
+            )
+            for name in ["gt", "result"]
+        ]
+        res = evaluate_track(
+            acc_single_video_mot,
+            gts,
+            results,
+            bdd100k_config.config,
+            nproc=1,
+        )
+        # MOTA, MOTP, IDF1, FP, FN, IDSw, MT, PT, ML, FM of motmetrics
+        gt_res = {
+            "pedestrian": [
+                0.7727272727,
+                0.8560378164,
+                0.7317073171,
+                0,
+                3,
+                2,
+                4,
+                0,
+                0,
+                2,
+            ],
+            "car": [
+                0.0909090909,
+                0.8560124605,
+                0.4615384615,
+                6,
+                2,
+                2,
+                2,
+                0,
+                0,
+                1,
+            ],
+            "truck": [0.7777777778, 0.8871809377, 0.875, 0, 2, 0, 1, 1, 0, 2],
+            "bus": [np.nan, np.nan, np.nan, 0, 0, 0, 0, 0, 0, 0],
+            "vehicle": [0.4, 0.8696486693, 0.6190476190, 6, 4, 2, 3, 1, 0, 3],
+            "AVERAGE": [
+                0.4447601010,
+                0.5418404942,
+                0.5030959397,
+                6,
+                8,
+                4,
+                11,
+                1,
+                0,
+                6,
+            ],
+            "OVERALL": [
+                0.7230769231,
+                0.8643774974,
+                0.78125,
+                6,
+                8,
+                4,
+                11,
+                1,
+                0,
+                6,
+            ],
+        }
+        metrics = ["MOTA", "MOTP", "IDF1", "FP", "FN", "IDSw"]
+        metrics += ["MT", "PT", "ML", "FM"]
+        for name, scores in gt_res.items():
+            for metric, score in zip(metrics, scores):
+                self.assertTrue(
+                    np.isclose(res[name][metric], score, equal_nan=True)
+                )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,16 +1,28 @@
 """BDD100K tracking evaluation with CLEAR MOT metrics."""
-import os
-from typing import Callable, List, Tuple
+from functools import partial
+from multiprocessing import Pool
+from typing import Dict, List, NamedTuple, Tuple
 
-import motmetrics as mm
 import numpy as np
-from PIL import Image
+from scalabel.label.typing import Config
+from scalabel.label.utils import get_leaf_categories
 
-MAX_DET = 100
+from ..common.bitmask import decode_bitmask
+from ..common.logger import logger
+from ..common.mask_io import list_masks, load_mask
+from ..common.utils import group_and_sort_files
+from .evaluator import ArrayEvaluator
+from .mot import (
+    ALPHAS,
+    HOTA_STATS,
+    STATS,
+    MOTAccumulator,
+    TrackResult,
+    match_frame,
+    summarize_stats,
+)
 
-Files = List[str]
-FilesList = List[Files]
-FilesFunc = Callable[[Files, Files, float, float], List[mm.MOTAccumulator]]
+MAX_DET = 100
 
 
 def parse_bitmasks(
@@ -20,31 +32,74 @@ def parse_bitmasks(
 
     The compression works like: [4, 2, 9] --> [2, 1, 3]
     """
-    bitmask = bitmask.astype(np.int32)
-    category_map = bitmask[:, :, 0]
-    attributes_map = bitmask[:, :, 1]
-    instance_map = (bitmask[:, :, 2] << 8) + bitmask[:, :, 3]
+    decoded = decode_bitmask(bitmask)
+    return [
+        decoded.masks,
+        decoded.instance_ids,
+        decoded.attributes,
+        decoded.category_ids,
+    ]
+
+
+class MaskOverlaps(NamedTuple):
+    """Nonzero overlaps between the instances of two compressed mask maps.
+
+    The indices start from 0 for the instance 1 of each map, and the pairs
+    are sorted by their gt index, then their pred index.
+    """
+
+    gt_inds: np.ndarray
+    pred_inds: np.ndarray
+    inters: np.ndarray
+    ious: np.ndarray
+    iofs: np.ndarray
+    gt_areas: np.ndarray
+    pred_areas: np.ndarray
 
-    # 0 is for the background
-    instance_ids = np.sort(np.unique(instance_map[instance_map >= 1]))
-    category_ids = np.zeros(instance_ids.shape, dtype=instance_ids.dtype)
-    attributes = np.zeros(instance_ids.shape, dtype=instance_ids.dtype)
 
-    masks = np.zeros(bitmask.shape[:2], dtype=np.int32)
-    for i, instance_id in enumerate(instance_ids):
-        mask_inds_i = instance_map == instance_id
-        # 0 is for the background
-        masks[mask_inds_i] = i + 1
+def mask_overlaps(
+    gt_masks: np.ndarray, pred_masks: np.ndarray
+) -> MaskOverlaps:
+    """Compute the nonzero intersections of two compressed mask maps.
 
-        attributes_i = np.unique(attributes_map[mask_inds_i])
-        assert attributes_i.shape[0] == 1
-        attributes[i] = attributes_i[0]
+    Only the pixels where both maps are foreground are encoded as pairs of
+    instances. The pair codes are counted by bincount, unless the pair space
+    exceeds the number of pixels on crowded frames, where they are sorted
+    instead. The predictions after the first `MAX_DET` are ignored.
+    """
+    assert gt_masks.shape == pred_masks.shape
+    gt_masks = gt_masks.reshape(-1)
+    pred_masks = pred_masks.reshape(-1)
+    m = int(gt_masks.max(initial=0))
+    n = min(int(pred_masks.max(initial=0)), MAX_DET)
 
-        category_ids_i = np.unique(category_map[mask_inds_i])
-        assert category_ids_i.shape[0] == 1
-        category_ids[i] = category_ids_i[0]
+    gt_areas = np.bincount(gt_masks, minlength=m + 1)[1:]
+    pred_areas = np.bincount(pred_masks, minlength=n + 1)[1 : n + 1]
 
-    return [masks, instance_ids, attributes, category_ids]
+    pixels = np.flatnonzero(
+        (gt_masks > 0) & (pred_masks > 0) & (pred_masks <= n)
+    )
+    codes = (gt_masks[pixels].astype(np.int64) - 1) * n + (
+        pred_masks[pixels] - 1
+    )
+    if m * n <= len(gt_masks):
+        counts = np.bincount(codes, minlength=m * n)
+        codes = np.flatnonzero(counts)
+        inters = counts[codes]
+    else:
+        codes, inters = np.unique(codes, return_counts=True)
+    gt_inds, pred_inds = np.divmod(codes, max(n, 1))
+
+    unions = gt_areas[gt_inds] + pred_areas[pred_inds] - inters
+    return MaskOverlaps(
+        gt_inds=gt_inds,
+        pred_inds=pred_inds,
+        inters=inters,
+        ious=inters / unions,
+        iofs=inters / pred_areas[pred_inds],
+        gt_areas=gt_areas,
+        pred_areas=pred_areas,
+    )
 
 
 def mask_intersection_rate(
@@ -52,86 +107,223 @@ def mask_intersection_rate(
     pred_masks: np.ndarray,
 ) -> Tuple[np.ndarray, np.ndarray]:
     """Returns the intersection over the area of the predicted box."""
-    assert gt_masks.shape == pred_masks.shape
-    m: int = np.max(gt_masks)
-    n: int = min(np.max(pred_masks), MAX_DET)
-
-    gt_masks = gt_masks.reshape(-1)
-    pred_masks = pred_masks.reshape(-1)
-    pred_masks[pred_masks > MAX_DET] = 0
-
-    confusion = gt_masks * (1 + n) + pred_masks
-    bin_num = (1 + m) * (1 + n)
-    histogram = np.histogram(confusion, bins=bin_num, range=(0, bin_num))[0]
-    conf_matrix = histogram.reshape(1 + m, 1 + n)
-    gt_areas = conf_matrix.sum(axis=1, keepdims=True)[1:, :]
-    pred_areas = conf_matrix.sum(axis=0, keepdims=True)[:, 1:]
-
-    inter = conf_matrix[1:, 1:]
-    union = gt_areas + pred_areas - inter
-    ious = inter / union
-    ious = np.where(union > 0, ious, 0.0)
-    iofs = inter / pred_areas
-    iofs = np.where(pred_areas > 0, iofs, 0.0)
+    overlaps = mask_overlaps(gt_masks, pred_masks)
+    shape = (len(overlaps.gt_areas), len(overlaps.pred_areas))
+    ious = np.zeros(shape)
+    iofs = np.zeros(shape)
+    ious[overlaps.gt_inds, overlaps.pred_inds] = overlaps.ious
+    iofs[overlaps.gt_inds, overlaps.pred_inds] = overlaps.iofs
     return ious, iofs
 
 
-def acc_single_video_mots(  # pylint: disable=unused-argument
+class FrameOverlaps(NamedTuple):
+    """Instances of the bitmasks of a frame and their overlaps."""
+
+    gt_ids: np.ndarray
+    gt_attrs: np.ndarray
+    gt_cats: np.ndarray
+    pred_ids: np.ndarray
+    pred_attrs: np.ndarray
+    pred_cats: np.ndarray
+    ious: np.ndarray
+    iofs: np.ndarray
+
+
+def frame_overlaps(
+    gt_maps: List[np.ndarray], pred_bitmask: np.ndarray
+) -> FrameOverlaps:
+    """Decode the predicted bitmask of a frame and compute the overlaps.
+
+    `gt_maps` are the parsed ground truth bitmask of the frame.
+    """
+    gt_masks, gt_ids, gt_attrs, gt_cats = gt_maps
+    pred_masks, pred_ids, pred_attrs, pred_cats = parse_bitmasks(pred_bitmask)
+    ious, iofs = mask_intersection_rate(gt_masks, pred_masks)
+    return FrameOverlaps(
+        gt_ids, gt_attrs, gt_cats, pred_ids, pred_attrs, pred_cats, ious, iofs
+    )
+
+
+def match_frame_overlaps(
+    accs: List[MOTAccumulator],
+    overlaps: FrameOverlaps,
+    iou_thr: float,
+    ignore_iof_thr: float,
+) -> None:
+    """Match the instances of a frame for the accumulator of each class."""
+    gt_valids = np.logical_not((overlaps.gt_attrs & 3).astype(bool))
+    pred_valids = np.logical_not((overlaps.pred_attrs & 3).astype(bool))
+    gt_invalid = np.logical_not(gt_valids)
+    for i, acc in enumerate(accs):
+        # cats starts from 1 and i starts from 0
+        gt_inds = (overlaps.gt_cats == i + 1) * gt_valids
+        pred_inds = (overlaps.pred_cats == i + 1) * pred_valids
+        match_frame(
+            acc,
+            overlaps.gt_ids[gt_inds],
+            overlaps.pred_ids[pred_inds],
+            overlaps.ious[gt_inds][:, pred_inds],
+            overlaps.iofs[gt_invalid][:, pred_inds]
+            if gt_invalid.any()
+            else None,
+            iou_thr,
+            ignore_iof_thr,
+        )
+
+
+def acc_single_video_mots(
     gts: List[str],
     results: List[str],
     classes: List[str],
     iou_thr: float = 0.5,
     ignore_iof_thr: float = 0.5,
-) -> List[mm.MOTAccumulator]:
+) -> List[MOTAccumulator]:
     """Accumulate results for one video."""
-    assert len(gts) == len(results)
-    num_classes = len(classes)
-
-    accs = [mm.MOTAccumulator(auto_id=True) for _ in range(num_classes)]
-    for gt, result in zip(gts, results):
-        assert os.path.isfile(gt)
-        assert os.path.isfile(result)
-
-        gt_masks = np.asarray(Image.open(gt))
-        res_masks = np.asarray(Image.open(result))
-        gt_masks, gt_ids, gt_attrs, gt_cats = parse_bitmasks(gt_masks)
-        pred_masks, pred_ids, pred_attrs, pred_cats = parse_bitmasks(res_masks)
-        ious, iofs = mask_intersection_rate(gt_masks, pred_masks)
-
-        gt_valids = np.logical_not((gt_attrs & 3).astype(np.bool8))
-        pred_valids = np.logical_not((pred_attrs & 3).astype(np.bool8))
-        for i in range(num_classes):
-            # cats starts from 1 and i starts from 0
-            gt_inds = (gt_cats == i + 1) * gt_valids
-            pred_inds = (pred_cats == i + 1) * pred_valids
-            gt_ids_c, pred_ids_c = gt_ids[gt_inds], pred_ids[pred_inds]
-
-            if gt_ids_c.shape[0] == 0 and pred_ids_c.shape[0] != 0:
-                distances = np.full((0, pred_ids_c.shape[0]), np.nan)
-            elif gt_ids_c.shape[0] != 0 and pred_ids_c.shape[0] == 0:
-                distances = np.full((gt_ids_c.shape[0], 0), np.nan)
-            else:
-                ious_c = ious[gt_inds, :][:, pred_inds]
-                distances = 1 - ious_c
-                distances = np.where(
-                    distances > 1 - iou_thr, np.nan, distances
-                )
-
-            gt_invalid = np.logical_not(gt_valids)
-            if (gt_invalid).any():
-                # 1. assign gt and preds
-                fps = np.ones(pred_ids_c.shape[0]).astype(np.bool8)
-                le, ri = mm.lap.linear_sum_assignment(distances)
-                for m, n in zip(le, ri):
-                    if np.isfinite(distances[m, n]):
-                        fps[n] = False
-                # 2. ignore by iof
-                iofs_c = iofs[gt_invalid, :][:, pred_inds]
-                ignores = (iofs_c > ignore_iof_thr).any(axis=0)
-                # 3. filter preds
-                valid_inds = ~(fps & ignores)
-                pred_ids_c = pred_ids_c[valid_inds]
-                distances = distances[:, valid_inds]
-            if distances.shape != (0, 0):
-                accs[i].update(gt_ids_c, pred_ids_c, distances)
-    return accs
+    return acc_single_video_mots_multi(
+        gts, [results], classes, iou_thr, ignore_iof_thr
+    )[0]
+
+
+def acc_single_video_mots_multi(
+    gts: List[str],
+    results_list: List[List[str]],
+    classes: List[str],
+    iou_thr: float = 0.5,
+    ignore_iof_thr: float = 0.5,
+) -> List[List[MOTAccumulator]]:
+    """Accumulate several results for one video.
+
+    Each ground truth frame is only decoded once for all the results.
+    """
+    assert all(len(gts) == len(results) for results in results_list)
+    accs_list = [[MOTAccumulator() for _ in classes] for _ in results_list]
+    for i, gt in enumerate(gts):
+        gt_maps = parse_bitmasks(load_mask(gt))
+        for accs, results in zip(accs_list, results_list):
+            match_frame_overlaps(
+                accs,
+                frame_overlaps(gt_maps, load_mask(results[i])),
+                iou_thr,
+                ignore_iof_thr,
+            )
+    return accs_list
+
+
+def evaluate_video_multi(
+    gts: List[str],
+    results_list: List[List[str]],
+    classes: List[str],
+    iou_thr: float,
+    ignore_iof_thr: float,
+) -> List[np.ndarray]:
+    """Compute the counts of each class for one video of each result."""
+    accs_list = acc_single_video_mots_multi(
+        gts, results_list, classes, iou_thr, ignore_iof_thr
+    )
+    return [np.stack([acc.compute() for acc in accs]) for accs in accs_list]
+
+
+def evaluate_mots_dirs(
+    gt_dir: str,
+    res_dirs: List[str],
+    config: Config,
+    iou_thr: float = 0.5,
+    ignore_iof_thr: float = 0.5,
+    nproc: int = 4,
+) -> List[TrackResult]:
+    """Evaluate segmentation tracking of several result folders at once.
+
+    Each ground truth frame is only decoded once for all the results, which
+    all have to cover the ground truth.
+    """
+    gts = group_and_sort_files(list_masks(gt_dir, with_prefix=True))
+    results_list = [
+        group_and_sort_files(list_masks(res_dir, with_prefix=True))
+        for res_dir in res_dirs
+    ]
+    classes = [
+        category.name for category in get_leaf_categories(config.categories)
+    ]
+
+    logger.info("evaluating...")
+    func = partial(
+        evaluate_video_multi,
+        classes=classes,
+        iou_thr=iou_thr,
+        ignore_iof_thr=ignore_iof_thr,
+    )
+    videos = list(zip(gts, [list(results) for results in zip(*results_list)]))
+    if nproc > 1:
+        with Pool(nproc) as pool:
+            video_stats = pool.starmap(func, videos)
+    else:
+        video_stats = [func(*video) for video in videos]
+
+    eval_results = []
+    for i, res_dir in enumerate(res_dirs):
+        logger.info("Results of %s", res_dir)
+        eval_results.append(
+            summarize_stats(
+                np.sum([stats[i] for stats in video_stats], axis=0), config
+            )
+        )
+    return eval_results
+
+
+class MOTSEvaluator(ArrayEvaluator[Tuple[str, FrameOverlaps], TrackResult]):
+    """Accumulate the matches of segmentation tracking results.
+
+    The frames of each video are matched in the order of their updates, and
+    the frames of different videos may be interleaved.
+    """
+
+    def __init__(
+        self,
+        config: Config,
+        iou_thr: float = 0.5,
+        ignore_iof_thr: float = 0.5,
+        num_threads: int = 0,
+    ) -> None:
+        """Initialize the accumulators of the classes of each video."""
+        super().__init__(num_threads)
+        self.config = config
+        self.num_classes = len(get_leaf_categories(config.categories))
+        self.iou_thr = iou_thr
+        self.ignore_iof_thr = ignore_iof_thr
+        self.video_accs: Dict[str, List[MOTAccumulator]] = {}
+
+    def process(
+        self, video: str, gt_bitmask: np.ndarray, pred_bitmask: np.ndarray
+    ) -> Tuple[str, FrameOverlaps]:
+        """Compute the overlaps of the bitmasks of a frame."""
+        return video, frame_overlaps(parse_bitmasks(gt_bitmask), pred_bitmask)
+
+    def update(
+        self, video: str, gt_bitmask: np.ndarray, pred_bitmask: np.ndarray
+    ) -> None:
+        """Evaluate the bitmasks of the next frame of a video."""
+        self.submit(partial(self.process, video, gt_bitmask, pred_bitmask))
+
+    def accumulate(self, stats: Tuple[str, FrameOverlaps]) -> None:
+        """Match the instances of a frame."""
+        video, overlaps = stats
+        if video not in self.video_accs:
+            self.video_accs[video] = [
+                MOTAccumulator() for _ in range(self.num_classes)
+            ]
+        match_frame_overlaps(
+            self.video_accs[video],
+            overlaps,
+            self.iou_thr,
+            self.ignore_iof_thr,
+        )
+
+    def compute(self) -> TrackResult:
+        """Compute the metrics of all the videos."""
+        self.sync()
+        stats = np.zeros(
+            (self.num_classes, len(STATS) + len(HOTA_STATS) * len(ALPHAS))
+        )
+        for accs in self.video_accs.values():
+            stats += np.stack([acc.compute() for acc in accs])
+        return summarize_stats(stats, self.config)
@@ -4,14 +4,22 @@ import unittest
 
 import numpy as np
 from PIL import Image
-from scalabel.eval.mot import evaluate_track
 
+from ..common.mask_io import load_mask
 from ..common.utils import (
     group_and_sort_files,
     list_files,
     load_bdd100k_config,
 )
-from .mots import acc_single_video_mots, mask_intersection_rate, parse_bitmasks
+from .mot import evaluate_track
+from .mots import (
+    MOTSEvaluator,
+    acc_single_video_mots,
+    evaluate_mots_dirs,
+    mask_intersection_rate,
+    mask_overlaps,
+    parse_bitmasks,
+)
 
 
 class TestMaskIntersectionRate(unittest.TestCase):
@@ -32,6 +40,28 @@ class TestMaskIntersectionRate(unittest.TestCase):
                 self.assertAlmostEqual(ious[i, j], gt_ious[i, j])
                 self.assertAlmostEqual(ioas[i, j], gt_ioas[i, j])
 
+    def test_mask_overlaps(self) -> None:
+        """Check only the nonzero overlaps are kept."""
+        a_bitmask = np.zeros((10, 10), dtype=np.int32)
+        a_bitmask[:5, :5] = 1
+        a_bitmask[5:, 5:] = 2
+        b_bitmask = np.zeros((10, 10), dtype=np.int32)
+        b_bitmask[:5, :2] = 1
+        b_bitmask[8:, 8:] = 3
+
+        overlaps = mask_overlaps(a_bitmask, b_bitmask)
+        self.assertEqual(overlaps.gt_inds.tolist(), [0, 1])
+        self.assertEqual(overlaps.pred_inds.tolist(), [0, 2])
+        self.assertEqual(overlaps.inters.tolist(), [10, 4])
+        self.assertEqual(overlaps.gt_areas.tolist(), [25, 25])
+        self.assertEqual(overlaps.pred_areas.tolist(), [10, 0, 4])
+        self.assertEqual(overlaps.ious.tolist(), [10 / 25, 4 / 25])
+        self.assertEqual(overlaps.iofs.tolist(), [1.0, 1.0])
+
+        ious, iofs = mask_intersection_rate(a_bitmask, b_bitmask)
+        self.assertEqual(ious.shape, (2, 3))
+        self.assertEqual(np.count_nonzero(iofs), 2)
+
 
 class TestEvaluteMOTS(unittest.TestCase):
     """Test Cases for BDD100K MOTS evaluation.."""
@@ -56,6 +86,51 @@ class TestEvaluteMOTS(unittest.TestCase):
         self.assertAlmostEqual(res["pedestrian"]["MOTP"], 3 / 4)
         self.assertAlmostEqual(res["pedestrian"]["IDF1"], 4 / 5)
 
+    def test_several_results(self) -> None:
+        """Check several results are evaluated like one by one."""
+        cur_dir = os.path.dirname(os.path.abspath(__file__))
+        a_path = "{}/testcases/mots/gt".format(cur_dir)
+        b_path = "{}/testcases/mots/result".format(cur_dir)
+        config = load_bdd100k_config("seg_track").config
+        results = evaluate_mots_dirs(a_path, [b_path, a_path], config, nproc=1)
+        self.assertEqual(len(results), 2)
+        self.assertAlmostEqual(results[0]["pedestrian"]["MOTA"], 2 / 3)
+        self.assertAlmostEqual(results[0]["pedestrian"]["IDF1"], 4 / 5)
+        self.assertAlmostEqual(results[1]["pedestrian"]["MOTA"], 1.0)
+        self.assertAlmostEqual(results[1]["pedestrian"]["IDF1"], 1.0)
+
+    def test_evaluator(self) -> None:
+        """Check the array evaluator matches the folder evaluation."""
+        cur_dir = os.path.dirname(os.path.abspath(__file__))
+        a_path = "{}/testcases/mots/gt".format(cur_dir)
+        b_path = "{}/testcases/mots/result".format(cur_dir)
+        gts = group_and_sort_files(
+            list_files(a_path, ".png", with_prefix=True)
+        )
+        results = group_and_sort_files(
+            list_files(b_path, ".png", with_prefix=True)
+        )
+        config = load_bdd100k_config("seg_track").config
+        res = evaluate_track(acc_single_video_mots, gts, results, config)
+
+        for num_threads in [0, 2]:
+            with MOTSEvaluator(config, num_threads=num_threads) as evaluator:
+                for video_gts, video_results in zip(gts, results):
+                    for gt, result in zip(video_gts, video_results):
+                        evaluator.update(
+                            os.path.dirname(gt),
+                            load_mask(gt),
+                            load_mask(result),
+                        )
+                array_res = evaluator.compute()
+            for name, metrics in res.items():
+                for metric, val in metrics.items():
+                    self.assertTrue(
+                        np.isclose(
+                            array_res[name][metric], val, equal_nan=True
+                        )
+                    )
+
 
 class TestParseBitmasks(unittest.TestCase):
     """Test Cases for BDD100K MOTS evaluation input parser."""
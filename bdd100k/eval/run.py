@@ -3,19 +3,20 @@
 import argparse
 
 from scalabel.eval.detect import evaluate_det
-from scalabel.eval.mot import acc_single_video_mot, evaluate_track
 from scalabel.label.io import group_and_sort, load
 
-from ..common.utils import (
-    group_and_sort_files,
-    list_files,
-    load_bdd100k_config,
-)
+from ..common.logger import logger
+from ..common.mask_io import list_masks
+from ..common.utils import load_bdd100k_config
 from ..label.to_scalabel import bdd100k_to_scalabel
-from .ins_seg import evaluate_ins_seg
-from .lane import evaluate_lane_marking
-from .mots import acc_single_video_mots
-from .seg import evaluate_drivable, evaluate_segmentation
+from .bootstrap import NUM_REPLICATES
+from .breakdown import WORST_K
+from .ins_seg import evaluate_ins_seg, evaluate_ins_seg_dirs
+from .lane import evaluate_lane_marking_dirs
+from .mot import acc_single_video_mot, evaluate_track
+from .mots import evaluate_mots_dirs
+from .sample import SAMPLE_ATTRIBUTES, load_strata, sample_images
+from .seg import evaluate_segmentation, evaluate_segmentation_dirs
 
 
 def parse_args() -> argparse.Namespace:
@@ -39,7 +40,11 @@ def parse_args() -> argparse.Namespace:
         "--gt", "-g", required=True, help="path to ground truth"
     )
     parser.add_argument(
-        "--result", "-r", required=True, help="path to results to be evaluated"
+        "--result",
+        "-r",
+        nargs="+",
+        required=True,
+        help="paths to results to be evaluated against the same ground truth",
     )
     parser.add_argument(
         "--config",
@@ -65,6 +70,68 @@ def parse_args() -> argparse.Namespace:
         default=4,
         help="number of processes for evaluation",
     )
+    # Flags for lane marking
+    parser.add_argument(
+        "--gt-cache-dir",
+        type=str,
+        default=None,
+        help="Path to cache the compiled ground truth for lane marking",
+    )
+    parser.add_argument(
+        "--frame-file",
+        type=str,
+        default=None,
+        help="Path to write the per-frame F-scores of lane marking",
+    )
+    # Flags for the per-image results
+    parser.add_argument(
+        "--image-file",
+        type=str,
+        default=None,
+        help="Path to save the per-image results of sem_seg, drivable, "
+        "lane_mark or ins_seg",
+    )
+    parser.add_argument(
+        "--worst-k",
+        type=int,
+        default=WORST_K,
+        help="number of the worst images of each class to report",
+    )
+    parser.add_argument(
+        "--bootstrap",
+        type=int,
+        default=0,
+        help="number of bootstrap replicates for the 95% confidence "
+        "intervals of sem_seg, drivable or lane_mark, 0 to skip them",
+    )
+    parser.add_argument(
+        "--sample",
+        type=int,
+        default=None,
+        help="number of images of a deterministic sample to evaluate "
+        "sem_seg, drivable or lane_mark quickly, with confidence intervals",
+    )
+    parser.add_argument(
+        "--sample-attributes",
+        type=str,
+        default=None,
+        help="path to the labels with the frame attributes to stratify "
+        "the sample by",
+    )
+    parser.add_argument(
+        "--stratify",
+        type=str,
+        nargs="+",
+        default=SAMPLE_ATTRIBUTES,
+        help="frame attributes to stratify the sample by",
+    )
+    # Flags for semantic segmentation and drivable area
+    parser.add_argument(
+        "--checkpoint",
+        type=str,
+        default=None,
+        help="Path to save and resume the segmentation evaluation state",
+    )
     # Flags for detection and instance segmentation
     parser.add_argument(
         "--out-dir", type=str, default=".", help="Path to store output files"
@@ -73,11 +140,29 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument(
         "--score-file",
         type=str,
-        default=".",
-        help="Path to store the prediction scoring file",
+        nargs="+",
+        default=["."],
+        help="Paths to the prediction scoring file of each result",
     )
 
     args = parser.parse_args()
+    if len(args.result) > 1:
+        if any(
+            flag is not None
+            for flag in [args.checkpoint, args.frame_file, args.image_file]
+        ):
+            parser.error(
+                "--checkpoint, --frame-file and --image-file only apply to a "
+                "single result"
+            )
+        if args.task == "ins_seg" and len(args.score_file) != len(args.result):
+            parser.error("each result needs its own --score-file")
+    if args.sample is not None and args.task not in [
+        "sem_seg",
+        "drivable",
+        "lane_mark",
+    ]:
+        parser.error("--sample only applies to sem_seg, drivable or lane_mark")
 
     return args
 
@@ -90,59 +175,114 @@ def run() -> None:
     elif args.task in ["det", "ins_seg", "box_track", "seg_track"]:
         bdd100k_config = load_bdd100k_config(args.task)
 
-    if args.task == "drivable":
-        evaluate_drivable(args.gt, args.result, args.nproc)
-    elif args.task == "lane_mark":
-        evaluate_lane_marking(args.gt, args.result, [1, 2, 5, 10], args.nproc)
-    elif args.task == "sem_seg":
-        evaluate_segmentation(args.gt, args.result, args.nproc)
-    elif args.task == "det":
-        evaluate_det(
-            bdd100k_to_scalabel(
-                load(args.gt, args.nproc).frames, bdd100k_config
-            ),
-            bdd100k_to_scalabel(
-                load(args.result, args.nproc).frames, bdd100k_config
-            ),
-            bdd100k_config.config,
-            args.out_dir,
+    sample = None
+    num_replicates = args.bootstrap
+    if args.sample is not None:
+        sample = sample_images(
+            list_masks(args.gt),
+            args.sample,
+            load_strata(args.sample_attributes, args.stratify, args.nproc)
+            if args.sample_attributes is not None
+            else None,
         )
-    elif args.task == "ins_seg":
-        evaluate_ins_seg(
+        if num_replicates == 0:
+            num_replicates = NUM_REPLICATES
+
+    if args.task in ["sem_seg", "drivable"]:
+        if len(args.result) == 1:
+            evaluate_segmentation(
+                args.gt,
+                args.result[0],
+                mode=args.task,
+                nproc=args.nproc,
+                checkpoint=args.checkpoint,
+                image_file=args.image_file,
+                worst_k=args.worst_k,
+                num_replicates=num_replicates,
+                sample=sample,
+            )
+        else:
+            evaluate_segmentation_dirs(
+                args.gt,
+                args.result,
+                mode=args.task,
+                nproc=args.nproc,
+                num_replicates=num_replicates,
+                sample=sample,
+            )
+    elif args.task == "lane_mark":
+        evaluate_lane_marking_dirs(
             args.gt,
             args.result,
-            args.score_file,
-            bdd100k_config.config,
-            args.out_dir,
+            [1, 2, 5, 10],
             args.nproc,
+            args.gt_cache_dir,
+            [args.frame_file] if args.frame_file is not None else None,
+            [args.image_file] if args.image_file is not None else None,
+            args.worst_k,
+            num_replicates,
+            sample,
         )
-    elif args.task == "box_track":
-        evaluate_track(
-            acc_single_video_mot,
-            gts=group_and_sort(
-                bdd100k_to_scalabel(
-                    load(args.gt, args.nproc).frames, bdd100k_config
-                )
-            ),
-            results=group_and_sort(
+    elif args.task == "det":
+        gt_frames = bdd100k_to_scalabel(
+            load(args.gt, args.nproc).frames, bdd100k_config
+        )
+        for result in args.result:
+            logger.info("Results of %s", result)
+            evaluate_det(
+                gt_frames,
                 bdd100k_to_scalabel(
-                    load(args.result, args.nproc).frames, bdd100k_config
-                )
-            ),
-            config=bdd100k_config.config,
-            iou_thr=args.iou_thr,
-            ignore_iof_thr=args.ignore_iof_thr,
-            nproc=args.nproc,
+                    load(result, args.nproc).frames, bdd100k_config
+                ),
+                bdd100k_config.config,
+                args.out_dir,
+            )
+    elif args.task == "ins_seg":
+        if len(args.result) == 1:
+            evaluate_ins_seg(
+                args.gt,
+                args.result[0],
+                args.score_file[0],
+                bdd100k_config.config,
+                args.out_dir,
+                args.nproc,
+                args.image_file,
+                args.worst_k,
+            )
+        else:
+            evaluate_ins_seg_dirs(
+                args.gt,
+                args.result,
+                args.score_file,
+                bdd100k_config.config,
+                args.out_dir,
+                args.nproc,
+            )
+    elif args.task == "box_track":
+        gts = group_and_sort(
+            bdd100k_to_scalabel(
+                load(args.gt, args.nproc).frames, bdd100k_config
+            )
         )
+        for result in args.result:
+            logger.info("Results of %s", result)
+            evaluate_track(
+                acc_single_video_mot,
+                gts=gts,
+                results=group_and_sort(
+                    bdd100k_to_scalabel(
+                        load(result, args.nproc).frames, bdd100k_config
+                    )
+                ),
+                config=bdd100k_config.config,
+                iou_thr=args.iou_thr,
+                ignore_iof_thr=args.ignore_iof_thr,
+                nproc=args.nproc,
+            )
     elif args.task == "seg_track":
-        evaluate_track(
-            acc_single_video_mots,
-            gts=group_and_sort_files(
-                list_files(args.gt, ".png", with_prefix=True)
-            ),
-            results=group_and_sort_files(
-                list_files(args.result, ".png", with_prefix=True)
-            ),
+        evaluate_mots_dirs(
+            args.gt,
+            args.result,
             config=bdd100k_config.config,
             iou_thr=args.iou_thr,
             ignore_iof_thr=args.ignore_iof_thr,
@@ -0,0 +1,102 @@
+"""Deterministic stratified samples of the images for quick evaluations.
+
+A sample of a given size is allocated to the strata of the images, e.g.,
+by weather and time of day, in proportion to their sizes. The images of
+each stratum are taken in the order of the hashes of their names, so the
+same images always give the same sample, and a sample contains the smaller
+ones of the same strata.
+"""
+
+import hashlib
+import os.path as osp
+from typing import Dict, List, Optional
+
+import numpy as np
+from scalabel.label.io import load
+
+from ..common.logger import logger
+
+SAMPLE_ATTRIBUTES = ["weather", "timeofday"]
+
+
+def image_key(name: str) -> str:
+    """Key of an image or a mask, i.e., its file name without extension."""
+    return osp.splitext(osp.basename(name))[0]
+
+
+def load_strata(
+    attribute_file: str,
+    attributes: Optional[List[str]] = None,
+    nproc: int = 4,
+) -> Dict[str, str]:
+    """Load the stratum of each image from the attributes of the frames.
+
+    The strata are keyed by `image_key` and combine the values of the
+    `attributes`, where a missing attribute has the value "undefined".
+    """
+    if attributes is None:
+        attributes = SAMPLE_ATTRIBUTES
+    strata: Dict[str, str] = {}
+    for frame in load(attribute_file, nproc).frames:
+        frame_attrs = frame.attributes if frame.attributes is not None else {}
+        strata[image_key(frame.name)] = "/".join(
+            str(frame_attrs.get(attribute, "undefined"))
+            for attribute in attributes
+        )
+    return strata
+
+
+def allocate(sizes: List[int], num_samples: int) -> List[int]:
+    """Allocate the samples to the strata in proportion to their sizes.
+
+    The fractions of the quotas are rounded by the largest remainders.
+    """
+    sizes_arr = np.array(sizes, dtype=np.int64)
+    total = int(sizes_arr.sum())
+    if num_samples >= total:
+        return sizes
+    quotas = sizes_arr * num_samples / max(total, 1)
+    counts = np.floor(quotas).astype(np.int64)
+    remainders = quotas - counts
+    order = np.argsort(-remainders, kind="stable")
+    counts[order[: num_samples - int(counts.sum())]] += 1
+    return counts.tolist()  # type: ignore
+
+
+def sample_images(
+    names: List[str],
+    num_samples: int,
+    strata: Optional[Dict[str, str]] = None,
+) -> Dict[str, str]:
+    """Sample the images of each stratum in the order of their hashes.
+
+    The images without a stratum form their own one. Returns the stratum
+    of each sampled image, ordered by name.
+    """
+    image_strata: Dict[str, List[str]] = {}
+    for name in names:
+        stratum = strata.get(image_key(name), "") if strata is not None else ""
+        image_strata.setdefault(stratum, []).append(name)
+    stratum_names = sorted(image_strata)
+    counts = allocate(
+        [len(image_strata[stratum]) for stratum in stratum_names], num_samples
+    )
+
+    sampled: Dict[str, str] = {}
+    for stratum, count in zip(stratum_names, counts):
+        members = sorted(
+            image_strata[stratum],
+            key=lambda name: hashlib.md5(
+                image_key(name).encode("utf-8")
+            ).hexdigest(),
+        )
+        for name in members[:count]:
+            sampled[name] = stratum
+        if strata is not None:
+            logger.info(
+                "Sampled %d of %d images of %s",
+                count,
+                len(members),
+                stratum if stratum else "no stratum",
+            )
+    return dict(sorted(sampled.items()))
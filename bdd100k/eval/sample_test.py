@@ -0,0 +1,61 @@
+"""Test cases for sample.py."""
+import json
+import os
+import shutil
+import unittest
+
+from .sample import allocate, load_strata, sample_images
+
+
+class TestSample(unittest.TestCase):
+    """Test cases for the stratified samples."""
+
+    test_out = "./test_sample"
+
+    def test_allocate(self) -> None:
+        """Check the samples are allocated in proportion to the strata."""
+        self.assertEqual(allocate([6, 3, 1], 5), [3, 2, 0])
+        self.assertEqual(allocate([5, 5], 3), [2, 1])
+        self.assertEqual(allocate([2, 1], 10), [2, 1])
+        self.assertEqual(sum(allocate([7, 11, 13, 17], 20)), 20)
+
+    def test_sample_images(self) -> None:
+        """Check the samples are deterministic, nested and stratified."""
+        names = ["{:03d}.png".format(i) for i in range(40)]
+        strata = {"{:03d}".format(i): str(i % 4 == 0) for i in range(40)}
+        sample = sample_images(names, 8, strata)
+        self.assertEqual(list(sample), sorted(sample))
+        self.assertEqual(list(sample.values()).count("True"), 2)
+        self.assertEqual(sample, sample_images(names[::-1], 8, strata))
+        larger = sample_images(names, 16, strata)
+        self.assertTrue(set(sample) <= set(larger))
+        self.assertEqual(len(sample_images(names, 8)), 8)
+        self.assertEqual(set(sample_images(names, 100)), set(names))
+
+    def test_load_strata(self) -> None:
+        """Check the strata combine the attributes of the frames."""
+        os.makedirs(self.test_out, exist_ok=True)
+        attribute_file = os.path.join(self.test_out, "frames.json")
+        with open(attribute_file, "w", encoding="utf-8") as fp:
+            json.dump(
+                [
+                    dict(
+                        name="a.jpg",
+                        attributes=dict(weather="rainy", timeofday="night"),
+                    ),
+                    dict(name="b.jpg", attributes=dict(weather="clear")),
+                ],
+                fp,
+            )
+        strata = load_strata(attribute_file, nproc=0)
+        self.assertEqual(strata, {"a": "rainy/night", "b": "clear/undefined"})
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        """Remove the attribute file."""
+        if os.path.exists(cls.test_out):
+            shutil.rmtree(cls.test_out)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,17 +1,23 @@
 """Evaluation procedures for semantic segmentation."""
 
+import os
 import os.path as osp
 from functools import partial
 from multiprocessing import Pool
-from typing import Dict, Set, Tuple
+from typing import Dict, List, Optional, Set, Tuple
 
 import numpy as np
-from PIL import Image
 from tqdm import tqdm
 
 from ..common.logger import logger
-from ..common.utils import list_files
+from ..common.mask_io import list_masks, load_mask
 from ..label.label import drivables, labels
+from .bootstrap import bootstrap_sums, confidence_interval
+from .breakdown import WORST_K, save_breakdown
+from .evaluator import ArrayEvaluator
+
+# results counted between the saves of a checkpoint
+CHECKPOINT_INTERVAL = 100
 
 
 def fast_hist(
@@ -31,15 +37,259 @@ def per_class_iu(hist: np.ndarray) -> np.ndarray:
     return ious
 
 
+def per_image_iu(hist: np.ndarray) -> np.ndarray:
+    """Calculate per class iou of an image, NaN for the absent classes."""
+    union = hist.sum(1) + hist.sum(0) - np.diag(hist)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ious: np.ndarray = np.where(union > 0, np.diag(hist) / union, np.nan)
+    return ious
+
+
+def image_hist(
+    gt_mask: np.ndarray, pred_mask: np.ndarray, num_classes: int
+) -> Tuple[np.ndarray, Set[int]]:
+    """Calculate the hist and the ground truth ids of an image."""
+    gt_id_set = set(np.unique(gt_mask).tolist())
+    hist = fast_hist(gt_mask.flatten(), pred_mask.flatten(), num_classes)
+    return hist, gt_id_set
+
+
 def per_image_hist(
     gt_path: str, res_path: str, num_classes: int
 ) -> Tuple[np.ndarray, Set[int]]:
     """Calculate per image hist."""
-    gt = np.asarray(Image.open(gt_path, "r"))
-    gt_id_set = set(np.unique(gt).tolist())
-    pred = np.asanyarray(Image.open(res_path, "r"))
-    hist = fast_hist(gt.flatten(), pred.flatten(), num_classes)
-    return hist, gt_id_set
+    return image_hist(load_mask(gt_path), load_mask(res_path), num_classes)
+
+
+def eval_image(
+    gt_dir: str, res_dirs: List[str], num_classes: int, img: str
+) -> Tuple[str, List[Tuple[np.ndarray, Set[int]]]]:
+    """Calculate the hists of an image by its name for each result folder.
+
+    The ground truth is only read once for all the results.
+    """
+    gt_mask = load_mask(osp.join(gt_dir, img))
+    return img, [
+        image_hist(gt_mask, load_mask(osp.join(res_dir, img)), num_classes)
+        for res_dir in res_dirs
+    ]
+
+
+class SegEvaluator(
+    ArrayEvaluator[
+        Tuple[Optional[str], np.ndarray, Set[int]], Dict[str, float]
+    ]
+):
+    """Accumulate the confusion matrix of segmentation results.
+
+    The names of the counted images are recorded with the matrix, so the
+    state can be saved to a checkpoint and an evaluation resumed from it
+    without counting any image twice. The images given as arrays by
+    `update` may be left unnamed.
+
+    With `num_replicates` bootstrap replicates, the intersection and the
+    ground truth and predicted pixels of each class of each image are also
+    kept, to compute the confidence intervals of the IoUs. The images are
+    resampled within their `strata`, if any, e.g., for a stratified sample.
+    """
+
+    def __init__(
+        self,
+        mode: str = "sem_seg",
+        num_threads: int = 0,
+        num_replicates: int = 0,
+        strata: Optional[Dict[str, str]] = None,
+    ) -> None:
+        """Initialize an empty state for the labels of the task."""
+        super().__init__(num_threads)
+        assert mode in ["sem_seg", "drivable"]
+        self.mode = mode
+        label_defs = {
+            "sem_seg": labels,
+            "drivable": drivables,
+        }[mode]
+        self.categories = [
+            label.name for label in label_defs if label.trainId != 255
+        ]
+        self.num_classes = len(self.categories)
+        self.hist = np.zeros((self.num_classes, self.num_classes))
+        self.gt_id_set: Set[int] = set()
+        self.names: Set[str] = set()
+        self.num_images = 0
+        self.num_replicates = num_replicates
+        self.image_keys: List[str] = []
+        self.image_stats: List[np.ndarray] = []
+        self.strata = strata
+
+    def __len__(self) -> int:
+        """Number of counted images."""
+        return self.num_images
+
+    def __contains__(self, name: str) -> bool:
+        """Check whether an image is counted."""
+        return name in self.names
+
+    def add(
+        self, name: Optional[str], hist: np.ndarray, gt_id_set: Set[int]
+    ) -> None:
+        """Count the histogram of an image."""
+        if name is not None:
+            assert name not in self.names
+            self.names.add(name)
+        self.hist += hist
+        self.gt_id_set.update(gt_id_set)
+        self.num_images += 1
+        if self.num_replicates > 0:
+            diag = np.diag(hist)
+            self.image_keys.append("" if name is None else name)
+            self.image_stats.append(
+                np.stack([diag, hist.sum(1), hist.sum(0)], axis=1).astype(
+                    np.int64
+                )
+            )
+
+    def process(
+        self, gt_mask: np.ndarray, pred_mask: np.ndarray, name: Optional[str]
+    ) -> Tuple[Optional[str], np.ndarray, Set[int]]:
+        """Compute the histogram of the label maps of an image."""
+        return (name,) + image_hist(gt_mask, pred_mask, self.num_classes)
+
+    def update(
+        self,
+        gt_mask: np.ndarray,
+        pred_mask: np.ndarray,
+        name: Optional[str] = None,
+    ) -> None:
+        """Evaluate the label maps of an image, which may be named."""
+        self.submit(partial(self.process, gt_mask, pred_mask, name))
+
+    def accumulate(
+        self, stats: Tuple[Optional[str], np.ndarray, Set[int]]
+    ) -> None:
+        """Count the histogram of an image."""
+        self.add(*stats)
+
+    def save(self, path: str) -> None:
+        """Save the state atomically."""
+        os.makedirs(osp.dirname(osp.abspath(path)), exist_ok=True)
+        tmp_path = path + ".tmp.npz"
+        np.savez_compressed(
+            tmp_path,
+            mode=self.mode,
+            hist=self.hist,
+            gt_ids=np.array(sorted(self.gt_id_set), dtype=np.int64),
+            names=np.array(sorted(self.names), dtype=str),
+            num_images=self.num_images,
+            image_keys=np.array(
+                [self.image_keys[i] for i in self.image_order()], dtype=str
+            ),
+            image_stats=self.stacked_stats(),
+        )
+        os.replace(tmp_path, path)
+
+    def load(self, path: str) -> None:
+        """Load the state saved for the same task."""
+        with np.load(path) as state:
+            assert str(state["mode"]) == self.mode
+            assert state["hist"].shape == self.hist.shape
+            self.hist = state["hist"]
+            self.gt_id_set = set(state["gt_ids"].tolist())
+            self.names = set(state["names"].tolist())
+            self.num_images = int(state["num_images"])
+            if self.num_replicates > 0 and "image_keys" in state:
+                self.image_keys = state["image_keys"].tolist()
+                self.image_stats = list(state["image_stats"])
+        if self.num_replicates > 0 and len(self.image_stats) < len(self):
+            logger.warning(
+                "The intervals only cover the %d of %d images counted "
+                "with their statistics kept",
+                len(self.image_stats),
+                len(self),
+            )
+
+    def image_order(self) -> List[int]:
+        """Order the images with kept statistics by name."""
+        return sorted(
+            range(len(self.image_keys)), key=lambda i: self.image_keys[i]
+        )
+
+    def stacked_stats(self) -> np.ndarray:
+        """Stack the kept statistics of the images, ordered by name."""
+        stats = np.zeros(
+            (len(self.image_stats), self.num_classes, 3), dtype=np.int64
+        )
+        for i, j in enumerate(self.image_order()):
+            stats[i] = self.image_stats[j]
+        return stats
+
+    def bootstrap(self, valid: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Compute the replicates of the mIoU and the IoUs of the classes.
+
+        The mIoU of a replicate averages the `valid` classes in its ground
+        truth, and the IoU of a class is 0 in the replicates without it.
+        """
+        sums = bootstrap_sums(
+            self.stacked_stats(),
+            self.num_replicates,
+            strata=[
+                self.strata.get(self.image_keys[i], "")
+                for i in self.image_order()
+            ]
+            if self.strata is not None
+            else None,
+        )
+        inters, gt_pixels, pred_pixels = np.moveaxis(sums, -1, 0)
+        unions = gt_pixels + pred_pixels - inters
+        ious = inters / np.maximum(unions, 1) * 100
+        present = (gt_pixels > 0) & valid
+        with np.errstate(invalid="ignore"):
+            mious = (ious * present).sum(1) / present.sum(1)
+        return mious, ious
+
+    def compute(self) -> Dict[str, float]:
+        """Compute the IoUs of the counted images."""
+        self.sync()
+        gt_id_set = set(self.gt_id_set)
+        categories = list(self.categories)
+        if 255 in gt_id_set:
+            gt_id_set.remove(255)
+        if self.mode == "drivable":
+            background = len(categories) - 1
+            if background in gt_id_set:
+                gt_id_set.remove(background)
+            categories.remove("background")
+        logger.info("GT id set [%s]", ",".join(str(s) for s in gt_id_set))
+        ious = per_class_iu(self.hist) * 100
+        miou = np.mean(ious[list(gt_id_set)])
+
+        names = ["miou"] + categories
+        values = [miou] + ious[: len(categories)].tolist()
+        iou_dict = dict(zip(names, values))
+        if self.num_replicates > 0 and self.image_stats:
+            valid = np.ones(self.num_classes, dtype=bool)
+            if self.mode == "drivable":
+                valid[-1] = False
+            mious, ious_reps = self.bootstrap(valid)
+            lower, upper = confidence_interval(
+                np.concatenate([mious[:, None], ious_reps], axis=1)
+            )
+            for i, name in enumerate(names):
+                iou_dict[name + "_lower"] = lower[i]
+                iou_dict[name + "_upper"] = upper[i]
+
+        for name, title in zip(names, ["mIoU"] + categories):
+            if name + "_lower" in iou_dict:
+                logger.info(
+                    "{}: {:.2f} [{:.2f}, {:.2f}]".format(
+                        title,
+                        iou_dict[name],
+                        iou_dict[name + "_lower"],
+                        iou_dict[name + "_upper"],
+                    )
+                )
+            else:
+                logger.info("{}: {:.2f}".format(title, iou_dict[name]))
+        return iou_dict
 
 
 def evaluate_segmentation(
@@ -47,59 +297,158 @@ def evaluate_segmentation(
     res_dir: str,
     mode: str = "sem_seg",
     nproc: int = 4,
+    checkpoint: Optional[str] = None,
+    image_file: Optional[str] = None,
+    worst_k: int = WORST_K,
+    num_replicates: int = 0,
+    sample: Optional[Dict[str, str]] = None,
 ) -> Dict[str, float]:
-    """Evaluate segmentation IoU from input folders."""
-    assert mode in ["sem_seg", "drivable"]
-    label_defs = {
-        "sem_seg": labels,
-        "drivable": drivables,
-    }[mode]
-    categories = [label.name for label in label_defs if label.trainId != 255]
-    num_classes = len(categories)
-
-    gt_imgs = list_files(gt_dir, ".png")
-    res_imgs = list_files(res_dir, ".png")
-    logger.info("Found %d results", len(gt_imgs))
-    for gt_img, res_img in zip(gt_imgs, res_imgs):
-        assert gt_img == res_img
-
-    gt_paths = [osp.join(gt_dir, img) for img in gt_imgs]
-    res_paths = [osp.join(res_dir, img) for img in gt_imgs]
+    """Evaluate segmentation IoU from input folders.
+
+    With a `checkpoint`, the evaluation resumes from the state saved there,
+    if any, and saves it every `CHECKPOINT_INTERVAL` images. The results
+    are then allowed to cover only part of the ground truth, so a folder
+    can be evaluated while the predictions are still being written, and
+    each run only counts the new ones.
+
+    If `image_file` is given, the IoU and the ground truth pixels of each
+    class of each image counted by this run are saved there, with the
+    `worst_k` images of each class by IoU.
+
+    With `num_replicates` bootstrap replicates over the images, the 95%
+    confidence intervals of the IoUs are also reported.
+
+    If a `sample` of the images is given with their strata, only those
+    images are evaluated, and resampled within their strata.
+    """
+    evaluator = SegEvaluator(
+        mode, num_replicates=num_replicates, strata=sample
+    )
+    if checkpoint is not None and osp.exists(checkpoint):
+        evaluator.load(checkpoint)
+        logger.info("Resumed from %d counted results", len(evaluator))
+
+    gt_imgs = list_masks(gt_dir)
+    res_imgs = list_masks(res_dir)
+    logger.info("Found %d results", len(res_imgs))
+    if sample is not None:
+        assert set(sample) <= set(gt_imgs)
+        res_set = set(res_imgs)
+        if checkpoint is None:
+            assert set(sample) <= res_set
+        res_imgs = [img for img in sample if img in res_set]
+    elif checkpoint is None:
+        assert gt_imgs == res_imgs
+    else:
+        assert set(res_imgs) <= set(gt_imgs)
+    imgs = [img for img in res_imgs if img not in evaluator]
+    img_names: List[str] = []
+    img_ious: List[np.ndarray] = []
+    img_gt_pixels: List[np.ndarray] = []
 
     with Pool(nproc) as pool:
-        hist_and_gt_id_sets = pool.starmap(
-            partial(per_image_hist, num_classes=num_classes),
-            tqdm(zip(gt_paths, res_paths), total=len(gt_imgs)),
+        for img, [(hist, gt_id_set)] in tqdm(
+            pool.imap_unordered(
+                partial(eval_image, gt_dir, [res_dir], evaluator.num_classes),
+                imgs,
+            ),
+            total=len(imgs),
+        ):
+            evaluator.add(img, hist, gt_id_set)
+            if image_file is not None:
+                img_names.append(img)
+                img_ious.append(per_image_iu(hist).astype(np.float32))
+                img_gt_pixels.append(hist.sum(1).astype(np.int64))
+            if checkpoint is not None and (
+                len(evaluator) % CHECKPOINT_INTERVAL == 0
+            ):
+                evaluator.save(checkpoint)
+    if checkpoint is not None:
+        evaluator.save(checkpoint)
+        logger.info(
+            "Counted %d of %d ground truth images",
+            len(evaluator),
+            len(gt_imgs),
+        )
+    if image_file is not None:
+        order = np.argsort(img_names)
+        shape = (len(order), evaluator.num_classes)
+        ious = np.array(img_ious, dtype=np.float32).reshape(shape)
+        gt_pixels = np.array(img_gt_pixels, dtype=np.int64).reshape(shape)
+        save_breakdown(
+            image_file,
+            [img_names[i] for i in order],
+            evaluator.categories,
+            ious[order],
+            worst_k,
+            gt_pixels=gt_pixels[order],
         )
-    hist = np.zeros((num_classes, num_classes))
-    gt_id_set = set()
-    for (hist_, gt_id_set_) in hist_and_gt_id_sets:
-        hist += hist_
-        gt_id_set.update(gt_id_set_)
-
-    if 255 in gt_id_set:
-        gt_id_set.remove(255)
-    if mode == "drivable":
-        background = len(categories) - 1
-        if background in gt_id_set:
-            gt_id_set.remove(background)
-        categories.remove("background")
-    logger.info("GT id set [%s]", ",".join(str(s) for s in gt_id_set))
-    ious = per_class_iu(hist) * 100
-    miou = np.mean(ious[list(gt_id_set)])
-
-    iou_dict = dict(miou=miou)
-    logger.info("mIoU: {:.2f}".format(miou))
-    for category, iou in zip(categories, ious):
-        iou_dict[category] = iou
-        logger.info("{}: {:.2f}".format(category, iou))
-    return iou_dict
+    return evaluator.compute()
+
+
+def evaluate_segmentation_dirs(
+    gt_dir: str,
+    res_dirs: List[str],
+    mode: str = "sem_seg",
+    nproc: int = 4,
+    num_replicates: int = 0,
+    sample: Optional[Dict[str, str]] = None,
+) -> List[Dict[str, float]]:
+    """Evaluate segmentation IoU of several result folders at once.
+
+    Each ground truth image is read once and compared with all the results,
+    which all have to cover the ground truth, or the `sample` of it if any.
+    """
+    evaluators = [
+        SegEvaluator(mode, num_replicates=num_replicates, strata=sample)
+        for _ in res_dirs
+    ]
+    gt_imgs = list_masks(gt_dir)
+    for res_dir in res_dirs:
+        res_imgs = list_masks(res_dir)
+        logger.info("Found %d results in %s", len(res_imgs), res_dir)
+        if sample is not None:
+            assert set(sample) <= set(gt_imgs) & set(res_imgs)
+        else:
+            assert gt_imgs == res_imgs
+    if sample is not None:
+        gt_imgs = list(sample)
+
+    with Pool(nproc) as pool:
+        for img, hists in tqdm(
+            pool.imap_unordered(
+                partial(
+                    eval_image, gt_dir, res_dirs, evaluators[0].num_classes
+                ),
+                gt_imgs,
+            ),
+            total=len(gt_imgs),
+        ):
+            for evaluator, (hist, gt_id_set) in zip(evaluators, hists):
+                evaluator.add(img, hist, gt_id_set)
+
+    results = []
+    for res_dir, evaluator in zip(res_dirs, evaluators):
+        logger.info("Results of %s", res_dir)
+        results.append(evaluator.compute())
+    return results
 
 
 def evaluate_drivable(
-    gt_dir: str, result_dir: str, nproc: int = 4
+    gt_dir: str,
+    result_dir: str,
+    nproc: int = 4,
+    checkpoint: Optional[str] = None,
+    num_replicates: int = 0,
+    sample: Optional[Dict[str, str]] = None,
 ) -> Dict[str, float]:
     """Evaluate drivable area."""
     return evaluate_segmentation(
-        gt_dir, result_dir, mode="drivable", nproc=nproc
+        gt_dir,
+        result_dir,
+        mode="drivable",
+        nproc=nproc,
+        checkpoint=checkpoint,
+        num_replicates=num_replicates,
+        sample=sample,
     )
@@ -1,9 +1,17 @@
 """Test cases for mot.py."""
 import os
+import shutil
+import tempfile
 
 import numpy as np
 
-from .seg import evaluate_segmentation, fast_hist
+from ..common.mask_io import load_mask
+from .seg import (
+    SegEvaluator,
+    evaluate_segmentation,
+    evaluate_segmentation_dirs,
+    fast_hist,
+)
 
 
 def test_fast_hist() -> None:
@@ -33,3 +41,149 @@ def test_ious_miou() -> None:
     )
     for key, val in gt_ious.items():
         assert np.isclose(ious[key], val)
+
+
+def test_checkpoint() -> None:
+    """Check the evaluation resumes from a checkpoint."""
+    cur_dir = os.path.dirname(os.path.abspath(__file__))
+    a_dir = "{}/testcases/seg/gt".format(cur_dir)
+    b_dir = "{}/testcases/seg/pred".format(cur_dir)
+    ious = evaluate_segmentation(a_dir, b_dir)
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        res_dir = os.path.join(tmp_dir, "pred")
+        os.makedirs(res_dir)
+        checkpoint = os.path.join(tmp_dir, "state.npz")
+        # no result is written yet
+        evaluate_segmentation(a_dir, res_dir, checkpoint=checkpoint)
+        evaluator = SegEvaluator()
+        evaluator.load(checkpoint)
+        assert len(evaluator) == 0
+
+        shutil.copy(os.path.join(b_dir, "a.png"), res_dir)
+        for _ in range(2):
+            resumed = evaluate_segmentation(
+                a_dir, res_dir, checkpoint=checkpoint
+            )
+            for key, val in ious.items():
+                assert np.isclose(resumed[key], val)
+        evaluator.load(checkpoint)
+        assert "a.png" in evaluator
+        assert len(evaluator) == 1
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def test_evaluator() -> None:
+    """Check the array evaluator matches the folder evaluation."""
+    cur_dir = os.path.dirname(os.path.abspath(__file__))
+    a_dir = "{}/testcases/seg/gt".format(cur_dir)
+    b_dir = "{}/testcases/seg/pred".format(cur_dir)
+    ious = evaluate_segmentation(a_dir, b_dir)
+
+    gt_mask = load_mask(os.path.join(a_dir, "a.png"))
+    pred_mask = load_mask(os.path.join(b_dir, "a.png"))
+    with SegEvaluator(num_threads=2) as evaluator:
+        for _ in range(3):
+            evaluator.update(gt_mask, pred_mask)
+        array_ious = evaluator.compute()
+    assert len(evaluator) == 3
+    for key, val in ious.items():
+        assert np.isclose(array_ious[key], val)
+
+
+def test_several_results() -> None:
+    """Check several results are evaluated like one by one."""
+    cur_dir = os.path.dirname(os.path.abspath(__file__))
+    a_dir = "{}/testcases/seg/gt".format(cur_dir)
+    b_dir = "{}/testcases/seg/pred".format(cur_dir)
+    results = evaluate_segmentation_dirs(a_dir, [b_dir, a_dir])
+    assert len(results) == 2
+    for res_dir, result in zip([b_dir, a_dir], results):
+        ious = evaluate_segmentation(a_dir, res_dir)
+        for key, val in ious.items():
+            assert np.isclose(result[key], val)
+
+
+def test_image_file() -> None:
+    """Check the per-image IoUs are saved."""
+    cur_dir = os.path.dirname(os.path.abspath(__file__))
+    a_dir = "{}/testcases/seg/gt".format(cur_dir)
+    b_dir = "{}/testcases/seg/pred".format(cur_dir)
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        image_file = os.path.join(tmp_dir, "images.npz")
+        ious = evaluate_segmentation(a_dir, b_dir, image_file=image_file)
+        with np.load(image_file) as breakdown:
+            assert breakdown["names"].tolist() == ["a.png"]
+            # a single image has the same IoUs as the dataset
+            assert np.isclose(breakdown["scores"][0, 0] * 100, ious["road"])
+            assert np.isnan(breakdown["scores"][0, -1])
+            assert breakdown["worst"][0].tolist()[0] == 0
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def test_bootstrap() -> None:
+    """Check the confidence intervals cover the point estimates."""
+    rng = np.random.default_rng(0)
+    masks = []
+    for _ in range(10):
+        gt_mask = rng.integers(3, size=(8, 8), dtype=np.uint8)
+        pred_mask = gt_mask.copy()
+        pred_mask[rng.random((8, 8)) < 0.3] = rng.integers(3)
+        masks.append((gt_mask, pred_mask))
+
+    evaluator = SegEvaluator()
+    bootstrapped = SegEvaluator(num_replicates=200)
+    for gt_mask, pred_mask in masks:
+        evaluator.update(gt_mask, pred_mask)
+        bootstrapped.update(gt_mask, pred_mask)
+    ious = evaluator.compute()
+    ious_ci = bootstrapped.compute()
+    for key, val in ious.items():
+        assert np.isclose(ious_ci[key], val)
+        assert ious_ci[key + "_lower"] <= val + 1e-6
+        assert ious_ci[key + "_upper"] >= val - 1e-6
+    assert ious_ci["miou_lower"] < ious_ci["miou_upper"]
+    assert ious_ci["train_lower"] == ious_ci["train_upper"] == 0
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        checkpoint = os.path.join(tmp_dir, "state.npz")
+        bootstrapped.save(checkpoint)
+        resumed = SegEvaluator(num_replicates=200)
+        resumed.load(checkpoint)
+        for key, val in resumed.compute().items():
+            assert np.isclose(ious_ci[key], val)
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def test_sample() -> None:
+    """Check only the images of a sample are evaluated."""
+    cur_dir = os.path.dirname(os.path.abspath(__file__))
+    a_dir = "{}/testcases/seg/gt".format(cur_dir)
+    b_dir = "{}/testcases/seg/pred".format(cur_dir)
+    ious = evaluate_segmentation(a_dir, b_dir)
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        gt_dir = os.path.join(tmp_dir, "gt")
+        os.makedirs(gt_dir)
+        for name in ["a.png", "b.png", "c.png"]:
+            shutil.copy(os.path.join(a_dir, "a.png"), gt_dir + "/" + name)
+        # the result only covers the sampled image
+        sample = {"b.png": "clear"}
+        res_dir = os.path.join(tmp_dir, "pred")
+        os.makedirs(res_dir)
+        shutil.copy(os.path.join(b_dir, "a.png"), res_dir + "/b.png")
+        sampled = evaluate_segmentation(
+            gt_dir, res_dir, num_replicates=10, sample=sample
+        )
+        for key, val in ious.items():
+            assert np.isclose(sampled[key], val)
+            assert np.isclose(sampled[key + "_lower"], val)
+    finally:
+        shutil.rmtree(tmp_dir)
@@ -0,0 +1,79 @@
+"""Manifest of the converted files for incremental conversions.
+
+The manifest is saved next to the outputs and maps each output file to the
+hash of everything it is generated from, i.e., the content of the frame or
+input file and the conversion config. A later conversion to the same folder
+only regenerates the outputs whose hash changed or whose file is missing.
+"""
+
+import hashlib
+import json
+import os
+from typing import Dict, Iterable, Optional, Tuple
+
+MANIFEST_NAME = ".manifest.json"
+# read the input files by blocks of 1MB for hashing
+BLOCK_SIZE = 1 << 20
+
+
+def hash_content(*contents: object) -> str:
+    """Hash JSON serializable contents."""
+    content = json.dumps(contents, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(content.encode()).hexdigest()
+
+
+def hash_file(file_path: str, *contents: object) -> str:
+    """Hash the bytes of a file together with extra contents."""
+    sha1 = hashlib.sha1()
+    with open(file_path, "rb") as fp:
+        for block in iter(lambda: fp.read(BLOCK_SIZE), b""):
+            sha1.update(block)
+    sha1.update(hash_content(*contents).encode())
+    return sha1.hexdigest()
+
+
+class Manifest:
+    """Hashes of the output files in a folder."""
+
+    def __init__(self, out_base: str, force: bool = False) -> None:
+        """Load the manifest in the output folder.
+
+        If `force` is set, the previous hashes are discarded and all the
+        outputs are regenerated.
+        """
+        self.out_base = out_base
+        self.path = os.path.join(out_base, MANIFEST_NAME)
+        self.hashes: Dict[str, str] = {}
+        if not force and os.path.exists(self.path):
+            with open(self.path, encoding="utf-8") as fp:
+                self.hashes = json.load(fp)
+
+    def key(self, out_path: str) -> str:
+        """The key of an output file, relative to the output folder."""
+        return os.path.relpath(out_path, self.out_base)
+
+    def is_updated(
+        self, out_path: str, digest: str, exists: Optional[bool] = None
+    ) -> bool:
+        """Check whether an output exists and was generated from `digest`.
+
+        `exists` replaces the check of the output file, e.g., for the
+        outputs saved in archives.
+        """
+        if exists is None:
+            exists = os.path.exists(out_path)
+        return exists and self.hashes.get(self.key(out_path)) == digest
+
+    def update(self, items: Iterable[Tuple[str, str]]) -> None:
+        """Record the hashes of the generated outputs and save them."""
+        for out_path, digest in items:
+            self.hashes[self.key(out_path)] = digest
+        self.save()
+
+    def save(self) -> None:
+        """Save the manifest atomically."""
+        os.makedirs(self.out_base, exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as fp:
+            json.dump(self.hashes, fp, sort_keys=True, indent=0)
+        os.replace(tmp_path, self.path)
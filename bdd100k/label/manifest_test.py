@@ -0,0 +1,57 @@
+"""Test cases for manifest.py."""
+import os
+import shutil
+import unittest
+
+from .manifest import MANIFEST_NAME, Manifest, hash_content, hash_file
+
+
+class TestManifest(unittest.TestCase):
+    """Test cases for the manifest of the converted files."""
+
+    test_out = "./test_manifest"
+
+    def setUp(self) -> None:
+        """Create the output folder with an output file."""
+        os.makedirs(self.test_out, exist_ok=True)
+        self.out_path = os.path.join(self.test_out, "a", "0.png")
+        os.makedirs(os.path.dirname(self.out_path), exist_ok=True)
+        with open(self.out_path, "wb") as fp:
+            fp.write(b"mask")
+
+    def test_hash(self) -> None:
+        """Check the hashes depend on the contents and the config."""
+        self.assertEqual(hash_content([1, 2], "a"), hash_content([1, 2], "a"))
+        self.assertNotEqual(hash_content([1, 2]), hash_content([2, 1]))
+        self.assertNotEqual(
+            hash_file(self.out_path, "sem_seg"),
+            hash_file(self.out_path, "drivable"),
+        )
+
+    def test_update(self) -> None:
+        """Check the outputs are updated only with the same hash."""
+        manifest = Manifest(self.test_out)
+        self.assertFalse(manifest.is_updated(self.out_path, "0"))
+        manifest.update([(self.out_path, "0")])
+        self.assertTrue(
+            os.path.exists(os.path.join(self.test_out, MANIFEST_NAME))
+        )
+        self.assertEqual(manifest.hashes, {os.path.join("a", "0.png"): "0"})
+
+        manifest = Manifest(self.test_out)
+        self.assertTrue(manifest.is_updated(self.out_path, "0"))
+        self.assertFalse(manifest.is_updated(self.out_path, "1"))
+        self.assertFalse(
+            Manifest(self.test_out, force=True).is_updated(self.out_path, "0")
+        )
+
+        os.remove(self.out_path)
+        self.assertFalse(manifest.is_updated(self.out_path, "0"))
+
+    def tearDown(self) -> None:
+        """Remove the output folder."""
+        shutil.rmtree(self.test_out)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+"""Test cases for rasterize.py."""
+import unittest
+
+import numpy as np
+from scalabel.label.typing import ImageSize, Poly2D
+
+from .rasterize import fill_rings, poly2ds_to_index_map, poly_to_points
+
+SHAPE = ImageSize(height=12, width=14)
+
+
+class TestFillRings(unittest.TestCase):
+    """Test cases for the polygon filling."""
+
+    def test_rectangle(self) -> None:
+        """Check the pixels of an axis-aligned rectangle."""
+        index_map = np.zeros((12, 14), dtype=np.int32)
+        ring = np.array([[2, 3], [9, 3], [9, 8], [2, 8]], dtype=np.float64)
+        fill_rings(index_map, [ring], 1)
+        gt_map = np.zeros((12, 14), dtype=np.int32)
+        gt_map[3:8, 2:9] = 1
+        self.assertTrue((index_map == gt_map).all())
+
+    def test_non_zero_winding(self) -> None:
+        """Check overlapping rings are not cancelled out."""
+        index_map = np.zeros((12, 14), dtype=np.int32)
+        outer = np.array([[1, 1], [11, 1], [11, 11], [1, 11]], dtype=float)
+        inner = np.array([[3, 3], [6, 3], [6, 6], [3, 6]], dtype=float)
+        fill_rings(index_map, [outer, inner], 2)
+        self.assertEqual(np.count_nonzero(index_map == 2), 100)
+
+    def test_out_of_image(self) -> None:
+        """Check the rings are clipped by the image border."""
+        index_map = np.zeros((12, 14), dtype=np.int32)
+        ring = np.array([[-5, -5], [4, -5], [4, 3], [-5, 3]], dtype=float)
+        fill_rings(index_map, [ring], 1)
+        self.assertEqual(np.count_nonzero(index_map), 12)
+        self.assertTrue((index_map[:3, :4] == 1).all())
+
+
+class TestPolyToPoints(unittest.TestCase):
+    """Test cases for flattening the Bezier curves."""
+
+    def test_bezier(self) -> None:
+        """Check the curve goes through its end points."""
+        vertices = np.array(
+            [[0, 0], [0, 10], [10, 10], [10, 0], [20, 0]], dtype=float
+        )
+        points = poly_to_points(vertices, "LCCLL")
+        self.assertTrue((points[0] == vertices[0]).all())
+        self.assertTrue((points[-2] == vertices[3]).all())
+        self.assertTrue((points[-1] == vertices[4]).all())
+        self.assertGreater(len(points), len(vertices))
+        self.assertTrue((points[:, 1] <= 7.5).all())
+
+
+class TestPoly2DsToIndexMap(unittest.TestCase):
+    """Test cases for rendering poly2ds into an index map."""
+
+    def test_painting_order(self) -> None:
+        """Check later polygons are painted over earlier ones."""
+        first = Poly2D(
+            vertices=[[0, 0], [8, 0], [8, 8], [0, 8]],
+            types="LLLL",
+            closed=True,
+        )
+        second = Poly2D(
+            vertices=[[4, 4], [12, 4], [12, 12], [4, 12]],
+            types="LLLL",
+            closed=True,
+        )
+        index_map = poly2ds_to_index_map(SHAPE, [[first], [second]])
+        self.assertEqual(np.count_nonzero(index_map == 1), 48)
+        self.assertEqual(np.count_nonzero(index_map == 2), 64)
+        self.assertEqual(index_map[5, 5], 2)
+
+    def test_open_polyline(self) -> None:
+        """Check an open line is stroked around the snapped vertices."""
+        line = Poly2D(vertices=[[1, 2], [12, 2]], types="LL", closed=False)
+        index_map = poly2ds_to_index_map(SHAPE, [[line]], closed=False)
+        gt_map = np.zeros((12, 14), dtype=np.int32)
+        gt_map[1:4, 1:13] = 1
+        self.assertTrue((index_map == gt_map).all())
+
+
+if __name__ == "__main__":
+    unittest.main()
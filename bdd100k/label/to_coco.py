@@ -24,7 +24,6 @@ from multiprocessing import Pool
 from typing import Dict, List, Tuple
 
 import numpy as np
-from PIL import Image
 from scalabel.label.coco_typing import AnnType, GtType, ImgType, VidType
 from scalabel.label.io import group_and_sort, load
 from scalabel.label.to_coco import (
@@ -32,7 +31,7 @@ from scalabel.label.to_coco import (
     scalabel2coco_detection,
     set_seg_object_geometry,
 )
-from scalabel.label.transforms import get_coco_categories, mask_to_bbox
+from scalabel.label.transforms import get_coco_categories
 from scalabel.label.typing import Config, Frame, ImageSize
 from scalabel.label.utils import (
     check_crowd,
@@ -41,20 +40,20 @@ from scalabel.label.utils import (
 )
 from tqdm import tqdm
 
+from ..common.bitmask import decode_bitmask
 from ..common.logger import logger
+from ..common.mask_io import list_masks, load_mask
 from ..common.typing import BDD100KConfig, InstanceType
 from ..common.utils import (
     get_bdd100k_instance_id,
     group_and_sort_files,
-    list_files,
     load_bdd100k_config,
 )
 from .to_scalabel import bdd100k_to_scalabel
 
 
-def parse_args() -> argparse.Namespace:
-    """Parse arguments."""
-    parser = argparse.ArgumentParser(description="bdd100k to coco format")
+def add_label_args(parser: argparse.ArgumentParser) -> None:
+    """Add the arguments for loading the bdd100k labels."""
     parser.add_argument(
         "-i",
         "--input",
@@ -63,6 +62,47 @@ def parse_args() -> argparse.Namespace:
             "json file"
         ),
     )
+    parser.add_argument(
+        "--nproc",
+        type=int,
+        default=4,
+        help="number of processes for conversion",
+    )
+    parser.add_argument(
+        "--config",
+        type=str,
+        default=None,
+        help="Configuration for the categories",
+    )
+
+
+def add_ignore_args(parser: argparse.ArgumentParser) -> None:
+    """Add the flags for handling the ignored annotations."""
+    parser.add_argument(
+        "--remove-ignore",
+        action="store_true",
+        help="remove the ignored annotations from the labels.",
+    )
+    parser.add_argument(
+        "--ignore-as-class",
+        action="store_true",
+        help="convert the ignored annotations to the `ignored` class.",
+    )
+
+
+def set_ignore_args(
+    bdd100k_config: BDD100KConfig, args: argparse.Namespace
+) -> None:
+    """Apply the handling of the ignored annotations given as arguments."""
+    bdd100k_config.remove_ignore |= args.remove_ignore
+    bdd100k_config.ignore_as_class |= args.ignore_as_class
+
+
+def parse_args() -> argparse.Namespace:
+    """Parse arguments."""
+    parser = argparse.ArgumentParser(description="bdd100k to coco format")
+    add_label_args(parser)
+    add_ignore_args(parser)
     parser.add_argument(
         "-o",
         "--output",
@@ -90,18 +130,6 @@ def parse_args() -> argparse.Namespace:
         choices=["rle", "polygon"],
         help="conversion mode: rle or polygon.",
     )
-    parser.add_argument(
-        "--nproc",
-        type=int,
-        default=4,
-        help="number of processes for conversion",
-    )
-    parser.add_argument(
-        "--config",
-        type=str,
-        default=None,
-        help="Configuration for COCO categories",
-    )
     parser.add_argument(
         "-mb",
         "--mask-base",
@@ -120,39 +148,22 @@ def bitmasks_loader(mask_name: str) -> Tuple[List[InstanceType], ImageSize]:
     """Parse instances from the bitmask."""
     if mask_name.endswith(".jpg"):
         mask_name = mask_name.replace(".jpg", ".png")
-    bitmask = np.asarray(Image.open(mask_name)).astype(np.int32)
-    category_map = bitmask[:, :, 0]
-    attributes_map = bitmask[:, :, 1]
-    instance_map = (bitmask[:, :, 2] << 8) + bitmask[:, :, 3]
+    bitmask = load_mask(mask_name)
+    decoded = decode_bitmask(bitmask)
 
     instances: List[InstanceType] = []
-
-    # 0 is for the background
-    instance_ids = np.sort(np.unique(instance_map[instance_map >= 1]))
-    for instance_id in instance_ids:
-        mask_inds_i = instance_map == instance_id
-        attributes_i = np.unique(attributes_map[mask_inds_i])
-        category_ids_i = np.unique(category_map[mask_inds_i])
-
-        assert attributes_i.shape[0] == 1
-        assert category_ids_i.shape[0] == 1
-        attribute = attributes_i[0]
-        category_id = category_ids_i[0]
-
-        mask = mask_inds_i.astype(np.int32)
-        bbox = mask_to_bbox(mask)
-        area = np.sum(mask).tolist()
-
+    for i, instance_id in enumerate(decoded.instance_ids):
+        attribute = decoded.attributes[i]
         instance = InstanceType(
             instance_id=int(instance_id),
-            category_id=int(category_id),
+            category_id=int(decoded.category_ids[i]),
             truncated=bool(attribute & (1 << 3)),
             occluded=bool(attribute & (1 << 2)),
             crowd=bool(attribute & (1 << 1)),
             ignore=bool(attribute & (1 << 0)),
-            mask=mask,
-            bbox=bbox,
-            area=area,
+            mask=(decoded.masks == i + 1).astype(np.int32),
+            bbox=decoded.bboxes[i].tolist(),
+            area=int(decoded.areas[i]),
         )
         instances.append(instance)
 
@@ -225,7 +236,7 @@ def bitmask2coco_with_ids(
     mask_mode: str = "rle",
 ) -> List[AnnType]:
     """Convert bitmasks annotations of an image to RLEs or polygons."""
-    bitmask = np.asarray(Image.open(mask_name)).astype(np.int32)
+    bitmask = load_mask(mask_name).astype(np.int32)
     category_map = bitmask[..., 0]
     instance_map = (bitmask[..., 2] << 2) + bitmask[..., 3]
     for annotation, category_id, instance_id in zip(
@@ -279,7 +290,7 @@ def bitmask2coco_ins_seg(
     nproc: int = 4,
 ) -> GtType:
     """Converting BDD100K Instance Segmentation Set to COCO format."""
-    files = list_files(mask_base, suffix=".png")
+    files = list_masks(mask_base)
 
     images: List[ImgType] = []
     image_ids: List[int] = []
@@ -317,7 +328,7 @@ def bitmask2coco_seg_track(
     videos: List[VidType] = []
     images: List[ImgType] = []
     image_ids: List[int] = []
-    all_files = list_files(mask_base, suffix=".png")
+    all_files = list_masks(mask_base)
     files_list = group_and_sort_files(all_files)
 
     logger.info("Collecting bitmasks...")
@@ -605,6 +616,7 @@ def main() -> None:
             bdd100k_config = BDD100KConfig(config=dataset.config)
         if bdd100k_config is None:
             bdd100k_config = load_bdd100k_config(args.mode)
+        set_ignore_args(bdd100k_config, args)
 
         logger.info("Start format converting...")
         frames = bdd100k_to_scalabel(dataset.frames, bdd100k_config)
@@ -1,17 +1,43 @@
 """Test cases for to_coco.py."""
+import argparse
 import os
 import unittest
 
 from ..common.utils import load_bdd100k_config
 from .to_coco import (
+    add_ignore_args,
     bitmask2coco_ins_seg,
     bitmask2coco_seg_track,
     bitmasks_loader,
+    set_ignore_args,
 )
 
 SHAPE = (720, 1280)
 
 
+class TestIgnoreArgs(unittest.TestCase):
+    """Test cases for the flags of the ignored annotations."""
+
+    def test_set_ignore_args(self) -> None:
+        """Check the flags are set on the config without clearing it."""
+        parser = argparse.ArgumentParser()
+        add_ignore_args(parser)
+        for argv, remove_ignore, ignore_as_class in [
+            ([], False, False),
+            (["--remove-ignore"], True, False),
+            (["--ignore-as-class"], False, True),
+        ]:
+            bdd100k_config = load_bdd100k_config("ins_seg")
+            set_ignore_args(bdd100k_config, parser.parse_args(argv))
+            self.assertEqual(bdd100k_config.remove_ignore, remove_ignore)
+            self.assertEqual(bdd100k_config.ignore_as_class, ignore_as_class)
+
+        bdd100k_config = load_bdd100k_config("ins_seg")
+        bdd100k_config.remove_ignore = True
+        set_ignore_args(bdd100k_config, parser.parse_args([]))
+        self.assertTrue(bdd100k_config.remove_ignore)
+
+
 class TestBitmasks2COCO(unittest.TestCase):
     """Test Cases for the direct bitmask to coco conversion."""
 
@@ -20,7 +20,7 @@ import argparse
 import os
 from functools import partial
 from multiprocessing import Pool
-from typing import List
+from typing import List, Optional
 
 import numpy as np
 from PIL import Image
@@ -28,6 +28,7 @@ from tqdm import tqdm
 
 from ..common.logger import logger
 from ..common.utils import group_and_sort_files, list_files
+from .manifest import Manifest, hash_file
 from .palette import get_palette
 
 
@@ -53,6 +54,11 @@ def parse_args() -> argparse.Namespace:
         default=4,
         help="number of processes for conversion.",
     )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="convert all the images, including the up-to-date ones.",
+    )
     return parser.parse_args()
 
 
@@ -76,8 +82,32 @@ def masks_to_colors(
     colormap_files: List[str],
     mode: str,
     nproc: int,
+    manifest: Optional[Manifest] = None,
 ) -> None:
-    """Convert mask/bitmask to colormap for a list of images."""
+    """Convert mask/bitmask to colormap for a list of images.
+
+    If a manifest is given, the colormaps whose masks are unchanged are
+    skipped.
+    """
+    if manifest is not None:
+        digests = [
+            hash_file(bitmask_file, mode) for bitmask_file in bitmasks_files
+        ]
+        outdated = [
+            i
+            for i, (colormap_file, digest) in enumerate(
+                zip(colormap_files, digests)
+            )
+            if not manifest.is_updated(colormap_file, digest)
+        ]
+        logger.info(
+            "Skipped %d images with up-to-date colormaps",
+            len(bitmasks_files) - len(outdated),
+        )
+        bitmasks_files = [bitmasks_files[i] for i in outdated]
+        colormap_files = [colormap_files[i] for i in outdated]
+        digests = [digests[i] for i in outdated]
+
     logger.info("Converting annotations...")
 
     with Pool(nproc) as pool:
@@ -89,12 +119,16 @@ def masks_to_colors(
             ),
         )
 
+    if manifest is not None:
+        manifest.update(zip(colormap_files, digests))
+
 
 def image_dataset_to_colormap(
     in_base: str,
     out_base: str,
     mode: str,
     nproc: int,
+    force: bool = False,
 ) -> None:
     """Convert instance segmentation bitmasks to labelmap."""
     if not os.path.isdir(out_base):
@@ -110,7 +144,13 @@ def image_dataset_to_colormap(
         color_path = os.path.join(out_base, file_name)
         bitmasks_files.append(label_path)
         colormap_files.append(color_path)
-    masks_to_colors(bitmasks_files, colormap_files, mode, nproc)
+    masks_to_colors(
+        bitmasks_files,
+        colormap_files,
+        mode,
+        nproc,
+        manifest=Manifest(out_base, force),
+    )
 
 
 def video_dataset_to_colormap(
@@ -118,6 +158,7 @@ def video_dataset_to_colormap(
     out_base: str,
     mode: str,
     nproc: int,
+    force: bool = False,
 ) -> None:
     """Convert segmentation tracking bitmasks to labelmap."""
     if not os.path.isdir(out_base):
@@ -142,7 +183,13 @@ def video_dataset_to_colormap(
             color_path = os.path.join(out_base, file_name)
             bitmasks_files.append(label_path)
             colormap_files.append(color_path)
-    masks_to_colors(bitmasks_files, colormap_files, mode, nproc)
+    masks_to_colors(
+        bitmasks_files,
+        colormap_files,
+        mode,
+        nproc,
+        manifest=Manifest(out_base, force),
+    )
 
 
 def main() -> None:
@@ -153,7 +200,9 @@ def main() -> None:
         if args.mode == "seg_track"
         else image_dataset_to_colormap
     )
-    colormap_func(args.label, args.output, args.mode, args.nproc)
+    colormap_func(
+        args.label, args.output, args.mode, args.nproc, force=args.force
+    )
 
 
 if __name__ == "__main__":
@@ -16,18 +16,34 @@ the annotations in `ignored` class. To achieve this, add the flag
 `--ignore-as-class`.
 """
 
+import argparse
+import copy
 import os
+import sys
 from functools import partial
+from itertools import chain, groupby, islice, tee
 from multiprocessing import Pool
-from typing import Callable, Dict, List
+from typing import (
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+)
 
-import matplotlib  # type: ignore
-import matplotlib.pyplot as plt  # type: ignore
 import numpy as np
-from PIL import Image
 from scalabel.label.io import group_and_sort, load
-from scalabel.label.transforms import poly_to_patch
-from scalabel.label.typing import Config, Frame, ImageSize, Label, Poly2D
+from scalabel.label.typing import (
+    Config,
+    Dataset,
+    Frame,
+    ImageSize,
+    Label,
+    Poly2D,
+)
 from scalabel.label.utils import (
     check_crowd,
     check_ignored,
@@ -36,39 +52,158 @@ from scalabel.label.utils import (
 from tqdm import tqdm
 
 from ..common.logger import logger
+from ..common.mask_io import (
+    COMPRESS_LEVEL,
+    MASK_FORMATS,
+    SHARD_SIZE,
+    MaskArchive,
+    remove_archive,
+    save_mask,
+    save_shard,
+)
 from ..common.typing import BDD100KConfig
-from ..common.utils import get_bdd100k_instance_id, load_bdd100k_config
-from .label import drivables, labels
-from .to_coco import parse_args
-from .to_scalabel import bdd100k_to_scalabel
+from ..common.utils import (
+    get_bdd100k_instance_id,
+    list_files,
+    load_bdd100k_config,
+)
+from .label import drivables, labels, lane_categories
+from .manifest import Manifest, hash_content
+from .rasterize import poly2ds_to_index_map
+from .to_coco import add_ignore_args, add_label_args, set_ignore_args
+from .to_scalabel import bdd100k_to_scalabel_iter
+
+if sys.version_info >= (3, 8):
+    from typing import Protocol  # pylint: disable=no-name-in-module
+else:
+    from typing_extensions import Protocol
 
 IGNORE_LABEL = 255
 LANE_DIRECTION_MAP = {"parallel": 0, "vertical": 1}
 LANE_STYLE_MAP = {"solid": 0, "dashed": 1}
+BACKENDS = ["native", "matplotlib"]
+MODES = ["sem_seg", "drivable", "lane_mark", "ins_seg", "seg_track"]
+INSTANCE_MODES = ["ins_seg", "seg_track"]
+SEG_CATEGORIES = dict(
+    sem_seg=labels, drivable=drivables, lane_mark=lane_categories
+)
+# number of frames held in memory while waiting for the conversion
+MAX_INFLIGHT = 1024
+
+# output path, image shape, colors and poly2ds of a frame
+MaskTask = Tuple[str, ImageSize, List[np.ndarray], List[List[Poly2D]]]
+
+
+class MaskOptions(NamedTuple):
+    """Options of the rendering of the masks of an output folder."""
+
+    with_instances: bool = True
+    back_color: int = 0
+    closed: bool = True
+    backend: str = "native"
+
+
+class OutputOptions(NamedTuple):
+    """Options of the saving of the masks of a conversion.
+
+    At most `max_inflight` frames are held in memory. Unless `force` is
+    set, the masks up to date in the manifest of their folder are skipped.
+    The png masks are saved with the zlib `compress_level`, and the npz and
+    rle ones in shards of `shard_size` frames.
+    """
+
+    max_inflight: int = MAX_INFLIGHT
+    force: bool = False
+    mask_format: str = "png"
+    compress_level: int = COMPRESS_LEVEL
+    shard_size: int = SHARD_SIZE
+
+
+# tasks, conversion options, manifest and archive of an output folder
+MaskTarget = Tuple[
+    Iterable[MaskTask], MaskOptions, Optional[Manifest], Optional[MaskArchive]
+]
+# tasks and conversion options of a target, with its shard path and format
+MaskShard = Tuple[List[MaskTask], MaskOptions, Optional[Tuple[str, str]]]
+
+
+def parse_args() -> argparse.Namespace:
+    """Parse arguments."""
+    parser = argparse.ArgumentParser(description="bdd100k to masks/bitmasks")
+    add_label_args(parser)
+    add_ignore_args(parser)
+    parser.add_argument(
+        "-o",
+        "--output",
+        nargs="+",
+        help=(
+            "path to save the generated masks/bitmasks, one for each "
+            "conversion mode"
+        ),
+    )
+    parser.add_argument(
+        "-m",
+        "--mode",
+        nargs="+",
+        default=["sem_seg"],
+        choices=MODES,
+        help="conversion modes, rendered in one pass over the labels.",
+    )
+    parser.add_argument(
+        "--backend",
+        default="native",
+        choices=BACKENDS,
+        help=(
+            "rendering backend. matplotlib is the legacy renderer, kept for "
+            "checking the outputs of the native one."
+        ),
+    )
+    parser.add_argument(
+        "--max-inflight",
+        type=int,
+        default=MAX_INFLIGHT,
+        help="maximum number of frames waiting for the conversion.",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="convert all the frames, including the up-to-date ones.",
+    )
+    parser.add_argument(
+        "--format",
+        default="png",
+        choices=MASK_FORMATS,
+        help=(
+            "output format. png saves a file for each frame, npz and rle "
+            "save the masks in shards with an index file."
+        ),
+    )
+    parser.add_argument(
+        "--compress-level",
+        type=int,
+        default=COMPRESS_LEVEL,
+        choices=range(10),
+        help="zlib compression level of the png files.",
+    )
+    parser.add_argument(
+        "--shard-size",
+        type=int,
+        default=SHARD_SIZE,
+        help="number of frames in each shard of the npz/rle formats.",
+    )
+    return parser.parse_args()
 
 
-def frame_to_mask(
-    out_path: str,
-    shape: ImageSize,
-    colors: List[np.ndarray],
-    poly2ds: List[List[Poly2D]],
-    with_instances: bool = True,
-    back_color: int = 0,
-    closed: bool = True,
-) -> None:
-    """Converting a frame of poly2ds to mask/bitmask."""
-    assert len(colors) == len(poly2ds)
-    height, width = shape.height, shape.width
-
-    if with_instances:
-        img = np.ones([height, width, 4], dtype=np.uint8) * back_color
-    else:
-        img = np.ones([height, width, 1], dtype=np.uint8) * back_color
-
-    if len(colors) == 0:
-        pil_img = Image.fromarray(img.squeeze())
-        pil_img.save(out_path)
+def poly2ds_to_index_map_matplotlib(
+    shape: ImageSize, poly2ds: List[List[Poly2D]], closed: bool = True
+) -> np.ndarray:
+    """Render the poly2ds of a frame into an index map with matplotlib."""
+    # pylint: disable=import-outside-toplevel
+    import matplotlib  # type: ignore
+    import matplotlib.pyplot as plt  # type: ignore
+    from scalabel.label.transforms import poly_to_patch
 
+    height, width = shape.height, shape.width
     matplotlib.use("Agg")
     fig = plt.figure(facecolor="0")
     fig.set_size_inches((width / fig.get_dpi()), height / fig.get_dpi())
@@ -88,7 +223,7 @@ def frame_to_mask(
                     # (0, 0, 0) for the background
                     color=(
                         ((i + 1) >> 8) / 255.0,
-                        ((i + 1) % 255) / 255.0,
+                        ((i + 1) & 255) / 255.0,
                         0.0,
                     ),
                     closed=closed,
@@ -96,16 +231,76 @@ def frame_to_mask(
             )
 
     fig.canvas.draw()
-    out = np.frombuffer(fig.canvas.tostring_rgb(), np.uint8)
+    out = np.asarray(fig.canvas.buffer_rgba())[..., :3]
     out = out.reshape((height, width, -1)).astype(np.int32)
     out = (out[..., 0] << 8) + out[..., 1]
     plt.close()
+    return out
+
+
+def colorize_index_map(
+    index_map: np.ndarray,
+    colors: List[np.ndarray],
+    channels: int,
+    back_color: int = 0,
+) -> np.ndarray:
+    """Map an index map to the mask colors with a lookup table.
+
+    Index 0 is the background and index i + 1 takes the i-th color, so the
+    whole frame is composited with a single gather.
+    """
+    lut = np.empty((len(colors) + 1, channels), dtype=np.uint8)
+    lut[0] = back_color
+    if len(colors) > 0:
+        lut[1:] = np.stack(colors).reshape(len(colors), channels)
+    img: np.ndarray = lut[index_map]
+    return img
+
+
+def render_mask(
+    shape: ImageSize,
+    colors: List[np.ndarray],
+    poly2ds: List[List[Poly2D]],
+    with_instances: bool = True,
+    back_color: int = 0,
+    closed: bool = True,
+    backend: str = "native",
+) -> np.ndarray:
+    """Rendering a frame of poly2ds to mask/bitmask."""
+    assert len(colors) == len(poly2ds)
+    assert backend in BACKENDS
+    height, width = shape.height, shape.width
+    channels = 4 if with_instances else 1
+
+    if len(colors) == 0:
+        # nothing to render for the empty frames
+        img = np.full((height, width, channels), back_color, dtype=np.uint8)
+    else:
+        if backend == "native":
+            out = poly2ds_to_index_map(shape, poly2ds, closed)
+        else:
+            out = poly2ds_to_index_map_matplotlib(shape, poly2ds, closed)
+        img = colorize_index_map(out, colors, channels, back_color)
+    img = img.squeeze(axis=2) if channels == 1 else img
+    return img
 
-    for i, color in enumerate(colors):
-        # 0 is for the background
-        img[out == i + 1] = color
-    pil_img = Image.fromarray(img.squeeze())
-    pil_img.save(out_path)
+
+def frame_to_mask(
+    out_path: str,
+    shape: ImageSize,
+    colors: List[np.ndarray],
+    poly2ds: List[List[Poly2D]],
+    with_instances: bool = True,
+    back_color: int = 0,
+    closed: bool = True,
+    backend: str = "native",
+    compress_level: int = COMPRESS_LEVEL,
+) -> None:
+    """Converting a frame of poly2ds to mask/bitmask."""
+    img = render_mask(
+        shape, colors, poly2ds, with_instances, back_color, closed, backend
+    )
+    save_mask(out_path, img, compress_level)
 
 
 def set_instance_color(
@@ -148,6 +343,164 @@ def set_lane_color(label: Label, category_id: int) -> np.ndarray:
     return color
 
 
+def shard_to_masks(
+    shard: List[MaskShard], compress_level: int = COMPRESS_LEVEL
+) -> int:
+    """Converting the frames of a shard to the masks of several targets.
+
+    The masks of a target are saved in PNG files if no archive shard is
+    given, or in the shard otherwise. Return the number of masks.
+    """
+    num_masks = 0
+    for tasks, options, archive_shard in shard:
+        if archive_shard is None:
+            for task in tasks:
+                frame_to_mask(
+                    *task, **options._asdict(), compress_level=compress_level
+                )
+        else:
+            shard_path, mask_format = archive_shard
+            masks = [
+                render_mask(*task[1:], **options._asdict()) for task in tasks
+            ]
+            save_shard(shard_path, masks, mask_format)
+        num_masks += len(tasks)
+    return num_masks
+
+
+def hash_mask_task(task: MaskTask, options: MaskOptions) -> str:
+    """Hash the content of a frame and the config of its conversion."""
+    _, shape, colors, poly2ds = task
+    return hash_content(
+        [shape.height, shape.width],
+        [color.tolist() for color in colors],
+        [[poly.dict() for poly in poly2d] for poly2d in poly2ds],
+        list(options),
+    )
+
+
+def get_archive(out_base: str, mask_format: str) -> Optional[MaskArchive]:
+    """Get the archive of an output folder, or None for PNG files.
+
+    The archive of an output folder converted to PNG files is removed.
+    """
+    assert mask_format in MASK_FORMATS
+    if mask_format == "png":
+        remove_archive(out_base)
+        return None
+    return MaskArchive(out_base, mask_format)
+
+
+def stream_targets_to_masks(
+    nproc: int,
+    targets: List[MaskTarget],
+    output: OutputOptions = OutputOptions(),
+) -> None:
+    """Execute the mask conversion of several targets in one pass.
+
+    The frames are sent to the workers in batches of `max_inflight`, so the
+    memory used by the pending frames does not grow with the dataset. The
+    i-th tasks of all the targets are converted by the same worker, and the
+    tasks whose masks are up to date in the manifest of their target are
+    skipped. If a target has an archive, each worker saves the masks of
+    `shard_size` frames in a shard.
+    """
+    max_inflight, shard_size = output.max_inflight, output.shard_size
+    assert max_inflight > 0
+    items = zip(*[tasks for tasks, _, _, _ in targets])
+    has_archive = any(archive is not None for _, _, _, archive in targets)
+    func = partial(shard_to_masks, compress_level=output.compress_level)
+    num_skipped = 0
+    with Pool(nproc) as pool, tqdm() as pbar:
+        while True:
+            batch = list(islice(items, max_inflight))
+            if len(batch) == 0:
+                break
+            group_size = (
+                shard_size
+                if has_archive
+                else max(len(batch) // (4 * nproc), 1)
+            )
+            num_groups = (len(batch) - 1) // group_size + 1
+            groups_list: List[List[List[MaskTask]]] = []
+            updates_list: List[List[Tuple[str, str]]] = []
+            for j, (_, options, manifest, archive) in enumerate(targets):
+                groups: List[List[MaskTask]] = [[] for _ in range(num_groups)]
+                updates: List[Tuple[str, str]] = []
+                for i, item in enumerate(batch):
+                    task = item[j]
+                    if manifest is not None:
+                        digest = hash_mask_task(task, options)
+                        exists = (
+                            None if archive is None else task[0] in archive
+                        )
+                        if manifest.is_updated(task[0], digest, exists):
+                            num_skipped += 1
+                            pbar.update()
+                            continue
+                        updates.append((task[0], digest))
+                    groups[i // group_size].append(task)
+                groups_list.append(groups)
+                updates_list.append(updates)
+
+            shards: List[List[MaskShard]] = []
+            saved: List[Tuple[MaskArchive, str, List[str]]] = []
+            for k in range(num_groups):
+                shard: List[MaskShard] = []
+                for (_, options, _, archive), groups in zip(
+                    targets, groups_list
+                ):
+                    tasks = groups[k]
+                    if len(tasks) == 0:
+                        continue
+                    archive_shard: Optional[Tuple[str, str]] = None
+                    if archive is not None:
+                        shard_name = archive.next_shard()
+                        archive_shard = (
+                            os.path.join(archive.out_base, shard_name),
+                            archive.mask_format,
+                        )
+                        saved.append(
+                            (archive, shard_name, [task[0] for task in tasks])
+                        )
+                    shard.append((tasks, options, archive_shard))
+                if len(shard) > 0:
+                    shards.append(shard)
+
+            for num_masks in pool.imap_unordered(func, shards):
+                pbar.update(num_masks)
+
+            archives = {id(archive): archive for archive, _, _ in saved}
+            for archive, shard_name, out_paths in saved:
+                archive.update(shard_name, out_paths)
+            for archive in archives.values():
+                archive.save()
+            for (_, _, manifest, _), updates in zip(targets, updates_list):
+                if manifest is not None:
+                    manifest.update(updates)
+    if num_skipped > 0:
+        logger.info("Skipped %d up-to-date masks", num_skipped)
+
+
+def stream_frames_to_masks(
+    nproc: int,
+    tasks: Iterable[MaskTask],
+    options: MaskOptions = MaskOptions(),
+    manifest: Optional[Manifest] = None,
+    archive: Optional[MaskArchive] = None,
+    output: OutputOptions = OutputOptions(),
+) -> None:
+    """Execute the mask conversion in parallel on a stream of frames.
+
+    If a manifest is given, the frames whose masks are up to date are
+    skipped. If an archive is given, the masks are saved in its shards
+    instead of PNG files.
+    """
+    stream_targets_to_masks(
+        nproc, [(tasks, options, manifest, archive)], output
+    )
+
+
 def frames_to_masks(
     nproc: int,
     out_paths: List[str],
@@ -157,73 +510,52 @@ def frames_to_masks(
     with_instances: bool = True,
     back_color: int = 0,
     closed: bool = True,
+    backend: str = "native",
 ) -> None:
     """Execute the mask conversion in parallel."""
-    with Pool(nproc) as pool:
-        pool.starmap(
-            partial(
-                frame_to_mask,
-                with_instances=with_instances,
-                back_color=back_color,
-                closed=closed,
-            ),
-            tqdm(
-                zip(out_paths, shapes, colors_list, poly2ds_list),
-                total=len(out_paths),
-            ),
-        )
+    stream_frames_to_masks(
+        nproc,
+        zip(out_paths, shapes, colors_list, poly2ds_list),
+        MaskOptions(with_instances, back_color, closed, backend),
+    )
 
 
-def seg_to_masks(
-    frames: List[Frame],
+def get_img_shape(
+    image_anns: Frame, img_shape: Optional[ImageSize]
+) -> ImageSize:
+    """Get the image shape from the config or the frame."""
+    if img_shape is not None:
+        return img_shape
+    if image_anns.size is not None:
+        return image_anns.size
+    raise ValueError("Image shape not defined!")
+
+
+def seg_to_mask_tasks(
+    frames: Iterable[Frame],
     out_base: str,
     config: Config,
-    nproc: int = 4,
     mode: str = "sem_seg",
-    back_color: int = IGNORE_LABEL,
-    closed: bool = True,
-) -> None:
-    """Converting segmentation poly2d to 1-channel masks."""
-    os.makedirs(out_base, exist_ok=True)
-    img_shape = config.image_size
-
-    out_paths: List[str] = []
-    shapes: List[ImageSize] = []
-    colors_list: List[List[np.ndarray]] = []
-    poly2ds_list: List[List[List[Poly2D]]] = []
-
-    categories = dict(sem_seg=labels, drivable=drivables)[mode]
+) -> Iterator[MaskTask]:
+    """Prepare the segmentation poly2ds of each frame for the conversion."""
+    categories = SEG_CATEGORIES[mode]
     cat_name2id = {
         cat.name: cat.trainId
         for cat in categories
         if cat.trainId != IGNORE_LABEL
     }
 
-    logger.info("Preparing annotations for Semseg to Bitmasks")
-
-    for image_anns in tqdm(frames):
+    for image_anns in frames:
         # Mask in .png format
         image_name = image_anns.name.replace(".jpg", ".png")
         image_name = os.path.split(image_name)[-1]
         out_path = os.path.join(out_base, image_name)
-        out_paths.append(out_path)
-
-        if img_shape is None:
-            if image_anns.size is not None:
-                img_shape = image_anns.size
-            else:
-                raise ValueError("Image shape not defined!")
-        shapes.append(img_shape)
+        img_shape = get_img_shape(image_anns, config.image_size)
 
         colors: List[np.ndarray] = []
         poly2ds: List[List[Poly2D]] = []
-        colors_list.append(colors)
-        poly2ds_list.append(poly2ds)
-
-        if image_anns.labels is None:
-            continue
 
-        for label in image_anns.labels:
+        for label in image_anns.labels or []:
             if label.category not in cat_name2id:
                 continue
             if label.poly2d is None:
@@ -237,20 +569,49 @@ def seg_to_masks(
             colors.append(color)
             poly2ds.append(label.poly2d)
 
+        yield out_path, img_shape, colors, poly2ds
+
+
+def seg_to_masks(
+    frames: Iterable[Frame],
+    out_base: str,
+    config: Config,
+    nproc: int = 4,
+    mode: str = "sem_seg",
+    back_color: int = IGNORE_LABEL,
+    closed: bool = True,
+    backend: str = "native",
+    output: OutputOptions = OutputOptions(),
+) -> None:
+    """Converting segmentation poly2d to 1-channel masks."""
+    os.makedirs(out_base, exist_ok=True)
+
     logger.info("Start Conversion for Seg to Masks")
-    frames_to_masks(
+    stream_frames_to_masks(
         nproc,
-        out_paths,
-        shapes,
-        colors_list,
-        poly2ds_list,
-        with_instances=False,
-        back_color=back_color,
-        closed=closed,
+        seg_to_mask_tasks(frames, out_base, config, mode),
+        MaskOptions(False, back_color, closed, backend),
+        manifest=Manifest(out_base, output.force),
+        archive=get_archive(out_base, output.mask_format),
+        output=output,
     )
 
 
-ToMasksFunc = Callable[[List[Frame], str, Config, int], None]
+class ToMasksFunc(Protocol):
+    """Conversion of the frames of a task to masks/bitmasks."""
+
+    def __call__(
+        self,
+        frames: Iterable[Frame],
+        out_base: str,
+        config: Config,
+        nproc: int = 4,
+        backend: str = "native",
+        output: OutputOptions = OutputOptions(),
+    ) -> None:
+        """Convert the frames and save the masks in `out_base`."""
+
+
 semseg_to_masks: ToMasksFunc = partial(
     seg_to_masks, mode="sem_seg", back_color=IGNORE_LABEL, closed=True
 )
@@ -265,53 +626,28 @@ lanemark_to_masks: ToMasksFunc = partial(
 )
 
 
-def insseg_to_bitmasks(
-    frames: List[Frame],
-    out_base: str,
-    config: Config,
-    nproc: int = 4,
-) -> None:
-    """Converting instance segmentation poly2d to bitmasks."""
-    os.makedirs(out_base, exist_ok=True)
-    img_shape = config.image_size
-
-    out_paths: List[str] = []
-    shapes: List[ImageSize] = []
-    colors_list: List[List[np.ndarray]] = []
-    poly2ds_list: List[List[List[Poly2D]]] = []
-
+def insseg_to_mask_tasks(
+    frames: Iterable[Frame], out_base: str, config: Config
+) -> Iterator[MaskTask]:
+    """Prepare the instance segmentation poly2ds of each frame."""
     categories = get_leaf_categories(config.categories)
     cat_name2id = {cat.name: i + 1 for i, cat in enumerate(categories)}
 
-    logger.info("Preparing annotations for InsSeg to Bitmasks")
-
-    for image_anns in tqdm(frames):
+    for image_anns in frames:
         ann_id = 0
 
         # Bitmask in .png format
         image_name = image_anns.name.replace(".jpg", ".png")
         image_name = os.path.split(image_name)[-1]
         out_path = os.path.join(out_base, image_name)
-        out_paths.append(out_path)
-
-        if img_shape is None:
-            if image_anns.size is not None:
-                img_shape = image_anns.size
-            else:
-                raise ValueError("Image shape not defined!")
-        shapes.append(img_shape)
+        img_shape = get_img_shape(image_anns, config.image_size)
 
         colors: List[np.ndarray] = []
         poly2ds: List[List[Poly2D]] = []
-        colors_list.append(colors)
-        poly2ds_list.append(poly2ds)
-
-        labels_ = image_anns.labels
-        if labels_ is None or len(labels_) == 0:
-            continue
 
+        labels_ = image_anns.labels or []
         # Scores higher, rendering later
-        if labels_[0].score is not None:
+        if len(labels_) > 0 and labels_[0].score is not None:
             labels_ = sorted(labels_, key=lambda label: float(label.score))
 
         for label in labels_:
@@ -326,35 +662,74 @@ def insseg_to_bitmasks(
             colors.append(color)
             poly2ds.append(label.poly2d)
 
-    logger.info("Start conversion for InsSeg to Bitmasks")
-    frames_to_masks(nproc, out_paths, shapes, colors_list, poly2ds_list)
+        yield out_path, img_shape, colors, poly2ds
 
 
-def segtrack_to_bitmasks(
-    frames: List[Frame],
+def insseg_to_bitmasks(
+    frames: Iterable[Frame],
     out_base: str,
     config: Config,
     nproc: int = 4,
+    backend: str = "native",
+    output: OutputOptions = OutputOptions(),
 ) -> None:
-    """Converting segmentation tracking poly2d to bitmasks."""
-    frames_list = group_and_sort(frames)
-    img_shape = config.image_size
+    """Converting instance segmentation poly2d to bitmasks."""
+    os.makedirs(out_base, exist_ok=True)
+
+    logger.info("Start conversion for InsSeg to Bitmasks")
+    stream_frames_to_masks(
+        nproc,
+        insseg_to_mask_tasks(frames, out_base, config),
+        MaskOptions(backend=backend),
+        manifest=Manifest(out_base, output.force),
+        archive=get_archive(out_base, output.mask_format),
+        output=output,
+    )
 
-    out_paths: List[str] = []
-    shapes: List[ImageSize] = []
-    colors_list: List[List[np.ndarray]] = []
-    poly2ds_list: List[List[List[Poly2D]]] = []
 
+def group_frames_by_video(frames: Iterable[Frame]) -> Iterator[List[Frame]]:
+    """Group the frames by video lazily and sort them.
+
+    Lists of frames are grouped as a whole. Otherwise, the frames of a video
+    are expected to be contiguous, as in the per-video label files of
+    BDD100K. If a video is seen again after other videos, the remaining
+    frames are buffered and grouped as a whole.
+    """
+    if isinstance(frames, list):
+        yield from group_and_sort(frames)
+        return
+    seen_videos: Set[str] = set()
+    groups = groupby(frames, lambda frame: frame.video_name)
+    for video_name, video_anns in groups:
+        if video_name in seen_videos:
+            logger.warning(
+                "Frames of video %s are not contiguous, buffering the "
+                "remaining frames",
+                video_name,
+            )
+            remaining = list(video_anns)
+            for _, other_anns in groups:
+                remaining.extend(other_anns)
+            yield from group_and_sort(remaining)
+            return
+        seen_videos.add(video_name)
+        yield sorted(video_anns, key=lambda frame: frame.frame_index)
+
+
+def segtrack_to_mask_tasks(
+    frames: Iterable[Frame], out_base: str, config: Config
+) -> Iterator[MaskTask]:
+    """Prepare the segmentation tracking poly2ds of each frame."""
     categories = get_leaf_categories(config.categories)
     cat_name2id = {cat.name: i + 1 for i, cat in enumerate(categories)}
 
-    logger.info("Preparing annotations for SegTrack to Bitmasks")
-
-    for video_anns in tqdm(frames_list):
-        global_instance_id: int = 1
-        instance_id_maps: Dict[str, int] = dict()
-
+    # the instance ids of a video split in several groups stay consistent
+    video_instance_ids: Dict[str, Tuple[Dict[str, int], int]] = {}
+    for video_anns in group_frames_by_video(frames):
         video_name = video_anns[0].video_name
+        instance_id_maps, global_instance_id = video_instance_ids.get(
+            video_name, ({}, 1)
+        )
         out_dir = os.path.join(out_base, video_name)
         if not os.path.isdir(out_dir):
             os.makedirs(out_dir)
@@ -364,26 +739,14 @@ def segtrack_to_bitmasks(
             image_name = image_anns.name.replace(".jpg", ".png")
             image_name = os.path.split(image_name)[-1]
             out_path = os.path.join(out_dir, image_name)
-            out_paths.append(out_path)
-
-            if img_shape is None:
-                if image_anns.size is not None:
-                    img_shape = image_anns.size
-                else:
-                    raise ValueError("Image shape not defined!")
-            shapes.append(img_shape)
+            img_shape = get_img_shape(image_anns, config.image_size)
 
             colors: List[np.ndarray] = []
             poly2ds: List[List[Poly2D]] = []
-            colors_list.append(colors)
-            poly2ds_list.append(poly2ds)
-
-            labels_ = image_anns.labels
-            if labels_ is None or len(labels_) == 0:
-                continue
 
+            labels_ = image_anns.labels or []
             # Scores higher, rendering later
-            if labels_[0].score is not None:
+            if len(labels_) > 0 and labels_[0].score is not None:
                 labels_ = sorted(labels_, key=lambda label: float(label.score))
 
             for label in labels_:
@@ -400,43 +763,269 @@ def segtrack_to_bitmasks(
                 colors.append(color)
                 poly2ds.append(label.poly2d)
 
+            yield out_path, img_shape, colors, poly2ds
+        video_instance_ids[video_name] = (instance_id_maps, global_instance_id)
+
+
+def segtrack_to_bitmasks(
+    frames: Iterable[Frame],
+    out_base: str,
+    config: Config,
+    nproc: int = 4,
+    backend: str = "native",
+    output: OutputOptions = OutputOptions(),
+) -> None:
+    """Converting segmentation tracking poly2d to bitmasks."""
     logger.info("Start Conversion for SegTrack to Bitmasks")
-    frames_to_masks(nproc, out_paths, shapes, colors_list, poly2ds_list)
+    stream_frames_to_masks(
+        nproc,
+        segtrack_to_mask_tasks(frames, out_base, config),
+        MaskOptions(backend=backend),
+        manifest=Manifest(out_base, output.force),
+        archive=get_archive(out_base, output.mask_format),
+        output=output,
+    )
 
 
-def main() -> None:
-    """Main function."""
-    args = parse_args()
-    assert args.mode in [
-        "sem_seg",
-        "drivable",
-        "lane_mark",
-        "ins_seg",
-        "seg_track",
+def mode_to_mask_target(
+    frames: Iterable[Frame],
+    mode: str,
+    out_base: str,
+    config: Config,
+    backend: str = "native",
+    output: OutputOptions = OutputOptions(),
+) -> MaskTarget:
+    """Prepare the conversion of the frames of a mode to `out_base`."""
+    assert mode in MODES
+    tasks: Iterable[MaskTask]
+    if mode == "ins_seg":
+        tasks = insseg_to_mask_tasks(frames, out_base, config)
+        options = MaskOptions(with_instances=True, backend=backend)
+    elif mode == "seg_track":
+        tasks = segtrack_to_mask_tasks(frames, out_base, config)
+        options = MaskOptions(with_instances=True, backend=backend)
+    else:
+        tasks = seg_to_mask_tasks(frames, out_base, config, mode)
+        options = MaskOptions(
+            with_instances=False,
+            back_color=(
+                len(drivables) - 1 if mode == "drivable" else IGNORE_LABEL
+            ),
+            closed=mode != "lane_mark",
+            backend=backend,
+        )
+    if mode != "seg_track":
+        os.makedirs(out_base, exist_ok=True)
+    return (
+        tasks,
+        options,
+        Manifest(out_base, output.force),
+        get_archive(out_base, output.mask_format),
+    )
+
+
+def targets_to_masks(
+    frames: Iterable[Frame],
+    targets: List[Tuple[str, str]],
+    config: Config,
+    nproc: int = 4,
+    backend: str = "native",
+    output: OutputOptions = OutputOptions(),
+) -> None:
+    """Converting poly2d to the masks/bitmasks of several modes in one pass.
+
+    Each target is a pair of conversion mode and output folder. The frames
+    are iterated once and shared by all the targets, and the masks of a
+    frame are rendered by the same worker.
+    """
+    assert len(targets) > 0
+    if isinstance(frames, list):
+        frames_list: List[Iterable[Frame]] = [frames] * len(targets)
+    else:
+        frames_list = list(tee(frames, len(targets)))
+
+    mask_targets = [
+        mode_to_mask_target(frames_, mode, out_base, config, backend, output)
+        for frames_, (mode, out_base) in zip(frames_list, targets)
     ]
-    os.environ["QT_QPA_PLATFORM"] = "offscreen"  # matplotlib offscreen render
-
-    convert_funcs: Dict[str, ToMasksFunc] = dict(
-        sem_seg=semseg_to_masks,
-        drivable=drivable_to_masks,
-        lane_mark=lanemark_to_masks,
-        ins_seg=insseg_to_bitmasks,
-        seg_track=segtrack_to_bitmasks,
+    logger.info(
+        "Start conversion for %s", ", ".join(mode for mode, _ in targets)
     )
+    stream_targets_to_masks(nproc, mask_targets, output)
+
+
+def drop_categories(
+    frames: Iterable[Frame], categories: Set[str]
+) -> Iterator[Frame]:
+    """Remove the labels of the given categories from the frames."""
+    for image_anns in frames:
+        if image_anns.labels is not None:
+            image_anns.labels = [
+                label
+                for label in image_anns.labels
+                if label.category not in categories
+            ]
+        yield image_anns
+
+
+def unknown_categories(
+    bdd100k_config: BDD100KConfig, categories: Set[str]
+) -> Set[str]:
+    """Get the categories that the config can not convert."""
+    known = {
+        cat.name
+        for cat in get_leaf_categories(bdd100k_config.config.categories)
+    }
+    for mapping in [
+        bdd100k_config.name_mapping,
+        bdd100k_config.ignore_mapping,
+    ]:
+        if mapping is not None:
+            known.update(mapping)
+    return categories - known
+
+
+def bdd100k_targets_to_masks(
+    frames: Iterable[Frame],
+    targets: List[Tuple[str, str]],
+    bdd100k_configs: List[BDD100KConfig],
+    nproc: int = 4,
+    backend: str = "native",
+    output: OutputOptions = OutputOptions(),
+) -> None:
+    """Converting BDD100K labels to the masks of several modes in one pass.
+
+    Each target is converted with its own config. The frames of the
+    instance modes are converted to the categories of their config, once
+    for the targets sharing a config, on copies if the frames are shared
+    with other targets. The segmentation modes render the BDD100K
+    categories, so they take the frames as they are, and the labels of
+    their categories unknown to the config of an instance mode are removed
+    from the frames of that mode.
+    """
+    assert len(targets) == len(bdd100k_configs) > 0
+    seg_categories = {
+        cat.name
+        for mode, _ in targets
+        if mode not in INSTANCE_MODES
+        for cat in SEG_CATEGORIES[mode]
+    }
+    keys = [
+        id(bdd100k_config) if mode in INSTANCE_MODES else None
+        for (mode, _), bdd100k_config in zip(targets, bdd100k_configs)
+    ]
+    unique_keys = list(dict.fromkeys(keys))
+    # the lists of frames stay lists, so the videos are grouped as a whole
+    is_list = isinstance(frames, list)
+    frames_list: List[Iterable[Frame]] = (
+        [frames] * len(unique_keys)
+        if is_list
+        else list(tee(frames, len(unique_keys)))
+    )
+    converted: Dict[Optional[int], Iterable[Frame]] = {}
+    for key, frames_ in zip(unique_keys, frames_list):
+        if key is None:
+            converted[key] = frames_
+            continue
+        if len(unique_keys) > 1:
+            frames_ = map(copy.deepcopy, frames_)
+        bdd100k_config = bdd100k_configs[keys.index(key)]
+        frames_ = drop_categories(
+            frames_, unknown_categories(bdd100k_config, seg_categories)
+        )
+        frames_ = bdd100k_to_scalabel_iter(frames_, bdd100k_config)
+        converted[key] = list(frames_) if is_list else frames_
+    branches = {
+        key: iter(
+            [converted[key]] * keys.count(key)
+            if is_list
+            else tee(converted[key], keys.count(key))
+        )
+        for key in unique_keys
+    }
+
+    mask_targets = [
+        mode_to_mask_target(
+            next(branches[key]),
+            mode,
+            out_base,
+            bdd100k_config.config,
+            backend,
+            output,
+        )
+        for key, (mode, out_base), bdd100k_config in zip(
+            keys, targets, bdd100k_configs
+        )
+    ]
+    logger.info(
+        "Start conversion for %s", ", ".join(mode for mode, _ in targets)
+    )
+    stream_targets_to_masks(nproc, mask_targets, output)
+
+
+def load_datasets(inputs: str, nproc: int = 4) -> Iterator[Dataset]:
+    """Load the label files one by one.
 
-    dataset = load(args.input, args.nproc)
+    A directory of label files is loaded lazily, so only one file is kept
+    in memory at a time.
+    """
+    if not os.path.isdir(inputs):
+        yield load(inputs, nproc)
+        return
+    for file_ in list_files(inputs, ".json", with_prefix=True):
+        yield load(file_)
+
+
+def main() -> None:
+    """Main function."""
+    args = parse_args()
+    assert len(args.mode) == len(
+        args.output
+    ), "each conversion mode needs an output folder"
+    if args.backend == "matplotlib":
+        # matplotlib offscreen render
+        os.environ["QT_QPA_PLATFORM"] = "offscreen"
+
+    datasets = load_datasets(args.input, args.nproc)
+    dataset = next(datasets)
+    default_config: Optional[BDD100KConfig] = None
     if args.config is not None:
-        bdd100k_config = load_bdd100k_config(args.config)
+        default_config = load_bdd100k_config(args.config)
     elif dataset.config is not None:
-        bdd100k_config = BDD100KConfig(config=dataset.config)
-    if bdd100k_config is None:
-        bdd100k_config = load_bdd100k_config(args.mode)
-
-    convert_funcs[args.mode](
-        bdd100k_to_scalabel(dataset.frames, bdd100k_config),
-        args.output,
-        bdd100k_config.config,
+        default_config = BDD100KConfig(config=dataset.config)
+    # the segmentation modes only take the image size of their config
+    cfg_names = [
+        mode if mode in INSTANCE_MODES else "sem_seg" for mode in args.mode
+    ]
+    bdd100k_configs: Dict[str, BDD100KConfig] = {}
+    for cfg_name in cfg_names:
+        if cfg_name not in bdd100k_configs:
+            bdd100k_configs[cfg_name] = (
+                default_config
+                if default_config is not None
+                else load_bdd100k_config(cfg_name)
+            )
+            set_ignore_args(bdd100k_configs[cfg_name], args)
+
+    frames: Iterable[Frame] = dataset.frames
+    if os.path.isdir(args.input):
+        frames = chain(
+            frames,
+            chain.from_iterable(dataset.frames for dataset in datasets),
+        )
+    bdd100k_targets_to_masks(
+        frames,
+        list(zip(args.mode, args.output)),
+        [bdd100k_configs[cfg_name] for cfg_name in cfg_names],
         args.nproc,
+        backend=args.backend,
+        output=OutputOptions(
+            max_inflight=args.max_inflight,
+            force=args.force,
+            mask_format=args.format,
+            compress_level=args.compress_level,
+            shard_size=args.shard_size,
+        ),
     )
 
     logger.info("Finished!")
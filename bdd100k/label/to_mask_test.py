@@ -1,20 +1,32 @@
 """Test cases for to_bitmasks.py."""
+import copy
 import os
 import shutil
+import time
 import unittest
-from typing import Callable, List
+from typing import Dict, List
 
 import numpy as np
 from PIL import Image
 from scalabel.label.io import load
-from scalabel.label.typing import Config, Frame, Label
+from scalabel.label.typing import Frame, ImageSize, Label, Poly2D
 
 from ..common.utils import load_bdd100k_config
+from .manifest import Manifest
 from .to_mask import (
+    MaskOptions,
+    OutputOptions,
+    ToMasksFunc,
+    bdd100k_targets_to_masks,
+    colorize_index_map,
+    frame_to_mask,
+    group_frames_by_video,
     insseg_to_bitmasks,
     segtrack_to_bitmasks,
     semseg_to_masks,
     set_instance_color,
+    stream_frames_to_masks,
+    targets_to_masks,
 )
 
 
@@ -31,6 +43,137 @@ class TestUtilFunctions(unittest.TestCase):
         gt_color = np.array([15, 8, 1, 44])
         self.assertTrue((color == gt_color).all())
 
+    def test_colorize_index_map(self) -> None:
+        """Check the index map is mapped to the instance colors."""
+        index_map = np.array([[0, 1], [2, 1]], dtype=np.int32)
+        colors = [
+            np.array([1, 0, 0, 1], dtype=np.uint8),
+            np.array([3, 4, 0, 2], dtype=np.uint8),
+        ]
+        img = colorize_index_map(index_map, colors, 4)
+        self.assertEqual(img.shape, (2, 2, 4))
+        self.assertTrue((img[0, 0] == 0).all())
+        self.assertTrue((img[0, 1] == colors[0]).all())
+        self.assertTrue((img[1, 0] == colors[1]).all())
+
+        img = colorize_index_map(
+            np.minimum(index_map, 1), [np.array([7])], 1, 255
+        )
+        self.assertTrue((img[..., 0] == [[255, 7], [7, 7]]).all())
+
+    def test_group_frames_by_video(self) -> None:
+        """Check the videos are grouped lazily unless seen again."""
+        frames = [
+            Frame(name="{}.jpg".format(i), videoName=video, frameIndex=i)
+            for i, video in enumerate(["a", "a", "b", "a", "c"])
+        ]
+        groups = group_frames_by_video(iter(frames[:3]))
+        self.assertEqual([len(group) for group in groups], [2, 1])
+        groups = list(group_frames_by_video(iter(frames)))
+        self.assertEqual(
+            [(group[0].video_name, len(group)) for group in groups],
+            [("a", 2), ("b", 1), ("a", 1), ("c", 1)],
+        )
+        groups = list(group_frames_by_video(frames))
+        self.assertEqual(
+            [(group[0].video_name, len(group)) for group in groups],
+            [("a", 3), ("b", 1), ("c", 1)],
+        )
+
+    def test_empty_frame(self) -> None:
+        """Check the empty frames are filled with the background."""
+        out_path = "./test_empty_mask.png"
+        frame_to_mask(
+            out_path,
+            ImageSize(height=4, width=5),
+            [],
+            [],
+            with_instances=False,
+            back_color=255,
+        )
+        mask = np.asarray(Image.open(out_path))
+        os.remove(out_path)
+        self.assertEqual(mask.shape, (4, 5))
+        self.assertTrue((mask == 255).all())
+
+    def test_stream_frames_to_masks(self) -> None:
+        """Check all the frames are converted with a small in-flight limit."""
+        out_dir = "./test_stream_masks"
+        os.makedirs(out_dir, exist_ok=True)
+        poly2d = Poly2D(
+            vertices=[[1, 1], [4, 1], [4, 3], [1, 3]],
+            types="LLLL",
+            closed=True,
+        )
+        tasks = (
+            (
+                os.path.join(out_dir, "{}.png".format(i)),
+                ImageSize(height=4, width=5),
+                [np.array([i])],
+                [[poly2d]],
+            )
+            for i in range(7)
+        )
+        stream_frames_to_masks(
+            2,
+            tasks,
+            MaskOptions(with_instances=False, back_color=255),
+            output=OutputOptions(max_inflight=3),
+        )
+        for i in range(7):
+            mask = np.asarray(
+                Image.open(os.path.join(out_dir, "{}.png".format(i)))
+            )
+            self.assertEqual(mask[2, 2], i)
+            self.assertEqual(mask[0, 0], 255)
+        shutil.rmtree(out_dir)
+
+    def test_incremental_conversion(self) -> None:
+        """Check only the changed or missing masks are converted again."""
+        out_dir = "./test_incremental_masks"
+        poly2d = Poly2D(
+            vertices=[[1, 1], [4, 1], [4, 3], [1, 3]],
+            types="LLLL",
+            closed=True,
+        )
+        out_paths = [
+            os.path.join(out_dir, "{}.png".format(i)) for i in range(3)
+        ]
+
+        def convert(values: List[int]) -> Dict[str, float]:
+            tasks = [
+                (
+                    out_path,
+                    ImageSize(height=4, width=5),
+                    [np.array([v])],
+                    [[poly2d]],
+                )
+                for out_path, v in zip(out_paths, values)
+            ]
+            stream_frames_to_masks(
+                1,
+                tasks,
+                MaskOptions(with_instances=False),
+                manifest=Manifest(out_dir),
+            )
+            return {
+                out_path: os.stat(out_path).st_mtime_ns
+                for out_path in out_paths
+                if os.path.exists(out_path)
+            }
+
+        os.makedirs(out_dir, exist_ok=True)
+        mtimes = convert([0, 1, 2])
+        os.remove(out_paths[2])
+        time.sleep(0.01)
+        new_mtimes = convert([0, 5, 2])
+        self.assertEqual(mtimes[out_paths[0]], new_mtimes[out_paths[0]])
+        self.assertNotEqual(mtimes[out_paths[1]], new_mtimes[out_paths[1]])
+        self.assertIn(out_paths[2], new_mtimes)
+        mask = np.asarray(Image.open(out_paths[1]))
+        self.assertEqual(mask[2, 2], 5)
+        shutil.rmtree(out_dir)
+
 
 class TestToMasks(unittest.TestCase):
     """Test cases for converting BDD100K labels to masks/bitmasks."""
@@ -42,15 +185,23 @@ class TestToMasks(unittest.TestCase):
         task_name: str,
         file_name: str,
         output_name: str,
-        convert_func: Callable[[List[Frame], str, Config, int], None],
+        convert_func: ToMasksFunc,
+        backend: str = "matplotlib",
+        max_diff: int = 0,
     ) -> None:
-        """General test function for different tasks."""
+        """General test function for different tasks.
+
+        The masks are compared with references rendered by matplotlib, so
+        other backends are allowed to differ on `max_diff` boundary pixels.
+        """
         cur_dir = os.path.dirname(os.path.abspath(__file__))
 
         dataset = load("{}/testcases/example_annotation.json".format(cur_dir))
         frames = dataset.frames
         bdd100k_config = load_bdd100k_config(task_name)
-        convert_func(frames, self.test_out, bdd100k_config.config, 1)
+        convert_func(
+            frames, self.test_out, bdd100k_config.config, 1, backend=backend
+        )
         output_path = os.path.join(self.test_out, output_name)
         mask = np.asarray(Image.open(output_path))
 
@@ -58,7 +209,8 @@ class TestToMasks(unittest.TestCase):
             Image.open("{}/testcases/{}".format(cur_dir, file_name))
         )
 
-        self.assertTrue((mask == gt_mask).all())
+        diff = (mask != gt_mask).reshape(mask.shape[0], mask.shape[1], -1)
+        self.assertLessEqual(np.count_nonzero(diff.any(axis=2)), max_diff)
 
     def test_semseg_to_masks(self) -> None:
         """Test case for semantic segmentation to bitmasks."""
@@ -87,6 +239,100 @@ class TestToMasks(unittest.TestCase):
             segtrack_to_bitmasks,
         )
 
+    def test_native_backend(self) -> None:
+        """Check the native backend against the matplotlib references."""
+        self.task_specific_test(
+            "sem_seg",
+            "semseg_mask.png",
+            "b1c81faa-3df17267-0000001.png",
+            semseg_to_masks,
+            backend="native",
+            max_diff=30,
+        )
+        self.task_specific_test(
+            "ins_seg",
+            "bitmasks/quasi-video/insseg_bitmask.png",
+            "b1c81faa-3df17267-0000001.png",
+            insseg_to_bitmasks,
+            backend="native",
+            max_diff=30,
+        )
+
+    def test_targets_to_masks(self) -> None:
+        """Check several modes are converted in one pass."""
+        cur_dir = os.path.dirname(os.path.abspath(__file__))
+        dataset = load("{}/testcases/example_annotation.json".format(cur_dir))
+        bdd100k_config = load_bdd100k_config("ins_seg")
+        semseg_out = os.path.join(self.test_out, "sem_seg")
+        insseg_out = os.path.join(self.test_out, "ins_seg")
+        targets_to_masks(
+            iter(dataset.frames),
+            [("sem_seg", semseg_out), ("ins_seg", insseg_out)],
+            bdd100k_config.config,
+            1,
+            backend="matplotlib",
+        )
+        for out_dir, file_name in [
+            (semseg_out, "semseg_mask.png"),
+            (insseg_out, "bitmasks/quasi-video/insseg_bitmask.png"),
+        ]:
+            mask = np.asarray(
+                Image.open(
+                    os.path.join(out_dir, "b1c81faa-3df17267-0000001.png")
+                )
+            )
+            gt_mask = np.asarray(
+                Image.open("{}/testcases/{}".format(cur_dir, file_name))
+            )
+            self.assertTrue((mask == gt_mask).all())
+
+    def test_bdd100k_targets_to_masks(self) -> None:
+        """Check each mode converts the labels with its own config."""
+        cur_dir = os.path.dirname(os.path.abspath(__file__))
+        dataset = load("{}/testcases/example_annotation.json".format(cur_dir))
+        frames = dataset.frames
+        assert frames[0].labels is not None
+        road = copy.deepcopy(frames[0].labels[0])
+        road.id, road.category = "road", "road"
+        frames[0].labels.insert(0, road)
+        semseg_config = load_bdd100k_config("sem_seg")
+        semseg_out = os.path.join(self.test_out, "sem_seg_ref")
+        semseg_to_masks(
+            copy.deepcopy(frames),
+            semseg_out,
+            semseg_config.config,
+            1,
+            backend="matplotlib",
+        )
+
+        targets = [
+            ("sem_seg", os.path.join(self.test_out, "sem_seg_mixed")),
+            ("ins_seg", os.path.join(self.test_out, "ins_seg_mixed")),
+        ]
+        bdd100k_targets_to_masks(
+            iter(frames),
+            targets,
+            [semseg_config, load_bdd100k_config("ins_seg")],
+            1,
+            backend="matplotlib",
+        )
+        for (_, out_dir), gt_path in zip(
+            targets,
+            [
+                os.path.join(semseg_out, "b1c81faa-3df17267-0000001.png"),
+                "{}/testcases/bitmasks/quasi-video/insseg_bitmask.png".format(
+                    cur_dir
+                ),
+            ],
+        ):
+            mask = np.asarray(
+                Image.open(
+                    os.path.join(out_dir, "b1c81faa-3df17267-0000001.png")
+                )
+            )
+            gt_mask = np.asarray(Image.open(gt_path))
+            self.assertTrue((mask == gt_mask).all())
+
     @classmethod
     def tearDownClass(cls) -> None:
         """Class teardown for bitmask tests."""
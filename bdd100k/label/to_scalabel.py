@@ -1,6 +1,6 @@
 """Convert BDD100K to Scalabel format."""
 
-from typing import Dict, List, Optional
+from typing import Dict, Iterable, Iterator, List, Optional
 
 from scalabel.label.typing import Frame, Label
 from scalabel.label.utils import get_leaf_categories
@@ -44,18 +44,26 @@ def deal_bdd100k_category(
     return result
 
 
-def bdd100k_to_scalabel(
-    frames: List[Frame], bdd100k_config: BDD100KConfig
-) -> List[Frame]:
-    """Converting BDD100K to Scalabel format."""
+def bdd100k_to_scalabel_iter(
+    frames: Iterable[Frame], bdd100k_config: BDD100KConfig
+) -> Iterator[Frame]:
+    """Converting BDD100K to Scalabel format frame by frame."""
     categories = get_leaf_categories(bdd100k_config.config.categories)
     cat_name2id = {cat.name: i + 1 for i, cat in enumerate(categories)}
-    for image_anns in tqdm(frames):
+    for image_anns in frames:
         for i in reversed(range(len(image_anns.labels))):
             label = deal_bdd100k_category(
                 image_anns.labels[i], bdd100k_config, cat_name2id
             )
             if label is None:
                 image_anns.labels.pop(i)
+        yield image_anns
+
 
+def bdd100k_to_scalabel(
+    frames: List[Frame], bdd100k_config: BDD100KConfig
+) -> List[Frame]:
+    """Converting BDD100K to Scalabel format."""
+    for _ in bdd100k_to_scalabel_iter(tqdm(frames), bdd100k_config):
+        pass
     return frames
@@ -30,13 +30,13 @@ setuptools.setup(
         "gmplot",
         "joblib",
         "matplotlib",
-        "motmetrics",
         "numpy==1.19.5",
         "pandas",
         "pillow",
         "pycocotools",
         "scalabel @ git+https://github.com/scalabel/scalabel",
         "scikit-image",
+        "scipy",
         "toml",
         "tqdm",
         "tabulate",